@@ -0,0 +1,227 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from instrumentation import Counter, Gauge
+
+MAX_ACTIVE_WORKFLOWS = int(os.getenv("RCSA_MAX_ACTIVE_WORKFLOWS", "16"))
+MAX_ACTIVE_PER_USER = int(os.getenv("RCSA_MAX_ACTIVE_PER_USER", "4"))
+# Beyond these queue sizes new workflows are rejected with 429
+MAX_QUEUED_WORKFLOWS = int(os.getenv("RCSA_MAX_QUEUED_WORKFLOWS", "200"))
+MAX_QUEUED_PER_USER = int(os.getenv("RCSA_MAX_QUEUED_PER_USER", "20"))
+
+WORKFLOWS_ACTIVE = Gauge("rcsa_workflows_active", "Workflows currently running")
+WORKFLOWS_QUEUED = Gauge("rcsa_workflows_queued", "Workflows waiting for a run slot")
+WORKFLOW_ADMISSIONS = Counter("rcsa_workflow_admissions_total", "Workflow start requests by outcome", ("outcome",))
+QUEUE_WAIT = Counter("rcsa_workflow_queue_wait_seconds_total", "Total time workflows spent queued")
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class WorkflowRun:
+    run_id: str
+    user: str
+    factory: Callable[[], Awaitable[Any]]
+    state: str = "queued"  # queued, running, completed, failed, cancelled
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    task: Optional[asyncio.Task] = None
+    # Resolved with the final state once the run finishes or is cancelled from the queue
+    done: Optional[asyncio.Future] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "run_id": self.run_id,
+            "user": self.user,
+            "state": self.state,
+            "queued_seconds": round((self.started_at or now) - self.enqueued_at, 3),
+            "running_seconds": round(now - self.started_at, 3) if self.started_at else None,
+        }
+
+
+class WorkflowRegistry:
+    """
+    Tracks workflow runs and admits them under a global and a per-user concurrency limit.
+    Runs that cannot start yet wait in per-user FIFO queues served round-robin, so one
+    user's burst cannot starve everyone else. When the queues are full, `submit` raises
+    AdmissionRejected with a Retry-After estimate.
+    """
+
+    def __init__(self, max_active: int = MAX_ACTIVE_WORKFLOWS, max_per_user: int = MAX_ACTIVE_PER_USER,
+                 max_queued: int = MAX_QUEUED_WORKFLOWS, max_queued_per_user: int = MAX_QUEUED_PER_USER):
+        self.max_active = max_active
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.runs: Dict[str, WorkflowRun] = {}
+        self._queues: "OrderedDict[str, Deque[WorkflowRun]]" = OrderedDict()
+        self._active_by_user: Dict[str, int] = {}
+        self._active = 0
+        self._queued = 0
+        # Moving average of run durations, used for Retry-After and queue wait estimates
+        self._avg_duration = 30.0
+        self.totals = {"admitted": 0, "queued": 0, "rejected": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    # --- Admission ---
+    def submit(self, run_id: str, user: str, factory: Callable[[], Awaitable[Any]]) -> WorkflowRun:
+        """
+        Start `factory()` now if limits allow, otherwise queue it. Must be called from the event loop.
+        """
+        if run_id in self.runs:
+            raise AdmissionRejected(f"workflow {run_id} is already {self.runs[run_id].state}", 1)
+        run = WorkflowRun(run_id=run_id, user=user, factory=factory,
+                          done=asyncio.get_running_loop().create_future())
+        if self._can_start(user) and self._queued == 0:
+            self.runs[run_id] = run
+            self._start(run)
+            self._outcome("admitted")
+            return run
+        self.check(user)
+        self.runs[run_id] = run
+        self._queues.setdefault(user, deque()).append(run)
+        self._queued += 1
+        self._dispatch()
+        self._outcome("admitted" if run.state == "running" else "queued")
+        self._update_gauges()
+        return run
+
+    def check(self, user: str):
+        """
+        Raise AdmissionRejected if a new workflow from `user` could neither start nor queue.
+        """
+        if self._can_start(user) and self._queued == 0:
+            return
+        user_queue = self._queues.get(user)
+        if self._queued >= self.max_queued or (user_queue and len(user_queue) >= self.max_queued_per_user):
+            self._outcome("rejected")
+            raise AdmissionRejected("too many queued workflows", self.retry_after(user))
+
+    def _can_start(self, user: str) -> bool:
+        return self._active < self.max_active and self._active_by_user.get(user, 0) < self.max_per_user
+
+    def _start(self, run: WorkflowRun):
+        run.state = "running"
+        run.started_at = time.monotonic()
+        QUEUE_WAIT.inc(run.started_at - run.enqueued_at)
+        self._active += 1
+        self._active_by_user[run.user] = self._active_by_user.get(run.user, 0) + 1
+        run.task = asyncio.create_task(run.factory())
+        # A done callback also fires for tasks cancelled before they got to run
+        run.task.add_done_callback(lambda task: self._finished(run, task))
+        self._update_gauges()
+
+    def _finished(self, run: WorkflowRun, task: asyncio.Task):
+        if task.cancelled():
+            run.state = "cancelled"
+        elif task.exception() is not None:
+            print(f"Workflow {run.run_id} failed: {task.exception()}")
+            run.state = "failed"
+        else:
+            run.state = "completed"
+        duration = time.monotonic() - run.started_at
+        self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+        self._active -= 1
+        self._active_by_user[run.user] -= 1
+        if not self._active_by_user[run.user]:
+            del self._active_by_user[run.user]
+        self.totals[run.state] += 1
+        self.runs.pop(run.run_id, None)
+        run.done.set_result(run.state)
+        self._dispatch()
+        self._update_gauges()
+
+    def _dispatch(self):
+        """
+        Start queued runs round-robin across users while slots are free.
+        """
+        while self._queued and self._active < self.max_active:
+            started = False
+            for user in list(self._queues):
+                if self._active >= self.max_active:
+                    break
+                if not self._can_start(user):
+                    continue
+                run = self._queues[user].popleft()
+                self._queued -= 1
+                if not self._queues[user]:
+                    del self._queues[user]
+                else:
+                    # Rotate this user to the back so others go first next time
+                    self._queues.move_to_end(user)
+                self._start(run)
+                started = True
+                break
+            if not started:
+                return
+
+    # --- Cancellation ---
+    def cancel(self, run_id: str) -> Optional[str]:
+        """
+        Cancel a queued or running workflow. Returns the state it was in, or None if it is
+        not queued or running.
+        """
+        run = self.runs.get(run_id)
+        if run is None:
+            return None
+        previous = run.state
+        if run.state == "queued":
+            self._queues[run.user].remove(run)
+            if not self._queues[run.user]:
+                del self._queues[run.user]
+            self._queued -= 1
+            run.state = "cancelled"
+            self.totals["cancelled"] += 1
+            self.runs.pop(run_id, None)
+            run.done.set_result(run.state)
+            self._update_gauges()
+        elif run.state == "running" and run.task is not None:
+            run.task.cancel()
+        return previous
+
+    # --- Introspection ---
+    def queue_position(self, run_id: str) -> Optional[int]:
+        run = self.runs.get(run_id)
+        if run is None or run.state != "queued":
+            return None
+        return list(self._queues[run.user]).index(run) * len(self._queues) + 1
+
+    def retry_after(self, user: Optional[str] = None) -> int:
+        backlog = self._queued + 1
+        if user is not None:
+            backlog = max(backlog, len(self._queues.get(user, ())) * len(self._queues))
+        return max(1, int(self._avg_duration * backlog / max(1, self.max_active)))
+
+    def _outcome(self, outcome: str):
+        self.totals[outcome] += 1
+        WORKFLOW_ADMISSIONS.inc(outcome=outcome)
+
+    def _update_gauges(self):
+        WORKFLOWS_ACTIVE.set(self._active)
+        WORKFLOWS_QUEUED.set(self._queued)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limits": {
+                "max_active": self.max_active, "max_active_per_user": self.max_per_user,
+                "max_queued": self.max_queued, "max_queued_per_user": self.max_queued_per_user,
+            },
+            "active": self._active,
+            "queued": self._queued,
+            "active_by_user": dict(self._active_by_user),
+            "queued_by_user": {user: len(q) for user, q in self._queues.items()},
+            "avg_run_seconds": round(self._avg_duration, 3),
+            "totals": dict(self.totals),
+        }
+
+
+registry = WorkflowRegistry()
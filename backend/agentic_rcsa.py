@@ -1,15 +1,13 @@
 import asyncio
 import json
 import os
+import threading
 import uuid
-from dataclasses import dataclass, field
-from typing import Any, List, Dict
+from dataclasses import fields as dataclass_fields
+from typing import Any, List, Dict, Optional
 from typing_extensions import Any as AnyType
-from openai import AsyncAzureOpenAI
-from openai.types.chat import ChatCompletionMessageParam
 from agents import (
     Agent,
-    FunctionTool,
     RunContextWrapper,
     function_tool,
     ItemHelpers,
@@ -18,187 +16,96 @@ from agents import (
     trace,
     set_default_openai_client,
     set_tracing_disabled,
-    OpenAIChatCompletionsModel,
 )
-from dotenv import load_dotenv
-from datetime import datetime, timezone
+from model_routing import get_client, chat_completion
+from routed_model import get_model
+from schemas import STEP_OUTPUT_TYPES, STEP_JSON_SCHEMAS, LIST_STEPS
+from structured_output import parse_and_repair_step_output, repair_json
+from instrumentation import measure_step, instrumented_tool
+from hedging import DeadlineExceeded, with_step_deadline
+from budgets import BudgetExceeded, budget_degraded, track_usage
+from catalog_repo import CatalogRepository, CatalogSnapshot
+from dedup import reusable_step
+from workflow_store import (
+    WorkflowContext, save_context, load_context, find_context, restore_context,
+    OUTPUT_DIR, catalogs, precedents_for, workflow_search,
+)
 
-load_dotenv()
-azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT")
 # Disable tracing since we're using Azure OpenAI
 set_tracing_disabled(disabled=True)
 
-# Initialize OpenAI client
-openai_client = AsyncAzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-)
-
-# Set the default OpenAI client for the Agents SDK
-set_default_openai_client(openai_client)
-
-# --- Context Management Setup ---
-@dataclass
-class WorkflowContext:
-    project_description: str
-    # Submission draft data
-    draft_submission: Dict[str, Any] = field(default_factory=dict)
-    # Mapping of risks to categories/subrisks
-    risk_mapping: List[Dict[str, Any]] = field(default_factory=list)
-    # Controls mapped to each risk
-    controls_mapping: List[Dict[str, Any]] = field(default_factory=list)
-    # Proposed mitigation steps
-    mitigation_proposals: List[Dict[str, Any]] = field(default_factory=list)
-    # Flagged issues and deficiencies
-    issues_list: List[Dict[str, Any]] = field(default_factory=list)
-    # Final approval decision
-    decision_result: Dict[str, Any] = field(default_factory=dict)
-    # Guardrail violations per step
-    guardrail_violations: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
-    # Ordered UI updates (step, output)
-    ui_updates: List[Dict[str, Any]] = field(default_factory=list)
-    # New: Store feedback per step/label
-    feedbacks: Dict[str, Any] = field(default_factory=dict)
-    # New: Track workflow status and current step
-    status: str = "in_progress"  # in_progress, awaiting_feedback, completed
-    current_step: str = ""
-    # Add timestamps
-    createdAt: str = None
-    updatedAt: str = None
-
-    def __post_init__(self):
-        now = datetime.now(timezone.utc).isoformat()
-        if self.createdAt is None:
-            self.createdAt = now
-        if self.updatedAt is None:
-            self.updatedAt = now
-
-    def record_step(self, step: str, output: Any, feedback: Any = None):
-        if step == "generate_draft":
-            self.draft_submission = output
-        elif step == "map_risks":
-            self.risk_mapping = output
-        elif step == "map_controls":
-            self.controls_mapping = output
-        elif step == "generate_mitigations":
-            self.mitigation_proposals = output
-        elif step == "flag_issues":
-            self.issues_list = output
-        elif step == "evaluate_decision":
-            self.decision_result = output
-        self.ui_updates.append({"step": step, "output": output})
-        self.current_step = step
-        if feedback is not None:
-            self.feedbacks[step] = feedback
-        # If feedback is required, set status to awaiting_feedback
-        if feedback == "__AWAIT_FEEDBACK__":
-            self.status = "awaiting_feedback"
-        else:
-            self.status = "in_progress"
-        # Update updatedAt timestamp
-        self.updatedAt = datetime.now(timezone.utc).isoformat()
-
-    def record_guardrail(self, step: str, violations: List[Dict[str, Any]]):
-        self.guardrail_violations[step] = violations
-        self.ui_updates.append({"step": f"guard_{step}", "output": violations})
-        self.updatedAt = datetime.now(timezone.utc).isoformat()
-
-    def to_dict(self):
-        return {
-            "project_description": self.project_description,
-            "draft_submission": self.draft_submission,
-            "risk_mapping": self.risk_mapping,
-            "controls_mapping": self.controls_mapping,
-            "mitigation_proposals": self.mitigation_proposals,
-            "issues_list": self.issues_list,
-            "decision_result": self.decision_result,
-            "guardrail_violations": self.guardrail_violations,
-            "ui_updates": self.ui_updates,
-            "feedbacks": self.feedbacks,
-            "status": self.status,
-            "current_step": self.current_step,
-            "createdAt": self.createdAt,
-            "updatedAt": self.updatedAt,
-        }
-
-# Update save_context to always update updatedAt
-def save_context(context, path):
-    context.updatedAt = datetime.now(timezone.utc).isoformat()
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(context.to_dict(), f, indent=2)
+# Ask step agents for schema-constrained structured output (needs an API version with json_schema support)
+STRUCTURED_OUTPUTS = os.getenv("RCSA_STRUCTURED_OUTPUTS", "1") == "1"
 
-# Update load_context to ignore unknown fields
-from dataclasses import fields as dataclass_fields
+def _catalog(wrapper: RunContextWrapper[WorkflowContext], name: str) -> CatalogSnapshot:
+    """
+    The snapshot pinned by the running workflow, or the current one outside a workflow.
+    """
+    pinned = getattr(wrapper.context, "catalog_snapshot", None) if wrapper is not None else None
+    return pinned[name] if pinned else catalogs.get(name)
 
-def load_context(path):
-    with open(path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    # Only keep keys that are fields in WorkflowContext
-    allowed = {f.name for f in dataclass_fields(WorkflowContext)}
-    filtered = {k: v for k, v in data.items() if k in allowed}
-    return WorkflowContext(**filtered)
+def _build_guardrail_index(snapshot: CatalogSnapshot) -> Dict[str, str]:
+    """
+    Serialized guardrail rules per workflow step. Rules without applicableSteps apply to
+    every step; steps no rule names (such as the final QA review) are checked against all rules.
+    """
+    steps = {step for rule in snapshot.items for step in rule.get("applicableSteps") or []}
+    index = {
+        step: json.dumps([r for r in snapshot.items if not r.get("applicableSteps") or step in r["applicableSteps"]])
+        for step in steps
+    }
+    index["*"] = snapshot.text
+    return index
 
-# --- Load Data from JSON Files ---
-DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+def _guardrails_for_step(wrapper: RunContextWrapper[WorkflowContext], step: str) -> str:
+    index = _catalog(wrapper, "guardrails").derived("step_index", _build_guardrail_index)
+    return index.get(step, index["*"])
 
-with open(os.path.join(DATA_DIR, 'risks.json'), 'r', encoding='utf-8') as f:
-    RISK_CATALOG = json.load(f)
-with open(os.path.join(DATA_DIR, 'controls.json'), 'r', encoding='utf-8') as f:
-    CONTROLS_CATALOG = json.load(f)
-with open(os.path.join(DATA_DIR, 'guardrails.json'), 'r', encoding='utf-8') as f:
-    GUARDRAIL_RULES = json.load(f)
-with open(os.path.join(DATA_DIR, 'sample_submissions.json'), 'r', encoding='utf-8') as f:
-    SAMPLE_SUBMISSIONS = json.load(f)
+async def _precedents(wrapper: RunContextWrapper[WorkflowContext]):
+    """
+    Precedents for the running workflow: its pinned sample submissions plus approved
+    workflows, which join when the workflow index first loads output/.
+    """
+    if not workflow_search.loaded:
+        await asyncio.to_thread(workflow_search.load)
+    return precedents_for(_catalog(wrapper, "samples"))
 
 # --- Implemented FunctionTools ---
 @function_tool
+@instrumented_tool
 async def fetch_risk_catalog(wrapper: RunContextWrapper[WorkflowContext]) -> str:
-    return json.dumps(RISK_CATALOG)
+    return _catalog(wrapper, "risks").text
 
 @function_tool
+@instrumented_tool
 async def fetch_controls_catalog(wrapper: RunContextWrapper[WorkflowContext]) -> str:
-    return json.dumps(CONTROLS_CATALOG)
+    return _catalog(wrapper, "controls").text
 
 @function_tool
+@instrumented_tool
 async def fetch_past_submissions(wrapper: RunContextWrapper[WorkflowContext], query: str) -> str:
-    # Return all submissions for agent-side filtering
-    return json.dumps(SAMPLE_SUBMISSIONS)
+    # Most relevant past submissions, including approved workflows
+    return json.dumps((await _precedents(wrapper)).find_submissions(query))
 
 @function_tool
+@instrumented_tool
 async def fetch_past_mitigations(wrapper: RunContextWrapper[WorkflowContext], risk: str) -> str:
-    # Return submissions with project_summary and mitigation entries
-    results = []
-    for sub in SAMPLE_SUBMISSIONS:
-        for m in sub.get("mitigation", []):
-            if m.get("risk") == risk:
-                results.append({
-                    "submissionId": sub["submissionId"],
-                    "project_summary": sub["draft"]["project_summary"],
-                    "control_id": m["control_id"],
-                    "mitigation_steps": m["mitigation_steps"]
-                })
-    return json.dumps(results)
+    # Return past mitigations for the closest matching risks, with their project_summary
+    return json.dumps((await _precedents(wrapper)).find_mitigations(risk))
 
 @function_tool
+@instrumented_tool
 async def fetch_past_issues(wrapper: RunContextWrapper[WorkflowContext], text: str) -> str:
-    # Return submissions with project_summary and issue entries
-    results = []
-    for sub in SAMPLE_SUBMISSIONS:
-        for issue in sub.get("issues", []):
-            if text.lower() in issue.get("issue", "").lower():
-                results.append({
-                    "submissionId": sub["submissionId"],
-                    "project_summary": sub["draft"]["project_summary"],
-                    **issue
-                })
-    return json.dumps(results)
+    # Return the past issues that best match the text, with their project_summary
+    return json.dumps((await _precedents(wrapper)).find_issues(text))
 
 @function_tool
+@instrumented_tool
 async def fetch_guardrail_rules(wrapper: RunContextWrapper[WorkflowContext]) -> str:
-    return json.dumps(GUARDRAIL_RULES)
+    return _catalog(wrapper, "guardrails").text
 
 @function_tool
+@instrumented_tool
 async def evaluate_guardrails(wrapper: RunContextWrapper[WorkflowContext], step: str, content: str) -> str:
     """
     Use AI to evaluate guardrail compliance for the given step and content.
@@ -206,217 +113,235 @@ async def evaluate_guardrails(wrapper: RunContextWrapper[WorkflowContext], step:
     """
     prompt = (
         f"You are a guardrail evaluator. The current workflow step is '{step}' and the content is: {content}. "
-        "Given these guardrail rules: {GUARDRAIL_RULES}, identify any rules violated. "
+        f"Given these guardrail rules: {_guardrails_for_step(wrapper, step)}, identify any rules violated. "
         "Respond with JSON array of {ruleId, description, severity}."
     )
-    resp = await openai_client.chat.completions.create(
-        model="gpt-4.1",
+    # Routed to the small tier; non-JSON answers escalate to the large tier
+    return await chat_completion(
+        "evaluate_guardrails",
         messages=[{"role": "system", "content": "You evaluate guardrails compliance."},
                   {"role": "user", "content": prompt}]
     )
-    # Assume model returns valid JSON
-    return resp.choices[0].message.content
 
 @function_tool
+@instrumented_tool
 async def evaluate_approval(wrapper: RunContextWrapper[WorkflowContext], controls: List[AnyType], issues: List[AnyType]) -> str:
     """
     Use AI to decide approval or rejection based on controls and issues.
     Returns JSON {decision, rationale}.
     """
-    # Debug: Print openai_client type and config
-    #print("[DEBUG] openai_client type:", type(openai_client))
-    #print("[DEBUG] openai_client config:", getattr(openai_client, '__dict__', str(openai_client)))
     prompt = (
         f"You are a risk approval assistant. We have controls: {controls} and issues: {issues}. "
         "Decide whether to APPROVE or REJECT the submission, and provide a brief rationale. "
         "Respond only with a JSON object like {\"decision\": \"Approved\"|\"Rejected\", \"rationale\": \"...\"}."
     )
-    resp = await openai_client.chat.completions.create(
-        model="gpt-4.1",
+    return await chat_completion(
+        "evaluate_approval",
         messages=[{"role": "system", "content": "You assist in approval decisions."},
                   {"role": "user", "content": prompt}]
     )
-    return resp.choices[0].message.content
 
 # --- Agents Definitions ---
-draft_agent = Agent[WorkflowContext](
-    name="draft_agent",
-    instructions=(
-        "Generate a draft submission for the given project description. "
-        "Return a JSON object with the following fields: "
-        '{"project_title": str, "project_description": str, "objectives": [str], "benefits": [str], "deliverables": [str]}" '
-        "Example: "
-        '{"project_title": "...", "project_description": "...", "objectives": ["..."], "benefits": ["..."], "deliverables": ["..."]}'
-    ),
-    model=OpenAIChatCompletionsModel(
-        model=azure_deployment,
-        openai_client=openai_client
-    ),
-    tools=[fetch_past_submissions, fetch_guardrail_rules, evaluate_guardrails],
-)
-mapping_agent = Agent[WorkflowContext](
-    name="mapping_agent",
-    instructions=(
-        "Given the project draft submission, identify and list key risks. "
-        "ONLY return a JSON array of objects, each with: "
-        '{"risk": str, "category_level_1": str, "category_level_2": str, "category_level_3": str, "confidence": float}'
-        "Example: "
-        '[{"risk": "System outage", "category_level_1": "Technology Risk", "category_level_2": "Unreliable Technology Systems, Solutions or Services", "category_level_3": "Failure in Technology Operations", "confidence": 0.92}]'
-        "Do NOT return the draft submission, project description, or any other data. Do NOT echo the input. The output must be a JSON array of risk objects only."
-    ),
-    model=OpenAIChatCompletionsModel(
-        model=azure_deployment,
-        openai_client=openai_client
-    ),
-    tools=[fetch_risk_catalog, fetch_past_submissions, fetch_guardrail_rules, evaluate_guardrails],
-)
-controls_agent = Agent[WorkflowContext](
-    name="controls_agent",
-    instructions=(
-        "Map each identified risk to one or more relevant controls. "
-        "Return a JSON array of objects, each with: "
-        '{"risk": str, "controls": [{"control_id": str, "name": str, "relevance_score": float}]}' 
-        "Example: "
-        '[{"risk": "System outage", "controls": [{"control_id": "C002", "name": "High-Availability Architecture", "relevance_score": 0.92}]}]'
-    ),
-    model=OpenAIChatCompletionsModel(
-        model=azure_deployment,
-        openai_client=openai_client
-    ),
-    tools=[fetch_controls_catalog, fetch_past_submissions, fetch_guardrail_rules, evaluate_guardrails],
-)
-mitigation_agent = Agent[WorkflowContext](
-    name="mitigation_agent",
-    instructions=(
-        "For each risk-control pair, propose mitigations. "
-        "Return a JSON array of objects, each with: "
-        '{"risk": str, "control_id": str, "mitigation_steps": [str]}'
-        "Example: "
-        '[{"risk": "System outage", "control_id": "C002", "mitigation_steps": ["Implement geo-redundancy", "Quarterly failover tests"]}]'
-    ),
-    model=OpenAIChatCompletionsModel(
-        model=azure_deployment,
-        openai_client=openai_client
-    ),
-    tools=[fetch_past_mitigations, fetch_guardrail_rules, evaluate_guardrails],
-)
-qa_agent = Agent[WorkflowContext](
-    name="qa_agent",
-    instructions=(
-        "Flag issues in the draft submission and mitigation proposals. "
-        "Return a JSON array of objects, each with: "
-        '{"issue": str, "severity": str, "recommendation": str}'
-        "Example: "
-        '[{"issue": "No SLA defined for ML vendor", "severity": "High", "recommendation": "Draft and sign SLA"}]'
-    ),
-    model=OpenAIChatCompletionsModel(
-        model=azure_deployment,
-        openai_client=openai_client
-    ),
-    tools=[fetch_past_issues, fetch_guardrail_rules, evaluate_guardrails],
-)
-decision_agent = Agent[WorkflowContext](
-    name="decision_agent",
-    instructions=(
-        "Decide approval or rejection based on controls and issues. "
-        "Return ONLY a JSON object with: "
-        '{"decision": "Approved"|"Rejected", "rationale": str}'
-        "Example: "
-        '{"decision": "Approved", "rationale": "All controls are mapped and no critical issues remain."}'
-        "Do NOT nest the decision_result inside any other object. The output must be a flat JSON object with only 'decision' and 'rationale' at the top level."
-    ),
-    model=OpenAIChatCompletionsModel(
-                model=azure_deployment,
-                openai_client=openai_client
-            ),
-    tools=[evaluate_approval],
-)
-guardrail_agent = Agent[WorkflowContext](
-    name="guardrail_agent",
-    instructions="Enforce guardrail rules before the final review of the risk submission. Return a JSON array of violations, if any.",
-    model=OpenAIChatCompletionsModel(
-                model=azure_deployment,
-                openai_client=openai_client
-            ),
-    tools=[fetch_guardrail_rules, evaluate_guardrails],
-)
-orchestrator_agent = Agent[WorkflowContext](
-    name="orchestrator_agent",
-    instructions=(
-        "You are orchestrating a risk workflow. Check the context for the current step." 
-        "If you're given the project description, kick off the first step of the flow, which is to generate a draft submission."
-        "If the draft submission is generated, use the risk mapping agent to generate a list of applicable risks based on risk catalog, past submissions, and draft submission."
-        "If the risk mapping is done, use the controls agent to map risks to controls based on the controls catalog, past submissions, and draft submission."
-        "If the controls mapping is done, use the mitigation agent to propose mitigations for each risk-control pair."
-        "If the mitigation step is complete, use the QA agent to flag issues in the draft submission and mitigation proposals."
-        "After the QA agent, use the decision agent to decide whether to approve or reject the submission based on controls and issues."
-        "After each agent executes, exit the current sub-execution and share the agent output with the user."
-        "After generating an output for the user to review the data as part of the current step, proceed to the next step."
-        "After each step, return the data for each step as exactly how it was returned by the agent in JSON."
-        "Make sure the output is valid JSON and does not contain any other text."
-    ),
-    model=OpenAIChatCompletionsModel(
-                model=azure_deployment,
-                openai_client=openai_client
-            ),
-    tools=[
-        draft_agent.as_tool("generate_draft", "Generate draft submission"),
-        mapping_agent.as_tool("map_risks", "Map risks"),
-        controls_agent.as_tool("map_controls", "Map controls"),
-        mitigation_agent.as_tool("generate_mitigations", "Generate mitigations"),
-        qa_agent.as_tool("flag_issues", "Flag deficiencies"),
-        decision_agent.as_tool("evaluate_decision", "Approve or reject"),
-    ],
-)
+def _step_output_type(step: str):
+    return STEP_OUTPUT_TYPES[step] if STRUCTURED_OUTPUTS else None
+
+_agents: Dict[str, Agent] = {}
+_agents_lock = threading.Lock()
 
-# --- Feedback Agent and Feedback Processing ---
-feedback_agent = Agent[WorkflowContext](
-    name="feedback_agent",
-    instructions=(
-        "You are a feedback processor. Given user feedback for a workflow step, update the workflow context as needed. "
-        "If the feedback requires changes to previous steps, you may call other agents/tools to update the context. "
-        "Return the updated context to the user as JSON."
-    ),
-    model=OpenAIChatCompletionsModel(
-        model=azure_deployment,
-        openai_client=openai_client
-    ),
-    tools=[
+def _build_agents() -> Dict[str, Agent]:
+    """
+    Build every agent on first use rather than at import. Agents share one routed model
+    per route (see model_routing.get_model) and one client, created here as well.
+    """
+    set_default_openai_client(get_client())
+    draft_agent = Agent[WorkflowContext](
+        name="draft_agent",
+        instructions=(
+            "Generate a draft submission for the given project description. "
+            "Return a JSON object with the following fields: "
+            '{"project_title": str, "project_description": str, "objectives": [str], "benefits": [str], "deliverables": [str]}" '
+            "Example: "
+            '{"project_title": "...", "project_description": "...", "objectives": ["..."], "benefits": ["..."], "deliverables": ["..."]}'
+        ),
+        model=get_model("draft_agent"),
+        output_type=_step_output_type("generate_draft"),
+        tools=[fetch_past_submissions, fetch_guardrail_rules, evaluate_guardrails],
+    )
+    mapping_agent = Agent[WorkflowContext](
+        name="mapping_agent",
+        instructions=(
+            "Given the project draft submission, identify and list key risks. "
+            "ONLY return a JSON array of objects, each with: "
+            '{"risk": str, "category_level_1": str, "category_level_2": str, "category_level_3": str, "confidence": float}'
+            "Example: "
+            '[{"risk": "System outage", "category_level_1": "Technology Risk", "category_level_2": "Unreliable Technology Systems, Solutions or Services", "category_level_3": "Failure in Technology Operations", "confidence": 0.92}]'
+            "Do NOT return the draft submission, project description, or any other data. Do NOT echo the input. The output must be a JSON array of risk objects only."
+        ),
+        model=get_model("mapping_agent"),
+        output_type=_step_output_type("map_risks"),
+        tools=[fetch_risk_catalog, fetch_past_submissions, fetch_guardrail_rules, evaluate_guardrails],
+    )
+    controls_agent = Agent[WorkflowContext](
+        name="controls_agent",
+        instructions=(
+            "Map each identified risk to one or more relevant controls. "
+            "Return a JSON array of objects, each with: "
+            '{"risk": str, "controls": [{"control_id": str, "name": str, "relevance_score": float}]}' 
+            "Example: "
+            '[{"risk": "System outage", "controls": [{"control_id": "C002", "name": "High-Availability Architecture", "relevance_score": 0.92}]}]'
+        ),
+        model=get_model("controls_agent"),
+        output_type=_step_output_type("map_controls"),
+        tools=[fetch_controls_catalog, fetch_past_submissions, fetch_guardrail_rules, evaluate_guardrails],
+    )
+    mitigation_agent = Agent[WorkflowContext](
+        name="mitigation_agent",
+        instructions=(
+            "For each risk-control pair, propose mitigations. "
+            "Return a JSON array of objects, each with: "
+            '{"risk": str, "control_id": str, "mitigation_steps": [str]}'
+            "Example: "
+            '[{"risk": "System outage", "control_id": "C002", "mitigation_steps": ["Implement geo-redundancy", "Quarterly failover tests"]}]'
+        ),
+        model=get_model("mitigation_agent"),
+        output_type=_step_output_type("generate_mitigations"),
+        tools=[fetch_past_mitigations, fetch_guardrail_rules, evaluate_guardrails],
+    )
+    qa_agent = Agent[WorkflowContext](
+        name="qa_agent",
+        instructions=(
+            "Flag issues in the draft submission and mitigation proposals. "
+            "Return a JSON array of objects, each with: "
+            '{"issue": str, "severity": str, "recommendation": str}'
+            "Example: "
+            '[{"issue": "No SLA defined for ML vendor", "severity": "High", "recommendation": "Draft and sign SLA"}]'
+        ),
+        model=get_model("qa_agent"),
+        output_type=_step_output_type("flag_issues"),
+        tools=[fetch_past_issues, fetch_guardrail_rules, evaluate_guardrails],
+    )
+    decision_agent = Agent[WorkflowContext](
+        name="decision_agent",
+        instructions=(
+            "Decide approval or rejection based on controls and issues. "
+            "Return ONLY a JSON object with: "
+            '{"decision": "Approved"|"Rejected", "rationale": str}'
+            "Example: "
+            '{"decision": "Approved", "rationale": "All controls are mapped and no critical issues remain."}'
+            "Do NOT nest the decision_result inside any other object. The output must be a flat JSON object with only 'decision' and 'rationale' at the top level."
+        ),
+        model=get_model("decision_agent"),
+        output_type=_step_output_type("evaluate_decision"),
+        tools=[evaluate_approval],
+    )
+    guardrail_agent = Agent[WorkflowContext](
+        name="guardrail_agent",
+        instructions="Enforce guardrail rules before the final review of the risk submission. Return a JSON array of violations, if any.",
+        model=get_model("guardrail_agent"),
+        tools=[fetch_guardrail_rules, evaluate_guardrails],
+    )
+    # One set of agent-as-tool wrappers, shared by the orchestrator and the feedback agent
+    step_tools = [
         draft_agent.as_tool("generate_draft", "Generate draft submission"),
         mapping_agent.as_tool("map_risks", "Map risks"),
         controls_agent.as_tool("map_controls", "Map controls"),
         mitigation_agent.as_tool("generate_mitigations", "Generate mitigations"),
         qa_agent.as_tool("flag_issues", "Flag deficiencies"),
         decision_agent.as_tool("evaluate_decision", "Approve or reject"),
-    ],
-)
+    ]
+    orchestrator_agent = Agent[WorkflowContext](
+        name="orchestrator_agent",
+        instructions=(
+            "You are orchestrating a risk workflow. Check the context for the current step." 
+            "If you're given the project description, kick off the first step of the flow, which is to generate a draft submission."
+            "If the draft submission is generated, use the risk mapping agent to generate a list of applicable risks based on risk catalog, past submissions, and draft submission."
+            "If the risk mapping is done, use the controls agent to map risks to controls based on the controls catalog, past submissions, and draft submission."
+            "If the controls mapping is done, use the mitigation agent to propose mitigations for each risk-control pair."
+            "If the mitigation step is complete, use the QA agent to flag issues in the draft submission and mitigation proposals."
+            "After the QA agent, use the decision agent to decide whether to approve or reject the submission based on controls and issues."
+            "After each agent executes, exit the current sub-execution and share the agent output with the user."
+            "After generating an output for the user to review the data as part of the current step, proceed to the next step."
+            "After each step, return the data for each step as exactly how it was returned by the agent in JSON."
+            "Make sure the output is valid JSON and does not contain any other text."
+            "The input names the step to run in 'next_step'; the output must conform to 'output_json_schema'."
+        ),
+        model=get_model("orchestrator_agent"),
+        tools=step_tools,
+    )
+
+    feedback_agent = Agent[WorkflowContext](
+        name="feedback_agent",
+        instructions=(
+            "You are a feedback processor. Given user feedback for a workflow step, update the workflow context as needed. "
+            "If the feedback requires changes to previous steps, you may call other agents/tools to update the context. "
+            "Return the updated context to the user as JSON."
+        ),
+        model=get_model("feedback_agent"),
+        tools=step_tools,
+    )
+    return {
+        "draft_agent": draft_agent,
+        "mapping_agent": mapping_agent,
+        "controls_agent": controls_agent,
+        "mitigation_agent": mitigation_agent,
+        "qa_agent": qa_agent,
+        "decision_agent": decision_agent,
+        "guardrail_agent": guardrail_agent,
+        "orchestrator_agent": orchestrator_agent,
+        "feedback_agent": feedback_agent,
+    }
+
+def get_agent(name: str) -> Agent:
+    if not _agents:
+        with _agents_lock:
+            if not _agents:
+                _agents.update(_build_agents())
+    return _agents[name]
+
+def agents_ready() -> bool:
+    return bool(_agents)
 
+# --- Feedback Processing ---
 async def process_feedback(context_id: str, step: str, feedback: str):
     """
     Process feedback for a given step using the feedback agent. Update context as needed.
     """
-    output_dir = os.path.join(os.path.dirname(__file__), 'output')
-    context_path = os.path.join(output_dir, f'workflow_context_{context_id}.json')
-    if not os.path.exists(context_path):
+    # Feedback on an archived workflow brings it back into output/
+    context_path = restore_context(context_id)
+    if context_path is None:
         raise FileNotFoundError("Workflow context not found")
     context = load_context(context_path)
     # Store feedback
     context.feedbacks[step] = feedback
     # Call feedback agent to process feedback and update context
     feedback_input = json.dumps({
-        "context": context.to_dict(),
+        "context": {k: v for k, v in context.to_dict().items() if k != "usage"},
         "step": step,
         "feedback": feedback
     })
-    feedback_out = await Runner.run(
-        feedback_agent,
-        input=feedback_input
-    )
+    # Each feedback round has its own budget, so a feedback loop cannot call sub-agents without limit
+    with track_usage("feedback") as usage:
+        try:
+            with measure_step("feedback") as feedback_metrics:
+                feedback_out = await Runner.run(
+                    get_agent("feedback_agent"),
+                    input=feedback_input,
+                    context=context,
+                )
+        except BudgetExceeded as e:
+            print(f"Stopping feedback for workflow {context_id}: {e}")
+            feedback_out = None
     try:
-        updated_context_dict = json.loads(feedback_out.final_output)
-        updated_context = WorkflowContext(**updated_context_dict)
+        updated_context_dict = repair_json(feedback_out.final_output)
+        allowed = {f.name for f in dataclass_fields(WorkflowContext)}
+        updated_context = WorkflowContext(**{k: v for k, v in updated_context_dict.items() if k in allowed})
     except Exception:
-        updated_context = context  # fallback if parsing fails
+        updated_context = context  # fallback if parsing fails or the budget ran out
+    updated_context.catalog_versions = updated_context.catalog_versions or context.catalog_versions
+    updated_context.step_metrics["feedback"] = feedback_metrics.to_dict()
+    # Usage is accounted here, never taken from the agent's answer
+    updated_context.usage = context.usage
+    updated_context.record_usage(usage)
     save_context(updated_context, context_path)
     return updated_context
 
@@ -424,17 +349,39 @@ def trigger_feedback_api(context_id: str, step: str, feedback: str):
     return process_feedback(context_id, step, feedback)
 
 # --- Refactor run_risk_workflow to remove feedback pausing ---
-async def run_risk_workflow(project_description: str, context_id: str = None, interactive: bool = False):
+async def run_risk_workflow(project_description: str, context_id: str = None, interactive: bool = False,
+                            catalog_snapshot: Optional[Dict[str, CatalogSnapshot]] = None,
+                            reuse_from: Optional[str] = None):
     if context_id is None:
         context_id = str(uuid.uuid4())
-    output_dir = os.path.join(os.path.dirname(__file__), 'output')
-    os.makedirs(output_dir, exist_ok=True)
-    context_path = os.path.join(output_dir, f'workflow_context_{context_id}.json')
-    if os.path.exists(context_path):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    context_path = os.path.join(OUTPUT_DIR, f'workflow_context_{context_id}.json')
+    if restore_context(context_id):
         context = load_context(context_path)
     else:
         context = WorkflowContext(project_description=project_description)
-    with trace("Risk Workflow with UI Context"):
+    # Every step of this run sees the same catalog versions, even if a catalog is edited meanwhile;
+    # batches pass one snapshot for all of their workflows
+    pinned_catalogs = catalog_snapshot or catalogs.pin()
+    context.catalog_snapshot = pinned_catalogs
+    context.catalog_versions = CatalogRepository.versions(pinned_catalogs)
+    # Seed from a completed near-duplicate: steps its outputs still answer are copied, not rerun.
+    # The prior may be archived; it is only read, so it stays there
+    prior = find_context(reuse_from) if reuse_from else None
+    if prior is not None:
+        if prior.status == "completed":
+            context.reused_from = reuse_from
+            context.reused_steps = []
+        else:
+            prior = None
+    rerun = set()
+
+    def checkpoint():
+        # Persist the step outputs together with this run's usage so far
+        context.record_usage(usage)
+        save_context(context, context_path)
+
+    with trace("Risk Workflow with UI Context"), track_usage("workflow") as usage:
         steps = [
             ("generate_draft", "Draft Submission"),
             ("map_risks", "Risk Mapping"),
@@ -443,32 +390,97 @@ async def run_risk_workflow(project_description: str, context_id: str = None, in
             ("flag_issues", "QA Issues"),
             ("evaluate_decision", "Final Decision"),
         ]
-        for idx, (step, label) in enumerate(steps):
-            main_out = await Runner.run(
-                orchestrator_agent,
-                input=json.dumps(context.to_dict())
-            )
-            print(f"main_out: {main_out.final_output}")
-            data = main_out.final_output
-            if step in ["generate_draft", "map_risks", "map_controls", "generate_mitigations", "flag_issues", "evaluate_decision"]:
+        context.status = "in_progress"
+        checkpoint()
+        try:
+            for idx, (step, label) in enumerate(steps):
+                if prior is not None and reusable_step(step, context, prior, rerun):
+                    context.record_step(step, prior.step_output(step))
+                    context.reused_steps.append(step)
+                    if step == "flag_issues":
+                        context.record_guardrail(step, prior.guardrail_violations.get(step, []))
+                    checkpoint()
+                    continue
+                rerun.add(step)
                 try:
-                    data = json.loads(data)
-                except Exception as e:
-                    print(f"Error parsing {step} output:", e)
-            context.record_step(step, data)
+                    with measure_step(step) as step_metrics:
+                        main_out = await with_step_deadline(step, Runner.run(
+                            get_agent("orchestrator_agent"),
+                            input=json.dumps({
+                                **context.to_dict(),
+                                "next_step": step,
+                                "output_json_schema": STEP_JSON_SCHEMAS[step],
+                            }),
+                            context=context,
+                        ))
+                        print(f"main_out: {main_out.final_output}")
+                        # Repair locally and re-ask only for the invalid part instead of rerunning the step
+                        parsed = await parse_and_repair_step_output(step, main_out.final_output)
+                except (DeadlineExceeded, BudgetExceeded) as e:
+                    print(f"Stopping workflow {context_id}: {e}")
+                    context.step_metrics[step] = step_metrics.to_dict()
+                    context.validation_errors[step] = [str(e)]
+                    context.current_step = step
+                    context.status = "failed"
+                    checkpoint()
+                    return
+                if parsed.errors():
+                    print(f"Error parsing {step} output:", parsed.errors())
+                    context.validation_errors[step] = parsed.errors()
+                else:
+                    context.validation_errors.pop(step, None)
+                data = parsed.data
+                if data is None:
+                    data = [] if step in LIST_STEPS else {}
+                context.step_metrics[step] = step_metrics.to_dict()
+                context.record_step(step, data)
+                context.current_step = step
+                checkpoint()
+                # No feedback pausing here; feedback is handled separately
+                # Only run guardrail agent before the final evaluation step
+                if step == "flag_issues" and budget_degraded():
+                    # Guardrail evaluation is advisory; a run close to its budget skips it
+                    context.record_guardrail(step, [{
+                        "ruleId": "budget", "severity": "Low",
+                        "description": f"Guardrail check skipped: {usage.degraded} budget nearly used",
+                    }])
+                    checkpoint()
+                elif step == "flag_issues":
+                    try:
+                        with measure_step(f"guard_{step}") as guard_metrics:
+                            guard_out = await with_step_deadline(f"guard_{step}", Runner.run(
+                                get_agent("guardrail_agent"),
+                                input=f"Current step:{step}, project draft: {context.draft_submission}, output for guardrail evaluation: {data}",
+                                context=context,
+                            ))
+                        v_data = guard_out.final_output
+                    except (DeadlineExceeded, BudgetExceeded) as e:
+                        # Guardrail evaluation is advisory; record the miss and carry on to the decision
+                        print(f"Guardrail check skipped: {e}")
+                        rule = "budget" if isinstance(e, BudgetExceeded) else "deadline"
+                        v_data = [{"ruleId": rule, "description": str(e), "severity": "Low"}]
+                    context.step_metrics[f"guard_{step}"] = guard_metrics.to_dict()
+                    context.record_guardrail(step, v_data)
+                    checkpoint()
+                    context = load_context(context_path)
+                    context.catalog_snapshot = pinned_catalogs
+            context.status = "completed"
+            checkpoint()
+        except asyncio.CancelledError:
+            # Cancelled through the API; in-flight model calls are cancelled with the task
+            print(f"Workflow {context_id} cancelled")
+            context.status = "cancelled"
+            checkpoint()
+            raise
+        except Exception as e:
+            # API errors that outlived their retries, agent errors and the like end the run too;
+            # without this the saved context would stay "in_progress"
+            print(f"Workflow {context_id} failed at {step}: {e}")
+            context.validation_errors[step] = [f"{type(e).__name__}: {e}"]
             context.current_step = step
-            save_context(context, context_path)
-            # No feedback pausing here; feedback is handled separately
-            # Only run guardrail agent before the final evaluation step
-            if step == "flag_issues":
-                guard_out = await Runner.run(
-                    guardrail_agent,
-                    input=f"Current step:{step}, project draft: {context.draft_submission}, output for guardrail evaluation: {data}",
-                )
-                v_data = guard_out.final_output
-                context.record_guardrail(step, v_data)
-                save_context(context, context_path)
-                context = load_context(context_path)
+            context.status = "failed"
+            checkpoint()
+            raise
     print("\n=== UI Progress Updates ===\n", json.dumps(context.ui_updates, indent=2))
     print("\n=== Final Decision ===\n", json.dumps(context.decision_result, indent=2))
 
@@ -0,0 +1,516 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from archive import iter_stored_contexts
+from catalog_repo import CatalogRepository, CatalogSnapshot
+from instrumentation import Histogram
+
+ANALYTICS_QUERY_SECONDS = Histogram(
+    "rcsa_analytics_query_seconds", "Portfolio analytics query time", ("view",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+# Rows a mapped risk that matches no catalog risk is filed under: "?<normalized risk text>"
+UNCATALOGUED_PREFIX = "?"
+
+
+def _norm(value: Any) -> str:
+    return " ".join(str(value or "").split()).casefold()
+
+
+class _Table:
+    """
+    Column-oriented rows in growable NumPy arrays, with a liveness mask so a workflow's
+    rows can be replaced without shifting everything after them.
+    """
+
+    def __init__(self, **dtypes):
+        self.size = 0
+        self.dead = 0
+        self.columns = {name: np.zeros(1024, dtype=dtype) for name, dtype in dtypes.items()}
+        self.columns["live"] = np.zeros(1024, dtype=bool)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name][:self.size]
+
+    def append(self, **values: List[Any]):
+        count = len(next(iter(values.values())))
+        if not count:
+            return
+        needed = self.size + count
+        capacity = len(self.columns["live"])
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            for name, column in self.columns.items():
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                self.columns[name] = grown
+        for name, column_values in values.items():
+            self.columns[name][self.size:needed] = column_values
+        self.columns["live"][self.size:needed] = True
+        self.size = needed
+
+    def kill(self, workflow: int):
+        live = self["live"]
+        rows = live & (self["wf"] == workflow)
+        killed = int(rows.sum())
+        if killed:
+            live[rows] = False
+            self.dead += killed
+            if self.dead > self.size // 2:
+                self.compact()
+
+    def compact(self):
+        keep = self["live"].copy()
+        for name, column in self.columns.items():
+            kept = column[:self.size][keep]
+            column[:len(kept)] = kept
+        self.size = int(keep.sum())
+        self.dead = 0
+
+
+class CoverageAnalytics:
+    """
+    Portfolio view of risk and control mapping across every saved workflow.
+
+    Keeps a sparse risk x control x workflow tensor as COO columns (one row per workflow,
+    catalog risk and control triple) plus one row per workflow and mapped risk. Saves
+    replace a workflow's rows in place, so queries never re-read `output/`; they are
+    `np.bincount` passes over the live rows. Mapped risks are free text, so they are
+    resolved to catalog risks by id or by their category levels; risks that match
+    nothing are kept under their normalized text.
+    """
+
+    def __init__(self, catalogs: CatalogRepository, output_dir: str):
+        self.catalogs = catalogs
+        self.output_dir = output_dir
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        # Bumped on every change to the rows or decisions; keys the aggregate cache
+        self._version = 0
+        self._aggregates: Dict[Optional[str], Tuple[Tuple[Any, ...], Dict[str, Any]]] = {}
+        self._workflows: Dict[str, int] = {}
+        self._workflow_ids: List[str] = []
+        self._fingerprints: List[Optional[str]] = []
+        self._decisions = np.full(1024, -1, dtype=np.int16)
+        self._decision_codes: Dict[str, int] = {}
+        self._risks: Dict[str, int] = {}
+        self._risk_keys: List[str] = []
+        self._controls: Dict[str, int] = {}
+        self._control_keys: List[str] = []
+        # One row per workflow and mapped risk
+        self._pairs = _Table(wf=np.int32, risk=np.int32, mitigated=bool)
+        # One row per workflow, risk and mapped control; first_use marks a control's first row per workflow
+        self._triples = _Table(wf=np.int32, risk=np.int32, ctrl=np.int32, score=np.float32, first_use=bool)
+
+    # --- Vocabularies ---
+    def _index(self, vocab: Dict[str, int], keys: List[str], key: str) -> int:
+        idx = vocab.get(key)
+        if idx is None:
+            idx = vocab[key] = len(keys)
+            keys.append(key)
+        return idx
+
+    def _workflow(self, context_id: str) -> int:
+        idx = self._workflows.get(context_id)
+        if idx is None:
+            idx = self._index(self._workflows, self._workflow_ids, context_id)
+            self._fingerprints.append(None)
+            if idx >= len(self._decisions):
+                grown = np.full(len(self._decisions) * 2, -1, dtype=np.int16)
+                grown[:len(self._decisions)] = self._decisions
+                self._decisions = grown
+        return idx
+
+    # --- Resolution ---
+    @staticmethod
+    def _build_resolver(snapshot: CatalogSnapshot) -> Dict[Tuple[str, ...], str]:
+        """
+        Lookup keys for the risk catalog: id, the three category levels, levels 2-3 and
+        level 3 alone. The first catalog risk wins when several share a key.
+        """
+        resolver: Dict[Tuple[str, ...], str] = {}
+        for risk in snapshot.items:
+            l1, l2, l3 = (_norm(risk.get(k)) for k in ("category_level_1", "category_level_2", "category_level_3"))
+            for key in (("id", _norm(risk.get("id"))), (l1, l2, l3), (l2, l3), (l3,)):
+                resolver.setdefault(key, risk["id"])
+        return resolver
+
+    def _resolve_risk(self, resolver: Dict[Tuple[str, ...], str], item: Dict[str, Any]) -> str:
+        l1, l2, l3 = (_norm(item.get(k)) for k in ("category_level_1", "category_level_2", "category_level_3"))
+        text = _norm(item.get("risk"))
+        for key in (("id", text), (l1, l2, l3), (l2, l3), (l3,)):
+            if key in resolver and all(key):
+                return resolver[key]
+        return UNCATALOGUED_PREFIX + text
+
+    # --- Updates ---
+    def observe(self, context_id: str, data: Dict[str, Any], only_new: bool = False):
+        """
+        Record (or replace) one workflow's mappings from its context dict. Cheap when the
+        mappings have not changed since the last save. With `only_new`, workflows already
+        indexed are left alone.
+        """
+        risk_mapping = data.get("risk_mapping") or []
+        controls_mapping = data.get("controls_mapping") or []
+        decision = (data.get("decision_result") or {}).get("decision") if isinstance(data.get("decision_result"), dict) else None
+        fingerprint = hashlib.sha1(json.dumps([risk_mapping, controls_mapping], sort_keys=True, default=str)
+                                   .encode("utf-8")).hexdigest()
+        with self._lock:
+            if only_new and context_id in self._workflows:
+                return
+            wf = self._workflow(context_id)
+            code = -1 if decision is None else self._decision_codes.setdefault(decision, len(self._decision_codes))
+            if self._decisions[wf] != code:
+                self._decisions[wf] = code
+                self._version += 1
+            previous = self._fingerprints[wf]
+            if previous == fingerprint:
+                return
+            self._fingerprints[wf] = fingerprint
+            self._version += 1
+            if previous is not None:
+                self._pairs.kill(wf)
+                self._triples.kill(wf)
+            resolver = self.catalogs.get("risks").derived("analytics_resolver", self._build_resolver)
+
+            by_text: Dict[str, int] = {}
+            for item in risk_mapping:
+                if isinstance(item, dict):
+                    by_text.setdefault(_norm(item.get("risk")),
+                                       self._index(self._risks, self._risk_keys, self._resolve_risk(resolver, item)))
+            scores: Dict[Tuple[int, int], float] = {}
+            for item in controls_mapping:
+                if not isinstance(item, dict):
+                    continue
+                text = _norm(item.get("risk"))
+                risk = by_text.get(text)
+                if risk is None:
+                    risk = by_text[text] = self._index(self._risks, self._risk_keys, self._resolve_risk(resolver, item))
+                for control in item.get("controls") or []:
+                    if not isinstance(control, dict) or not control.get("control_id"):
+                        continue
+                    ctrl = self._index(self._controls, self._control_keys, str(control["control_id"]).strip().upper())
+                    try:
+                        score = float(control.get("relevance_score") or 0.0)
+                    except (TypeError, ValueError):
+                        score = 0.0
+                    scores[(risk, ctrl)] = max(score, scores.get((risk, ctrl), 0.0))
+
+            risks = sorted(set(by_text.values()))
+            mitigated = {risk for risk, _ in scores}
+            self._pairs.append(wf=[wf] * len(risks), risk=risks, mitigated=[r in mitigated for r in risks])
+            triples = sorted(scores)
+            seen_controls = set()
+            first_use = []
+            for _, ctrl in triples:
+                first_use.append(ctrl not in seen_controls)
+                seen_controls.add(ctrl)
+            self._triples.append(wf=[wf] * len(triples), risk=[r for r, _ in triples],
+                                 ctrl=[c for _, c in triples], score=[scores[t] for t in triples],
+                                 first_use=first_use)
+
+    def forget(self, context_id: str):
+        with self._lock:
+            wf = self._workflows.get(context_id)
+            if wf is not None:
+                self._pairs.kill(wf)
+                self._triples.kill(wf)
+                self._fingerprints[wf] = None
+                self._decisions[wf] = -1
+                self._version += 1
+
+    def load(self):
+        """
+        Index every saved workflow context once; afterwards saves keep the index current.
+        Files are read outside the index lock so saves are not held up, and a workflow a
+        save has already indexed is not overwritten with what the scan read.
+        """
+        with self._load_lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            count = 0
+            for context_id, data in iter_stored_contexts(self.output_dir, "Analytics"):
+                self.observe(context_id, data, only_new=True)
+                count += 1
+            self._loaded = True
+            print(f"Analytics indexed {count} workflows in {time.perf_counter() - started:.2f}s")
+
+    # --- Queries ---
+    def _selection(self, table: _Table, decision: Optional[str]) -> np.ndarray:
+        selected = table["live"]
+        if decision is not None:
+            code = self._decision_codes.get(decision, -2)
+            selected = selected & (self._decisions[table["wf"]] == code)
+        return selected
+
+    def _catalog_keys(self, n_controls: int) -> np.ndarray:
+        """
+        Sorted `risk * n_controls + control` keys of the catalog's `subriskIds` links over
+        the current vocabularies.
+        """
+        keys = []
+        for control in self.catalogs.get("controls").items:
+            ctrl = self._controls.get(str(control.get("id", "")).strip().upper())
+            if ctrl is None:
+                continue
+            for risk_id in control.get("subriskIds") or []:
+                risk = self._risks.get(risk_id)
+                if risk is not None:
+                    keys.append(risk * n_controls + ctrl)
+        return np.unique(np.array(keys, dtype=np.int64))
+
+    def _aggregate(self, decision: Optional[str]) -> Dict[str, Any]:
+        """
+        Marginal counts and the observed risk x control pairs (COO: one entry per distinct
+        pair, never a dense matrix, since free-text risks make the risk axis unbounded) for
+        the selected workflows, cached until the next change to the index or the catalogs.
+        """
+        risks_snapshot, controls_snapshot = self.catalogs.get("risks"), self.catalogs.get("controls")
+        key = (self._version, risks_snapshot.digest, controls_snapshot.digest)
+        cached = self._aggregates.get(decision)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        # Make sure every catalog risk and control has a slot, even if never mapped
+        for risk in risks_snapshot.items:
+            self._index(self._risks, self._risk_keys, risk["id"])
+        for control in controls_snapshot.items:
+            self._index(self._controls, self._control_keys, str(control["id"]).strip().upper())
+        n_risks, n_controls = len(self._risk_keys), len(self._control_keys)
+        pairs, triples = self._pairs, self._triples
+
+        def rows(table: _Table, selected: Optional[np.ndarray], name: str, flag: Optional[str] = None):
+            mask = selected if flag is None else (table[flag] if selected is None else selected & table[flag])
+            return table[name] if mask is None else table[name][mask]
+
+        # Without a filter or dead rows every row counts, so skip the masking
+        p_sel = None if decision is None and not pairs.dead else self._selection(pairs, decision)
+        t_sel = None if decision is None and not triples.dead else self._selection(triples, decision)
+        pair_keys = rows(triples, t_sel, "risk").astype(np.int64) * n_controls + rows(triples, t_sel, "ctrl")
+        keys, counts = np.unique(pair_keys, return_counts=True)
+        pair_risk, pair_ctrl = keys // n_controls, keys % n_controls
+        catalog_keys = self._catalog_keys(n_controls)
+        in_catalog = np.isin(keys, catalog_keys, assume_unique=True)
+        catalog_counts = np.where(in_catalog, counts, 0)
+        aggregate = {
+            "workflows": int(np.count_nonzero(np.bincount(rows(pairs, p_sel, "wf"), minlength=len(self._workflow_ids)))),
+            "risk_mapped": np.bincount(rows(pairs, p_sel, "risk"), minlength=n_risks),
+            "risk_mitigated": np.bincount(rows(pairs, p_sel, "risk", "mitigated"), minlength=n_risks),
+            "control_workflows": np.bincount(rows(triples, t_sel, "ctrl", "first_use"), minlength=n_controls),
+            # Observed pairs: risk, control, how often and whether the catalog links them
+            "pair_risk": pair_risk,
+            "pair_ctrl": pair_ctrl,
+            "pair_counts": counts,
+            "pair_in_catalog": in_catalog,
+            # Per risk and per control: distinct partners, pair rows, and rows the catalog links
+            "risk_controls_used": np.bincount(pair_risk, minlength=n_risks),
+            "risk_pairs": np.bincount(pair_risk, weights=counts, minlength=n_risks),
+            "risk_pairs_in_catalog": np.bincount(pair_risk, weights=catalog_counts, minlength=n_risks),
+            "control_risks_covered": np.bincount(pair_ctrl, minlength=n_controls),
+            "control_pairs": np.bincount(pair_ctrl, weights=counts, minlength=n_controls),
+            "control_pairs_in_catalog": np.bincount(pair_ctrl, weights=catalog_counts, minlength=n_controls),
+            "catalog_pairs": len(catalog_keys),
+            "catalog_controls": np.bincount(catalog_keys // n_controls, minlength=n_risks),
+        }
+        self._aggregates[decision] = (key, aggregate)
+        return aggregate
+
+    def _risk_info(self, idx: int) -> Dict[str, Any]:
+        key = self._risk_keys[idx]
+        if key.startswith(UNCATALOGUED_PREFIX):
+            return {"risk": key[1:], "catalogued": False}
+        return {"risk_id": key, "catalogued": True}
+
+    def _timed(self, view: str, build):
+        started = time.perf_counter()
+        self.load()
+        with self._lock:
+            result = build()
+        elapsed = time.perf_counter() - started
+        ANALYTICS_QUERY_SECONDS.observe(elapsed, view=view)
+        result["query_ms"] = round(elapsed * 1000, 3)
+        return result
+
+    def summary(self, decision: Optional[str] = None) -> Dict[str, Any]:
+        def build():
+            agg = self._aggregate(decision)
+            catalogued = np.array([not k.startswith(UNCATALOGUED_PREFIX) for k in self._risk_keys])
+            return {
+                "workflows_indexed": len(self._workflows),
+                "workflows_with_mappings": agg["workflows"],
+                "risk_control_entries": int(self._triples["live"].sum()),
+                "catalog_risks_mapped": int((agg["risk_mapped"][catalogued] > 0).sum()),
+                "catalog_risks": int(catalogued.sum()),
+                "uncatalogued_risk_mappings": int(agg["risk_mapped"][~catalogued].sum()),
+                "controls_used": int((agg["control_workflows"] > 0).sum()),
+                "observed_pairs": len(agg["pair_counts"]),
+                "observed_pairs_in_catalog": int(agg["pair_in_catalog"].sum()),
+                "catalog_pairs": agg["catalog_pairs"],
+                "decisions": {d: int((self._decisions[:len(self._workflows)] == c).sum())
+                              for d, c in self._decision_codes.items()},
+            }
+        return self._timed("summary", build)
+
+    def coverage(self, decision: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Per catalog risk: workflows mapping it, the share with a control, distinct controls
+        used, and how many of its mapped controls the catalog links to it via `subriskIds`.
+        """
+        def build():
+            agg = self._aggregate(decision)
+            mapped, mitigated = agg["risk_mapped"], agg["risk_mitigated"]
+            in_catalog, total_pairs = agg["risk_pairs_in_catalog"], agg["risk_pairs"]
+            risks = []
+            for risk in self.catalogs.get("risks").items:
+                idx = self._risks[risk["id"]]
+                risks.append({
+                    "risk_id": risk["id"],
+                    "category_level_3": risk.get("category_level_3"),
+                    "workflows": int(mapped[idx]),
+                    "mitigated_workflows": int(mitigated[idx]),
+                    "mitigation_rate": round(mitigated[idx] / mapped[idx], 4) if mapped[idx] else None,
+                    "controls_used": int(agg["risk_controls_used"][idx]),
+                    "catalog_controls": int(agg["catalog_controls"][idx]),
+                    "catalog_match_rate": round(in_catalog[idx] / total_pairs[idx], 4) if total_pairs[idx] else None,
+                })
+            return {"workflows": agg["workflows"], "risks": risks}
+        return self._timed("coverage", build)
+
+    def gaps(self, decision: Optional[str] = None, min_workflows: int = 5, limit: int = 20) -> Dict[str, Any]:
+        """
+        Risks that are mapped but rarely mitigated, catalog risks with no `subriskIds`
+        control, and frequently mapped risk-control pairs the catalog does not link.
+        """
+        def build():
+            agg = self._aggregate(decision)
+            mapped, mitigated = agg["risk_mapped"], agg["risk_mitigated"]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rate = np.where(mapped > 0, mitigated / np.maximum(mapped, 1), np.nan)
+            eligible = np.flatnonzero(mapped >= min_workflows)
+            rarely = eligible[np.argsort(rate[eligible], kind="stable")][:limit]
+            catalog_ids = [r["id"] for r in self.catalogs.get("risks").items]
+            off_catalog = np.where(agg["pair_in_catalog"], 0, agg["pair_counts"])
+            top = np.argsort(-off_catalog, kind="stable")[:limit]
+            return {
+                "rarely_mitigated": [
+                    {**self._risk_info(i), "workflows": int(mapped[i]), "mitigated_workflows": int(mitigated[i]),
+                     "mitigation_rate": round(float(rate[i]), 4)}
+                    for i in rarely
+                ],
+                "never_mapped": [rid for rid in catalog_ids if not mapped[self._risks[rid]]],
+                "mapped_without_catalog_control": [
+                    {"risk_id": rid, "workflows": int(mapped[self._risks[rid]])}
+                    for rid in catalog_ids if mapped[self._risks[rid]] and not agg["catalog_controls"][self._risks[rid]]
+                ],
+                "unlinked_pairs": [
+                    {**self._risk_info(int(agg["pair_risk"][i])), "control_id": self._control_keys[int(agg["pair_ctrl"][i])],
+                     "workflows": int(off_catalog[i])}
+                    for i in top if off_catalog[i] > 0
+                ],
+                "unused_catalog_pairs": agg["catalog_pairs"] - int(agg["pair_in_catalog"].sum()),
+            }
+        return self._timed("gaps", build)
+
+    def controls(self, decision: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """
+        Controls ranked by the share of workflows relying on them.
+        """
+        def build():
+            agg = self._aggregate(decision)
+            used = agg["control_workflows"]
+            names = {str(c["id"]).strip().upper(): c.get("name") for c in self.catalogs.get("controls").items}
+            workflows = max(agg["workflows"], 1)
+            in_catalog, total_pairs = agg["control_pairs_in_catalog"], agg["control_pairs"]
+            order = np.argsort(-used, kind="stable")[:limit]
+            return {
+                "workflows": agg["workflows"],
+                "controls": [
+                    {
+                        "control_id": self._control_keys[c],
+                        "name": names.get(self._control_keys[c]),
+                        "in_catalog": self._control_keys[c] in names,
+                        "workflows": int(used[c]),
+                        "workflow_share": round(used[c] / workflows, 4),
+                        "risks_covered": int(agg["control_risks_covered"][c]),
+                        "catalog_match_rate": round(in_catalog[c] / total_pairs[c], 4) if total_pairs[c] else None,
+                    }
+                    for c in order
+                ],
+            }
+        return self._timed("controls", build)
+
+    def cooccurrence(self, risk_id: Optional[str] = None, control_id: Optional[str] = None,
+                     decision: Optional[str] = None, limit: int = 10) -> Optional[Dict[str, Any]]:
+        """
+        Risks and controls that appear in the same workflows as the given risk or control,
+        with counts and lift (how much more often they co-occur than if independent).
+        Returns None if the risk or control has never been indexed.
+        """
+        self.load()
+        with self._lock:
+            idx = self._risks.get(risk_id) if risk_id is not None else self._controls.get(control_id.strip().upper())
+        if idx is None:
+            return None
+
+        def build():
+            agg = self._aggregate(decision)
+            pairs, triples = self._pairs, self._triples
+            p_sel = self._selection(pairs, decision)
+            t_sel = self._selection(triples, decision)
+            in_workflow = np.zeros(len(self._workflow_ids), dtype=bool)
+            if risk_id is not None:
+                in_workflow[pairs["wf"][p_sel & (pairs["risk"] == idx)]] = True
+            else:
+                in_workflow[triples["wf"][t_sel & (triples["ctrl"] == idx)]] = True
+            anchor = int(in_workflow.sum())
+            total = max(agg["workflows"], 1)
+            risk_rows = p_sel & in_workflow[pairs["wf"]]
+            control_rows = t_sel & triples["first_use"] & in_workflow[triples["wf"]]
+            risk_counts = np.bincount(pairs["risk"][risk_rows], minlength=len(self._risk_keys))
+            control_counts = np.bincount(triples["ctrl"][control_rows], minlength=len(self._control_keys))
+
+            # The anchor itself is not its own co-occurrence
+            if risk_id is not None:
+                risk_counts[idx] = 0
+            else:
+                control_counts[idx] = 0
+
+            def top(counts, base, label):
+                order = np.argsort(-counts, kind="stable")[:limit]
+                rows = []
+                for i in order:
+                    if counts[i] == 0:
+                        break
+                    entry = self._risk_info(int(i)) if label == "risk" else {"control_id": self._control_keys[i]}
+                    lift = (counts[i] / anchor) / (base[i] / total) if anchor and base[i] else None
+                    rows.append({**entry, "workflows": int(counts[i]),
+                                 "lift": round(float(lift), 3) if lift is not None else None})
+                return rows
+
+            return {
+                "risk_id": risk_id,
+                "control_id": control_id,
+                "workflows": anchor,
+                "risks": top(risk_counts, agg["risk_mapped"], "risk"),
+                "controls": top(control_counts, agg["control_workflows"], "control"),
+            }
+        return self._timed("cooccurrence", build)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "loaded": self._loaded,
+                "workflows": len(self._workflows),
+                "risks": len(self._risk_keys),
+                "controls": len(self._control_keys),
+                "pair_rows": self._pairs.size,
+                "triple_rows": self._triples.size,
+            }
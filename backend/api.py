@@ -1,23 +1,67 @@
 from fastapi import FastAPI, HTTPException, Path, Query, Body, UploadFile, File, Form, Depends, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse, Response
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import os
 import json
 import uuid
 import asyncio
-import shutil
-import requests
-from pypdf import PdfReader
-from openai import AzureOpenAI
-from agentic_rcsa import (
-    run_risk_workflow, WorkflowContext, save_context, load_context,
-    DATA_DIR, RISK_CATALOG, CONTROLS_CATALOG, GUARDRAIL_RULES, SAMPLE_SUBMISSIONS,
-    trigger_feedback_api  # <-- import the new function
+import hashlib
+from workflow_store import (
+    WorkflowContext, save_context, write_context_file, load_context, find_context, restore_context,
+    DATA_DIR, OUTPUT_DIR, catalogs, analytics, workflow_search, precedents_for, duplicates, costs, archive,
+    run_workflow, process_feedback, workflow_engine, engine_status
 )
+from archive import ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL
+from model_routing import chat_completion, get_route_stats, MODEL_ROUTES
+from hedging import HEDGING, budget as hedge_budget
+from instrumentation import HTTP_REQUEST_DURATION, render_prometheus, profiler
+from conversation_store import ConversationStore
+from intake_summary import IntakeSummarizer
+from bulk_io import BulkCatalog, import_rows, export_ndjson
+from admission import AdmissionRejected, registry as workflow_registry
+from batch import BatchManager
+import time
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+# Serve CRUD as soon as the app starts; the agents and model client load in the background
+WARM_AGENTS = os.getenv("RCSA_WARM_AGENTS", "1") == "1"
+
+async def _warm_agents():
+    try:
+        await workflow_engine()
+    except Exception as e:
+        print(f"Agent warm-up failed: {e}")
+
+def _sweep_archive(older_than_days: float = ARCHIVE_AFTER_DAYS) -> Dict[str, Any]:
+    # Workflows the registry still holds may be saved again at any moment
+    report = archive.sweep(older_than_days, skip=lambda context_id: context_id in workflow_registry.runs)
+    app.state.last_archive_sweep = report
+    return report
+
+async def _archive_loop():
+    """
+    Move completed workflows older than RCSA_ARCHIVE_AFTER_DAYS out of output/ every
+    RCSA_ARCHIVE_INTERVAL seconds.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(_sweep_archive)
+        except Exception as e:
+            print(f"Archive sweep failed: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARM_AGENTS and not engine_status()["missing_settings"]:
+        app.state.warm_up = asyncio.create_task(_warm_agents())
+    archiver = asyncio.create_task(_archive_loop()) if ARCHIVE_INTERVAL > 0 else None
+    yield
+    if archiver is not None:
+        archiver.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,7 +71,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'output')
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template so per-ID paths don't explode the series count
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
 
 # --- Pydantic Models for CRUD ---
 class ControlItem(BaseModel):
@@ -55,7 +115,8 @@ class SampleSubmissionItem(BaseModel):
     draft: Dict[str, Any]
     mitigation: Optional[List[Dict[str, Any]]] = None
     issues: Optional[List[Dict[str, Any]]] = None
-    # Add other fields as needed
+    # Keep other fields (mapping, controls, decision, ...) as submitted
+    model_config = {"extra": "allow"}
 
 class FeedbackRequest(BaseModel):
     step: str
@@ -64,6 +125,14 @@ class FeedbackRequest(BaseModel):
 class ProjectDescriptionBody(BaseModel):
     project_description: str
 
+class BatchProject(BaseModel):
+    project_description: str
+    name: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    projects: List[BatchProject]
+    max_concurrency: Optional[int] = None
+
 # Conversation models
 class ConversationMessage(BaseModel):
     id: str
@@ -81,18 +150,37 @@ class ConversationContext(BaseModel):
     updatedAt: str
     metadata: Dict[str, Any]
 
+class AppendMessagesRequest(BaseModel):
+    messages: List[ConversationMessage]
+    status: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+
 class GenerateDraftFromConversationRequest(BaseModel):
     conversationId: str
     messages: List[ConversationMessage]
 
-# --- Helper functions for file CRUD ---
-def _load_json(path):
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def _save_json(path, data):
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
+# --- Helper functions for catalog CRUD ---
+def _catalog_response(name: str, request: Request) -> Response:
+    """
+    Serve the current catalog snapshot with an ETag; a matching If-None-Match gets a 304.
+    """
+    snapshot = catalogs.get(name)
+    if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if snapshot.etag in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers={"ETag": snapshot.etag})
+    return Response(content=snapshot.text, media_type="application/json", headers={"ETag": snapshot.etag})
+
+def _replace_item(name: str, key: str, item_id: str, data: Dict[str, Any], not_found: str):
+    def change(items):
+        for idx, existing in enumerate(items):
+            if existing.get(key) == item_id:
+                items[idx] = data
+                return
+        raise HTTPException(status_code=404, detail=not_found)
+    catalogs.update(name, change)
+
+def _delete_item(name: str, key: str, item_id: str):
+    catalogs.update(name, lambda items: [i for i in items if i.get(key) != item_id])
 
 # --- Workflow Endpoints ---
 async def get_project_description(
@@ -116,45 +204,239 @@ async def get_project_description(
             pass
     raise HTTPException(status_code=400, detail="project_description is required (as form or JSON body)")
 
+def _workflow_user(request: Request) -> str:
+    """
+    Caller identity for per-user admission limits: the X-User-Id header, else the client address.
+    """
+    return request.headers.get("x-user-id") or (request.client.host if request.client else "anonymous")
+
+def _check_admission(user: str):
+    try:
+        workflow_registry.check(user)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
+def _admit_workflow(context_id: str, user: str, description: str, reuse_from: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run the workflow now if there is capacity, otherwise queue it (status "queued") or
+    reject with 429 and Retry-After when the queue is full.
+    """
+    try:
+        run = workflow_registry.submit(
+            context_id, user, lambda: run_workflow(description, context_id, reuse_from=reuse_from))
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+    context_path = os.path.join(OUTPUT_DIR, f'workflow_context_{context_id}.json')
+    if run.state == "queued" or not os.path.exists(context_path):
+        # Give pollers something to read until the run starts, or while the agents load
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        status = "queued" if run.state == "queued" else "in_progress"
+        save_context(WorkflowContext(project_description=description, status=status), context_path)
+    return {"status": "started" if run.state == "running" else "queued",
+            "queue_position": workflow_registry.queue_position(context_id)}
+
+UPLOADS_DIR = os.path.join(os.path.dirname(__file__), 'uploads')
+
+def _store_upload(file: UploadFile):
+    """
+    Save an uploaded file under uploads/ and return (file_path, extracted_text). Files are
+    named by their SHA-256, so a document uploaded again is stored, and its PDF text
+    extracted, only once.
+    """
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    extension = os.path.splitext(file.filename or '')[1].lower()
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(UPLOADS_DIR, f".{uuid.uuid4()}.part")
+    try:
+        with open(tmp_path, "wb") as buffer:
+            for chunk in iter(lambda: file.file.read(1024 * 1024), b''):
+                digest.update(chunk)
+                buffer.write(chunk)
+        file_path = os.path.join(UPLOADS_DIR, f"{digest.hexdigest()}{extension}")
+        if not os.path.exists(file_path):
+            os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    # Only extract text if PDF
+    if extension == '.pdf':
+        text_path = f"{file_path}.txt"
+        if os.path.exists(text_path):
+            with open(text_path, 'r', encoding='utf-8') as f:
+                return file_path, f.read()
+        try:
+            from pypdf import PdfReader
+            reader = PdfReader(file_path)
+            file_content = "\n".join(page.extract_text() or '' for page in reader.pages)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to extract PDF text: {e}")
+        with open(f"{text_path}.tmp", 'w', encoding='utf-8') as f:
+            f.write(file_content)
+        os.replace(f"{text_path}.tmp", text_path)
+    else:
+        # For non-PDFs, just note the file was uploaded
+        file_content = f"[File '{file.filename}' uploaded, not a PDF]"
+    return file_path, file_content
+
 @app.post('/workflow/start')
 async def start_workflow(
-    deps: dict = Depends(get_project_description)
+    request: Request,
+    deps: dict = Depends(get_project_description),
+    reuse: bool = Query(False, description="Seed from the closest completed near-duplicate and rerun only affected steps"),
 ):
+    user = _workflow_user(request)
+    # Reject before storing any upload when the queue is already full
+    _check_admission(user)
     project_description = deps["project_description"]
-    file = deps["file"]
-    uploads_dir = os.path.join(os.path.dirname(__file__), 'uploads')
-    os.makedirs(uploads_dir, exist_ok=True)
-    file_content = ''
-    file_path = None
-    if file is not None:
-        file_path = os.path.join(uploads_dir, f"{uuid.uuid4()}_{file.filename}")
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        # Only extract text if PDF
-        if file.filename.lower().endswith('.pdf'):
-            try:
-                reader = PdfReader(file_path)
-                file_content = "\n".join(page.extract_text() or '' for page in reader.pages)
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Failed to extract PDF text: {e}")
-        else:
-            # For non-PDFs, just note the file was uploaded
-            file_content = f"[File '{file.filename}' uploaded, not a PDF]"
+    file_path, file_content = _store_upload(deps["file"]) if deps["file"] is not None else (None, '')
     # Combine project description and file content
     combined_description = project_description
     if file_content:
         combined_description += f"\n\n[File Content:]\n{file_content}"
+    # Stored workflows with (nearly) the same description; the first lookup indexes output/
+    near_duplicates = await asyncio.to_thread(duplicates.find, combined_description)
+    reuse_from = next((m["context_id"] for m in near_duplicates if m["status"] == "completed"), None) if reuse else None
     context_id = str(uuid.uuid4())
-    asyncio.create_task(run_risk_workflow(combined_description, context_id))
-    return {"context_id": context_id, "status": "started", "file_saved": bool(file_path), "file_path": file_path}
+    admission = _admit_workflow(context_id, user, combined_description, reuse_from)
+    return {"context_id": context_id, **admission, "file_saved": bool(file_path), "file_path": file_path,
+            "near_duplicates": near_duplicates, "reused_from": reuse_from}
+
+@app.post('/workflows/near-duplicates')
+async def find_near_duplicates(body: ProjectDescriptionBody, threshold: float = Query(None, ge=0.0, le=1.0),
+                               limit: int = Query(5, ge=1, le=50)):
+    """
+    Stored workflows whose description is a near-duplicate of `project_description`, with
+    estimated similarity, before starting a new workflow.
+    """
+    kwargs = {"limit": limit} if threshold is None else {"limit": limit, "threshold": threshold}
+    matches = await asyncio.to_thread(duplicates.find, body.project_description, **kwargs)
+    return {"matches": matches, "index": duplicates.stats()}
 
 @app.get('/workflow/{context_id}')
 def get_workflow(context_id: str = Path(...)):
-    context_path = os.path.join(OUTPUT_DIR, f'workflow_context_{context_id}.json')
-    if not os.path.exists(context_path):
+    # Archived workflows are read from their segment in place
+    context = find_context(context_id)
+    if context is None:
         raise HTTPException(status_code=404, detail="Workflow not found")
-    context = load_context(context_path)
-    return context.to_dict()
+    data = context.to_dict()
+    position = workflow_registry.queue_position(context_id)
+    if position is not None:
+        data["queue_position"] = position
+    return data
+
+@app.delete('/workflow/{context_id}/run')
+async def cancel_workflow_run(context_id: str):
+    """
+    Cancel a queued or running workflow. A running workflow stops at its current model or
+    tool call and is saved with status "cancelled".
+    """
+    context_path = os.path.join(OUTPUT_DIR, f'workflow_context_{context_id}.json')
+    run = workflow_registry.runs.get(context_id)
+    previous = workflow_registry.cancel(context_id)
+    if previous is None:
+        if not os.path.exists(context_path) and context_id not in archive:
+            raise HTTPException(status_code=404, detail="Workflow not found")
+        raise HTTPException(status_code=409, detail="Workflow is not queued or running")
+    if previous == "queued":
+        context = load_context(context_path)
+        context.status = "cancelled"
+        save_context(context, context_path)
+    elif run is not None and run.task is not None:
+        # Give the run a moment to unwind and record its status
+        await asyncio.wait([run.task], timeout=5)
+    return {"status": "cancelled", "context_id": context_id, "previous_state": previous}
+
+@app.get('/workflows/admission')
+def get_admission_stats():
+    """
+    Active and queued workflow counts, per-user usage, limits and the current runs.
+    """
+    return {**workflow_registry.stats(), "runs": [run.to_dict() for run in workflow_registry.runs.values()]}
+
+# --- Batch Workflows ---
+batches = BatchManager(workflow_registry, OUTPUT_DIR)
+
+@app.post('/workflows/batch')
+async def submit_batch(request: Request):
+    """
+    Start one workflow per project. Accepts JSON {"projects": [{"project_description", "name"}],
+    "max_concurrency"} or multipart form data with `files` (one project per file), an optional
+    `projects` field holding the same JSON list, and `max_concurrency`. All workflows share one
+    catalog snapshot; at most max_concurrency of them run at once, further bounded by the
+    caller's admission limits.
+    """
+    user = _workflow_user(request)
+    projects: List[Dict[str, str]] = []
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        max_concurrency = form.get("max_concurrency")
+        try:
+            if form.get("projects"):
+                projects += [p.model_dump() for p in BatchRequest(projects=json.loads(form["projects"])).projects]
+            max_concurrency = int(max_concurrency) if max_concurrency else None
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid batch form: {e}")
+        for upload in form.getlist("files"):
+            _, file_content = _store_upload(upload)
+            projects.append({"name": upload.filename, "project_description": f"[File Content:]\n{file_content}"})
+    else:
+        try:
+            body = BatchRequest(**(await request.json()))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid batch request: {e}")
+        projects = [p.model_dump() for p in body.projects]
+        max_concurrency = body.max_concurrency
+    try:
+        batch = await batches.submit(user, projects, max_concurrency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return batch.to_dict()
+
+@app.get('/workflows/batch/{batch_id}')
+def get_batch(batch_id: str, include_items: bool = Query(True)):
+    """
+    Batch progress: status counts, finished/total and each item's workflow status.
+    """
+    data = batches.get(batch_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if not include_items:
+        data = {k: v for k, v in data.items() if k != "items"}
+    return data
+
+@app.get('/workflows/batch/{batch_id}/results')
+def get_batch_results(batch_id: str, offset: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=200),
+                      status: Optional[str] = Query(None)):
+    """
+    Finished workflows of the batch with their full contexts, available while the batch runs.
+    """
+    page = batches.results(batch_id, offset, limit, status)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return page
+
+@app.get('/workflows/batch/{batch_id}/export')
+def export_batch(batch_id: str):
+    """
+    Stream every finished workflow of the batch as NDJSON.
+    """
+    lines = batches.export(batch_id)
+    if lines is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return StreamingResponse(lines, media_type="application/x-ndjson",
+                             headers={"Content-Disposition": f'attachment; filename="batch_{batch_id}.ndjson"'})
+
+@app.delete('/workflows/batch/{batch_id}')
+def cancel_batch(batch_id: str):
+    """
+    Cancel the batch: queued and running workflows are cancelled and pending ones never start.
+    """
+    if batches.get(batch_id) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    batch = batches.cancel(batch_id)
+    if batch is None or batch.status == "completed":
+        raise HTTPException(status_code=409, detail="Batch is not running")
+    return batch.to_dict(include_items=False)
 
 @app.post('/workflow/{context_id}/feedback/agent')
 async def post_feedback_agent(context_id: str, req: FeedbackRequest):
@@ -162,167 +444,340 @@ async def post_feedback_agent(context_id: str, req: FeedbackRequest):
     Process feedback using the standalone feedback agent. This will update the workflow context holistically.
     """
     try:
-        asyncio.create_task(trigger_feedback_api(context_id, req.step, req.feedback))
+        asyncio.create_task(process_feedback(context_id, req.step, req.feedback))
         return {"status": "feedback processing started"}
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Workflow context not found")
     
+@app.get('/workflows/search')
+def search_workflows(q: str = Query(..., min_length=1), offset: int = Query(0, ge=0),
+                     limit: int = Query(20, ge=1, le=200), status: Optional[str] = Query(None),
+                     decision: Optional[str] = Query(None)):
+    """
+    BM25-ranked full-text search over workflow titles, descriptions, drafts, risks, controls,
+    mitigations and issues, optionally filtered by status or decision.
+    """
+    return {**workflow_search.search(q, offset, limit, status, decision), "index": workflow_search.stats()}
+
+@app.get('/precedents')
+async def search_precedents(q: str = Query(..., min_length=1), kind: str = Query("submissions"),
+                            limit: int = Query(5, ge=1, le=50)):
+    """
+    What the agents' fetch_past_submissions / fetch_past_mitigations / fetch_past_issues
+    tools would return for `q` (kind = submissions, mitigations or issues).
+    """
+    # A workflow started now would pin the current samples
+    view = precedents_for(catalogs.get("samples"))
+    lookups = {"submissions": view.find_submissions, "mitigations": view.find_mitigations,
+               "issues": view.find_issues}
+    if kind not in lookups:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(lookups)}")
+    await asyncio.to_thread(workflow_search.load)
+    return {"query": q, "kind": kind, "results": lookups[kind](q, limit), "corpus": view.stats()}
+
 @app.get('/workflows')
 def list_workflows():
     files = [f for f in os.listdir(OUTPUT_DIR) if f.startswith('workflow_context_') and f.endswith('.json')]
-    return {"workflows": [f.replace('workflow_context_', '').replace('.json', '') for f in files]}
+    live = [f.replace('workflow_context_', '').replace('.json', '') for f in files]
+    return {"workflows": live + sorted(set(archive.ids()) - set(live))}
 
 @app.put('/workflow/{context_id}')
 def update_workflow(context_id: str, updated_context: dict = Body(...)):
     """
     Update the workflow context JSON file with new values. Only allows updating editable fields.
+    An archived workflow is written back to output/ first.
     """
-    context_path = os.path.join(OUTPUT_DIR, f'workflow_context_{context_id}.json')
-    if not os.path.exists(context_path):
+    context_path = restore_context(context_id)
+    if context_path is None:
         raise HTTPException(status_code=404, detail="Workflow not found")
     # Load existing context
     with open(context_path, 'r', encoding='utf-8') as f:
         context = json.load(f)
-    # Define non-editable/system fields
-    non_editable_fields = {'id', 'createdAt', 'context_id'}
+    # Define non-editable/system fields; usage is only written by the runs it accounts for
+    non_editable_fields = {'id', 'createdAt', 'context_id', 'usage'}
     # Update only allowed fields
     for key, value in updated_context.items():
         if key not in non_editable_fields:
             context[key] = value
     # Update timestamp
-    from datetime import datetime
-    context['updatedAt'] = datetime.utcnow().isoformat() + 'Z'
-    # Save updated context
-    with open(context_path, 'w', encoding='utf-8') as f:
-        json.dump(context, f, indent=2)
+    from datetime import datetime, timezone
+    context['updatedAt'] = datetime.now(timezone.utc).isoformat()
+    # Save updated context and keep the output/ indexes current, as save_context does
+    write_context_file(context_path, context)
     return context
 
-# --- Controls Catalog CRUD ---
-CONTROLS_PATH = os.path.join(DATA_DIR, 'controls.json')
+# --- Cost Report ---
+@app.get('/costs')
+async def get_cost_report(status: Optional[str] = Query(None), decision: Optional[str] = Query(None),
+                          top: int = Query(10, ge=0, le=100)):
+    """
+    Model calls, tokens, estimated cost and wall time across stored workflows: totals,
+    per-workflow averages, by route, by step and by status, budget stops, and the most
+    expensive workflows.
+    """
+    await asyncio.to_thread(costs.load)
+    return {**costs.report(status, decision, top), "index": costs.stats()}
+
+# --- Workflow Archive ---
+@app.get('/archive')
+def get_archive_stats():
+    """
+    Archived workflow count and footprint, live files left in output/, deduplicated
+    uploads and the last archiver sweep.
+    """
+    live = [e.stat().st_size for e in os.scandir(OUTPUT_DIR) if e.name.startswith('workflow_context_')] \
+        if os.path.isdir(OUTPUT_DIR) else []
+    uploads = [e.stat().st_size for e in os.scandir(UPLOADS_DIR) if e.is_file()] if os.path.isdir(UPLOADS_DIR) else []
+    return {
+        "archive": archive.stats(),
+        "live": {"workflows": len(live), "bytes": sum(live)},
+        "uploads": {"files": len(uploads), "bytes": sum(uploads)},
+        "last_sweep": getattr(app.state, "last_archive_sweep", None),
+    }
 
+@app.post('/archive/sweep')
+async def sweep_archive(older_than_days: float = Query(ARCHIVE_AFTER_DAYS, ge=0)):
+    """
+    Archive completed workflows not updated for `older_than_days` now, instead of waiting
+    for the background archiver.
+    """
+    return await asyncio.to_thread(_sweep_archive, older_than_days)
+
+# --- Portfolio Analytics ---
+# Risk and control coverage across every saved workflow. `decision` restricts a view to
+# workflows with that final decision (e.g. Approved).
+@app.get('/analytics')
+def get_analytics_summary(decision: Optional[str] = Query(None)):
+    return {**analytics.summary(decision), "index": analytics.stats()}
+
+@app.get('/analytics/coverage')
+def get_analytics_coverage(decision: Optional[str] = Query(None)):
+    """
+    Per catalog risk: how often it is mapped, how often it gets a control, and how well the
+    controls' subriskIds cover the controls actually mapped to it.
+    """
+    return analytics.coverage(decision)
+
+@app.get('/analytics/gaps')
+def get_analytics_gaps(decision: Optional[str] = Query(None), min_workflows: int = Query(5, ge=1),
+                       limit: int = Query(20, ge=1, le=500)):
+    """
+    Rarely mitigated risks, unmapped catalog risks and mapped risk-control pairs missing from subriskIds.
+    """
+    return analytics.gaps(decision, min_workflows, limit)
+
+@app.get('/analytics/controls')
+def get_analytics_controls(decision: Optional[str] = Query(None), limit: int = Query(50, ge=1, le=500)):
+    """
+    Controls ranked by how many workflows rely on them.
+    """
+    return analytics.controls(decision, limit)
+
+@app.get('/analytics/cooccurrence')
+def get_analytics_cooccurrence(risk_id: Optional[str] = Query(None), control_id: Optional[str] = Query(None),
+                               decision: Optional[str] = Query(None), limit: int = Query(10, ge=1, le=200)):
+    """
+    Risks and controls most often found in the same workflows as `risk_id` or `control_id`.
+    """
+    if (risk_id is None) == (control_id is None):
+        raise HTTPException(status_code=400, detail="Pass exactly one of risk_id or control_id")
+    result = analytics.cooccurrence(risk_id, control_id, decision, limit)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Risk or control has not been mapped in any workflow")
+    return result
+
+# --- Controls Catalog CRUD ---
 @app.get('/controls')
-def get_controls():
-    return _load_json(CONTROLS_PATH)
+def get_controls(request: Request):
+    return _catalog_response("controls", request)
 
 @app.post('/controls')
 def add_control(item: ControlItem):
-    controls = _load_json(CONTROLS_PATH)
-    controls.append(item.dict())
-    _save_json(CONTROLS_PATH, controls)
+    catalogs.update("controls", lambda controls: controls.append(item.dict()))
     return {"status": "added", "item": item}
 
 @app.put('/controls/{control_id}')
 def update_control(control_id: str, item: ControlItem):
-    controls = _load_json(CONTROLS_PATH)
-    for idx, c in enumerate(controls):
-        if c.get('id') == control_id:
-            controls[idx] = item.dict()
-            _save_json(CONTROLS_PATH, controls)
-            return {"status": "updated", "item": item}
-    raise HTTPException(status_code=404, detail="Control not found")
+    _replace_item("controls", "id", control_id, item.dict(), "Control not found")
+    return {"status": "updated", "item": item}
 
 @app.delete('/controls/{control_id}')
 def delete_control(control_id: str):
-    controls = _load_json(CONTROLS_PATH)
-    controls = [c for c in controls if c.get('id') != control_id]
-    _save_json(CONTROLS_PATH, controls)
+    _delete_item("controls", "id", control_id)
     return {"status": "deleted"}
 
 # --- Risk Catalog CRUD ---
-RISK_PATH = os.path.join(DATA_DIR, 'risks.json')
-
 @app.get('/risks')
-def get_risks():
-    return _load_json(RISK_PATH)
+def get_risks(request: Request):
+    return _catalog_response("risks", request)
 
 @app.post('/risks')
 def add_risk(item: RiskItem):
-    risks = _load_json(RISK_PATH)
-    risks.append(item.dict())
-    _save_json(RISK_PATH, risks)
+    catalogs.update("risks", lambda risks: risks.append(item.dict()))
     return {"status": "added", "item": item}
 
 @app.put('/risks/{risk_id}')
 def update_risk(risk_id: str, item: RiskItem):
-    risks = _load_json(RISK_PATH)
-    for idx, r in enumerate(risks):
-        if r.get('id') == risk_id:
-            risks[idx] = item.dict()
-            _save_json(RISK_PATH, risks)
-            return {"status": "updated", "item": item}
-    raise HTTPException(status_code=404, detail="Risk not found")
+    _replace_item("risks", "id", risk_id, item.dict(), "Risk not found")
+    return {"status": "updated", "item": item}
 
 @app.delete('/risks/{risk_id}')
 def delete_risk(risk_id: str):
-    risks = _load_json(RISK_PATH)
-    risks = [r for r in risks if r.get('id') != risk_id]
-    _save_json(RISK_PATH, risks)
+    _delete_item("risks", "id", risk_id)
     return {"status": "deleted"}
 
 # --- Past Submissions CRUD ---
-SAMPLES_PATH = os.path.join(DATA_DIR, 'sample_submissions.json')
-
 @app.get('/samples')
-def get_samples():
-    return _load_json(SAMPLES_PATH)
+def get_samples(request: Request):
+    return _catalog_response("samples", request)
 
 @app.post('/samples')
 def add_sample(item: SampleSubmissionItem):
-    samples = _load_json(SAMPLES_PATH)
-    samples.append(item.dict())
-    _save_json(SAMPLES_PATH, samples)
+    catalogs.update("samples", lambda samples: samples.append(item.dict()))
     return {"status": "added", "item": item}
 
 @app.put('/samples/{submissionId}')
 def update_sample(submissionId: str, item: SampleSubmissionItem):
-    samples = _load_json(SAMPLES_PATH)
-    for idx, s in enumerate(samples):
-        if s.get('submissionId') == submissionId:
-            samples[idx] = item.dict()
-            _save_json(SAMPLES_PATH, samples)
-            return {"status": "updated", "item": item}
-    raise HTTPException(status_code=404, detail="Sample not found")
+    _replace_item("samples", "submissionId", submissionId, item.dict(), "Sample not found")
+    return {"status": "updated", "item": item}
 
 @app.delete('/samples/{submissionId}')
 def delete_sample(submissionId: str):
-    samples = _load_json(SAMPLES_PATH)
-    samples = [s for s in samples if s.get('submissionId') != submissionId]
-    _save_json(SAMPLES_PATH, samples)
+    _delete_item("samples", "submissionId", submissionId)
     return {"status": "deleted"}
 
 # --- Guardrails CRUD ---
-GUARDRAILS_PATH = os.path.join(DATA_DIR, 'guardrails.json')
-
 @app.get('/guardrails')
-def get_guardrails():
-    return _load_json(GUARDRAILS_PATH)
+def get_guardrails(request: Request):
+    return _catalog_response("guardrails", request)
 
 @app.post('/guardrails')
 def add_guardrail(item: GuardrailItem):
-    guardrails = _load_json(GUARDRAILS_PATH)
-    guardrails.append(item.dict())
-    _save_json(GUARDRAILS_PATH, guardrails)
+    catalogs.update("guardrails", lambda guardrails: guardrails.append(item.dict()))
     return {"status": "added", "item": item}
 
 @app.put('/guardrails/{guardrail_id}')
 def update_guardrail(guardrail_id: str, item: GuardrailItem):
-    guardrails = _load_json(GUARDRAILS_PATH)
-    for idx, g in enumerate(guardrails):
-        if g.get('id') == guardrail_id:
-            guardrails[idx] = item.dict()
-            _save_json(GUARDRAILS_PATH, guardrails)
-            return {"status": "updated", "item": item}
-    raise HTTPException(status_code=404, detail="Guardrail not found")
+    _replace_item("guardrails", "id", guardrail_id, item.dict(), "Guardrail not found")
+    return {"status": "updated", "item": item}
 
 @app.delete('/guardrails/{guardrail_id}')
 def delete_guardrail(guardrail_id: str):
-    guardrails = _load_json(GUARDRAILS_PATH)
-    guardrails = [g for g in guardrails if g.get('id') != guardrail_id]
-    _save_json(GUARDRAILS_PATH, guardrails)
+    _delete_item("guardrails", "id", guardrail_id)
     return {"status": "deleted"}
 
+@app.get('/catalogs')
+def get_catalog_versions():
+    """
+    Current version, digest, size and ETag of each catalog.
+    """
+    return catalogs.stats()
+
+# --- Bulk Import/Export ---
+BULK_CATALOGS = {
+    "controls": BulkCatalog("controls", ControlItem, "id"),
+    "risks": BulkCatalog("risks", RiskItem, "id"),
+    "samples": BulkCatalog("samples", SampleSubmissionItem, "submissionId"),
+    "guardrails": BulkCatalog("guardrails", GuardrailItem, "id"),
+}
+
+def _bulk_catalog(catalog: str) -> BulkCatalog:
+    if catalog not in BULK_CATALOGS:
+        raise HTTPException(status_code=404, detail=f"Unknown catalog '{catalog}'")
+    return BULK_CATALOGS[catalog]
+
+@app.post('/bulk/{catalog}/import')
+async def bulk_import(
+    catalog: str,
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$"),
+    on_error: str = Query("skip", pattern="^(skip|reject)$"),
+    dry_run: bool = False,
+):
+    """
+    Upsert catalog items from a streamed NDJSON or CSV request body (one item per line or row;
+    nested CSV fields as JSON). Rows are validated in batches and applied in one atomic write.
+    on_error=reject applies nothing if any row fails. Returns a per-row error report.
+    """
+    target = _bulk_catalog(catalog)
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    report = await import_rows(catalogs, target, request.stream(), fmt, on_error=on_error, dry_run=dry_run)
+    return {"catalog": catalog, "format": fmt, **report.to_dict()}
+
+@app.get('/bulk/{catalog}/export')
+def bulk_export(catalog: str):
+    """
+    Stream a catalog as NDJSON, one item per line, from a single snapshot.
+    """
+    _bulk_catalog(catalog)
+    snapshot = catalogs.get(catalog)
+    return StreamingResponse(
+        export_ndjson(snapshot.items),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{catalog}.ndjson"', "ETag": snapshot.etag},
+    )
+
+# --- Health ---
+@app.get('/health/ready')
+def get_ready():
+    """
+    Ready for catalog CRUD, search and analytics; the agents may still be loading.
+    """
+    return {"status": "ready", "catalogs": catalogs.names, "llm": engine_status()}
+
+@app.get('/health/llm')
+def get_llm_ready():
+    """
+    200 once the agents and model client are built, 503 until then.
+    """
+    status = engine_status()
+    return JSONResponse(status_code=200 if status["status"] == "ready" else 503, content=status)
+
+@app.get('/metrics')
+def get_metrics():
+    """
+    Prometheus exposition of step, model, tool, context I/O and HTTP metrics.
+    """
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get('/debug/profiler')
+def get_profiler(limit: int = Query(20, ge=1, le=500), format: str = Query("json")):
+    """
+    Hottest sampled stacks. Use format=folded for flame graph tooling.
+    """
+    if format == "folded":
+        return PlainTextResponse(profiler.folded())
+    return profiler.report(limit)
+
+@app.post('/debug/profiler')
+def toggle_profiler(enabled: bool = Body(..., embed=True), reset: bool = Body(False, embed=True)):
+    """
+    Start or stop the sampling profiler without restarting the service.
+    """
+    if reset:
+        profiler.reset()
+    if enabled:
+        profiler.start()
+    else:
+        profiler.stop()
+    return profiler.report(0)
+
+# --- Model Routing ---
+@app.get('/routing/stats')
+def get_routing_stats():
+    """
+    Per-route model latency and cascade escalation stats.
+    """
+    return {
+        "routes": {name: vars(route) for name, route in MODEL_ROUTES.items()},
+        "stats": get_route_stats(),
+        "hedging": {**vars(HEDGING), "budget_tokens": hedge_budget.tokens,
+                    "throttled_recently": hedge_budget.throttled_recently()},
+    }
+
 @app.post("/openai/realtime-session")
 async def get_realtime_ephemeral_key():
+    import requests
     api_key = os.environ["AZURE_OPENAI_API_KEY"]
     endpoint = os.environ["AZURE_OPENAI_ENDPOINT"].rstrip("/")
     deployment = os.environ["AZURE_OPENAI_REALTIME_DEPLOYMENT"]
@@ -354,20 +809,15 @@ async def get_realtime_ephemeral_key():
     return resp.json()
 
 # --- Conversation Storage Endpoints ---
-CONVERSATIONS_DIR = os.path.join(os.path.dirname(__file__), 'conversations')
+CONVERSATIONS_DIR = os.getenv("RCSA_CONVERSATIONS_DIR") or os.path.join(os.path.dirname(__file__), 'conversations')
+conversation_store = ConversationStore(CONVERSATIONS_DIR)
+intake_summarizer = IntakeSummarizer(conversation_store)
 
 async def analyze_conversation_with_gpt4(messages: List[ConversationMessage]) -> str:
     """
     Use GPT-4 to intelligently analyze the conversation and extract a structured project description.
     """
     try:
-        # Initialize Azure OpenAI client using the same approach as agentic_rcsa.py
-        client = AzureOpenAI(
-            api_key=os.environ["AZURE_OPENAI_API_KEY"],
-            api_version=os.environ.get("AZURE_OPENAI_API_VERSION", "2024-02-01"),
-            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"]
-        )
-        
         # Format conversation for analysis
         conversation_text = ""
         for message in messages:
@@ -399,8 +849,8 @@ Format the output as a professional project description that would be suitable f
 **Please provide a structured project description:**
 """
         
-        response = await client.chat.completions.create(
-            model="gpt-4.1",
+        return await chat_completion(
+            "analyze_conversation",
             messages=[
                 {"role": "system", "content": "You are a project analysis expert who specializes in extracting structured project information from conversations for risk assessment purposes."},
                 {"role": "user", "content": analysis_prompt}
@@ -409,8 +859,6 @@ Format the output as a professional project description that would be suitable f
             max_tokens=2000
         )
         
-        return response.choices[0].message.content
-        
     except Exception as e:
         print(f"Error analyzing conversation with GPT-4: {e}")
         # Fallback to simple concatenation if GPT-4 analysis fails
@@ -424,74 +872,90 @@ Format the output as a professional project description that would be suitable f
 @app.post('/save-conversation')
 async def save_conversation(conversation: ConversationContext):
     """
-    Save conversation context to a JSON file, similar to workflow storage.
+    Save conversation context. Messages already stored are not rewritten; only new ones are appended
+    and queued for the rolling intake summary.
     """
-    # Ensure conversations directory exists
-    os.makedirs(CONVERSATIONS_DIR, exist_ok=True)
-    
-    # Save conversation as JSON file
-    conversation_path = os.path.join(CONVERSATIONS_DIR, f'conversation_{conversation.conversationId}.json')
-    
-    with open(conversation_path, 'w', encoding='utf-8') as f:
-        json.dump(conversation.dict(), f, indent=2)
-    
-    return {"status": "saved", "conversationId": conversation.conversationId, "path": conversation_path}
+    data = conversation.dict()
+    result = conversation_store.save(data)
+    intake_summarizer.submit(conversation.conversationId, data["messages"])
+    return {"status": "saved", "conversationId": conversation.conversationId, **result}
+
+@app.post('/conversations/{conversation_id}/messages')
+async def append_conversation_messages(conversation_id: str, body: AppendMessagesRequest):
+    """
+    Append new messages to a stored conversation, optionally updating its status and metadata.
+    """
+    messages = [m.dict() for m in body.messages]
+    try:
+        result = conversation_store.append(conversation_id, messages, status=body.status, metadata=body.metadata)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    intake_summarizer.submit(conversation_id, messages)
+    return {"status": "appended", "conversationId": conversation_id, **result}
 
 @app.get('/conversations')
-def list_conversations():
+def list_conversations(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    status: Optional[str] = None,
+):
     """
-    List all stored conversations.
+    List stored conversations, most recently updated first. Served from the metadata index.
     """
-    if not os.path.exists(CONVERSATIONS_DIR):
-        return {"conversations": []}
-    
-    files = [f for f in os.listdir(CONVERSATIONS_DIR) if f.startswith('conversation_') and f.endswith('.json')]
-    conversations = []
-    
-    for file in files:
-        conversation_id = file.replace('conversation_', '').replace('.json', '')
-        file_path = os.path.join(CONVERSATIONS_DIR, file)
-        
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                conversation_data = json.load(f)
-                conversations.append({
-                    "conversationId": conversation_id,
-                    "status": conversation_data.get("status", "unknown"),
-                    "messageCount": conversation_data.get("metadata", {}).get("totalMessages", 0),
-                    "createdAt": conversation_data.get("createdAt"),
-                    "updatedAt": conversation_data.get("updatedAt")
-                })
-        except Exception as e:
-            print(f"Error reading conversation {file}: {e}")
-            continue
-    
-    return {"conversations": conversations}
+    conversations, total = conversation_store.list(offset=offset, limit=limit, status=status)
+    return {"conversations": conversations, "total": total, "offset": offset, "limit": limit}
 
 @app.get('/conversations/{conversation_id}')
-def get_conversation(conversation_id: str):
+def get_conversation(conversation_id: str, include_messages: bool = True):
     """
-    Get a specific conversation by ID.
+    Get a specific conversation by ID. Use include_messages=false and the messages endpoint
+    to page through long transcripts.
     """
-    conversation_path = os.path.join(CONVERSATIONS_DIR, f'conversation_{conversation_id}.json')
-    
-    if not os.path.exists(conversation_path):
+    if include_messages:
+        conversation_data = conversation_store.get(conversation_id)
+    else:
+        conversation_data = conversation_store.get_meta(conversation_id)
+    if conversation_data is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    with open(conversation_path, 'r', encoding='utf-8') as f:
-        conversation_data = json.load(f)
-    
     return conversation_data
 
+@app.get('/conversations/{conversation_id}/summary')
+def get_conversation_summary(conversation_id: str):
+    """
+    Current rolling intake summary for a conversation.
+    """
+    if not conversation_store.exists(conversation_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {"conversationId": conversation_id, **intake_summarizer.status(conversation_id)}
+
+@app.get('/conversations/{conversation_id}/messages')
+def get_conversation_messages(
+    conversation_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Page through a conversation's messages in order.
+    """
+    try:
+        messages = conversation_store.messages(conversation_id, offset=offset, limit=limit)
+        total = conversation_store.get_meta(conversation_id)["messageCount"]
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {"conversationId": conversation_id, "messages": messages, "total": total, "offset": offset, "limit": limit}
+
 @app.post('/generate-draft-from-conversation')
-async def generate_draft_from_conversation(request: GenerateDraftFromConversationRequest):
+async def generate_draft_from_conversation(request: GenerateDraftFromConversationRequest, http_request: Request):
     """
-    Generate a project draft from conversation history by using GPT-4 to intelligently analyze 
-    the conversation and extract a structured project description.
+    Generate a project draft from conversation history. The rolling intake summary is finalized
+    with any messages it has not seen yet; the full-transcript analysis is only used when no
+    summary could be produced.
     """
     try:
-        # Use GPT-4 to intelligently analyze the conversation
-        project_description = await analyze_conversation_with_gpt4(request.messages)
+        project_description = await intake_summarizer.finalize(
+            request.conversationId, [m.dict() for m in request.messages])
+        if project_description is None:
+            project_description = await analyze_conversation_with_gpt4(request.messages)
         
         # Add metadata about the conversation source
         project_description += f"\n\n---\n*Generated from conversational intake session: {request.conversationId}*\n*Analysis performed on: {asyncio.get_event_loop().time()}*"
@@ -513,13 +977,14 @@ async def generate_draft_from_conversation(request: GenerateDraftFromConversatio
     # Start a new workflow with the intelligently-analyzed project description
     context_id = str(uuid.uuid4())
     
-    # Start the workflow asynchronously
-    asyncio.create_task(run_risk_workflow(project_description, context_id))
+    # Start the workflow asynchronously, subject to admission limits
+    admission = _admit_workflow(context_id, _workflow_user(http_request), project_description)
     
     # Return the workflow context ID so the frontend can redirect to the workflow view
     return {
         "status": "draft_generation_started",
         "context_id": context_id,
+        "run_status": admission["status"],
         "conversationId": request.conversationId,
         "message": f"Project draft generation started from conversation {request.conversationId}. GPT-4 analysis completed. You can track progress using context ID: {context_id}"
     }
@@ -529,10 +994,7 @@ def delete_conversation(conversation_id: str):
     """
     Delete a conversation.
     """
-    conversation_path = os.path.join(CONVERSATIONS_DIR, f'conversation_{conversation_id}.json')
-    
-    if not os.path.exists(conversation_path):
+    if not conversation_store.delete(conversation_id):
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    os.remove(conversation_path)
+    intake_summarizer.forget(conversation_id)
     return {"status": "deleted", "conversationId": conversation_id}
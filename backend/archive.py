@@ -0,0 +1,317 @@
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from instrumentation import Histogram
+
+# Completed workflows untouched for this long move from output/ into the archive
+ARCHIVE_AFTER_DAYS = float(os.getenv("RCSA_ARCHIVE_AFTER_DAYS", "30"))
+# Seconds between archiver sweeps; 0 disables the background archiver
+ARCHIVE_INTERVAL = float(os.getenv("RCSA_ARCHIVE_INTERVAL", "3600"))
+# A new segment is started once the current one reaches this size
+SEGMENT_BYTES = int(os.getenv("RCSA_ARCHIVE_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+
+ARCHIVE_READ_SECONDS = Histogram(
+    "rcsa_archive_read_seconds", "Time to read one archived workflow context",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05),
+)
+
+
+class WorkflowArchive:
+    """
+    Append-only store for cold workflow contexts under output/archive/. Each context is
+    written as its own gzip member at the end of the current segment file, and a line
+    in index.jsonl records its segment, offset and length, so a read is one seek and one
+    small decompress. Archiving a context again (after it was restored and edited)
+    appends a new record; the index keeps the latest one. A context that also has a live
+    file in output/ is read from that file.
+    """
+
+    def __init__(self, output_dir: str, segment_bytes: int = SEGMENT_BYTES):
+        self.output_dir = output_dir
+        self.archive_dir = os.path.join(output_dir, "archive")
+        self.segment_bytes = segment_bytes
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._segment: Optional[int] = None
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.archive_dir, "index.jsonl")
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.archive_dir, f"segment_{segment:06d}.gz")
+
+    def _live_path(self, context_id: str) -> str:
+        return os.path.join(self.output_dir, f'workflow_context_{context_id}.json')
+
+    # --- Index ---
+    def load(self):
+        """
+        Read the offset index once; afterwards appends keep it current.
+        """
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if os.path.exists(self._index_path):
+                with open(self._index_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # A line cut short by a crash; its segment record is simply unreferenced
+                            continue
+                        self._entries[entry["context_id"]] = entry
+            segments = [int(name[len("segment_"):-len(".gz")]) for name in os.listdir(self.archive_dir)
+                        if name.startswith("segment_") and name.endswith(".gz")] \
+                if os.path.isdir(self.archive_dir) else []
+            self._segment = max(segments, default=0)
+            self._loaded = True
+
+    def __contains__(self, context_id: str) -> bool:
+        self.load()
+        return context_id in self._entries
+
+    def ids(self) -> List[str]:
+        self.load()
+        with self._lock:
+            return list(self._entries)
+
+    # --- Reads ---
+    def _read_entry(self, entry: Dict[str, Any], handle=None) -> Dict[str, Any]:
+        if handle is None:
+            with open(self._segment_path(entry["segment"]), 'rb') as f:
+                return self._read_entry(entry, f)
+        handle.seek(entry["offset"])
+        return json.loads(gzip.decompress(handle.read(entry["length"])))
+
+    def read(self, context_id: str) -> Optional[Dict[str, Any]]:
+        self.load()
+        entry = self._entries.get(context_id)
+        if entry is None:
+            return None
+        started = time.perf_counter()
+        data = self._read_entry(entry)
+        ARCHIVE_READ_SECONDS.observe(time.perf_counter() - started)
+        return data
+
+    def iter_contexts(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Every archived context, read segment by segment in file order.
+        """
+        self.load()
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: (e["segment"], e["offset"]))
+        handle, segment = None, None
+        try:
+            for entry in entries:
+                if entry["segment"] != segment:
+                    if handle is not None:
+                        handle.close()
+                    segment = entry["segment"]
+                    handle = open(self._segment_path(segment), 'rb')
+                yield entry["context_id"], self._read_entry(entry, handle)
+        finally:
+            if handle is not None:
+                handle.close()
+
+    def restore(self, context_id: str) -> bool:
+        """
+        Write an archived context back to output/ so it can be edited in place. Its archive
+        record stays until the archiver appends a newer one.
+        """
+        path = self._live_path(context_id)
+        if os.path.exists(path):
+            return True
+        data = self.read(context_id)
+        if data is None:
+            return False
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+        return True
+
+    # --- Writes ---
+    def _append(self, contexts: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Append a batch of contexts with one fsync per segment touched and one for the index.
+        """
+        records = [gzip.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"), compresslevel=6)
+                   for _, data in contexts]
+        entries = []
+        with self._lock:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            handle = None
+            try:
+                for (context_id, data), record in zip(contexts, records):
+                    path = self._segment_path(self._segment)
+                    size = handle.tell() if handle is not None else \
+                        (os.path.getsize(path) if os.path.exists(path) else 0)
+                    if size and size + len(record) > self.segment_bytes:
+                        if handle is not None:
+                            handle.flush()
+                            os.fsync(handle.fileno())
+                            handle.close()
+                            handle = None
+                        self._segment += 1
+                    if handle is None:
+                        handle = open(self._segment_path(self._segment), 'ab')
+                    decision = data.get("decision_result")
+                    entries.append({
+                        "context_id": context_id,
+                        "segment": self._segment,
+                        "offset": handle.tell(),
+                        "length": len(record),
+                        "status": data.get("status"),
+                        "decision": decision.get("decision") if isinstance(decision, dict) else None,
+                        "updatedAt": data.get("updatedAt"),
+                        "archivedAt": datetime.now(timezone.utc).isoformat(),
+                    })
+                    handle.write(record)
+                if handle is not None:
+                    handle.flush()
+                    os.fsync(handle.fileno())
+            finally:
+                if handle is not None:
+                    handle.close()
+            # Index lines go last, so a crash never leaves an entry pointing at a partial record
+            with open(self._index_path, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+                f.flush()
+                os.fsync(f.fileno())
+            for entry in entries:
+                self._entries[entry["context_id"]] = entry
+        return entries
+
+    def _archive_files(self, batch: List[Tuple[str, str, float, Dict[str, Any]]]) -> List[str]:
+        """
+        Archive (context_id, path, mtime, data) tuples, then remove each live file unless a
+        save touched it meanwhile. Returns the ids that moved.
+        """
+        self._append([(context_id, data) for context_id, _, _, data in batch])
+        moved = []
+        for context_id, path, mtime, _ in batch:
+            try:
+                if os.path.getmtime(path) == mtime:
+                    os.remove(path)
+                    moved.append(context_id)
+            except OSError:
+                pass
+        return moved
+
+    def archive(self, context_id: str) -> bool:
+        """
+        Move one context from output/ into the archive.
+        """
+        self.load()
+        path = self._live_path(context_id)
+        mtime = os.path.getmtime(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return bool(self._archive_files([(context_id, path, mtime, data)]))
+
+    def sweep(self, older_than_days: float = ARCHIVE_AFTER_DAYS, statuses=("completed",),
+              skip: Optional[Callable[[str], bool]] = None, batch_size: int = 256) -> Dict[str, Any]:
+        """
+        Archive every context in `statuses` whose file has not changed for `older_than_days`.
+        Only files past the age cutoff are opened.
+        """
+        self.load()
+        started = time.perf_counter()
+        cutoff = time.time() - older_than_days * 86400
+        archived, examined, bytes_freed = 0, 0, 0
+        batch, sizes = [], {}
+
+        def flush():
+            nonlocal archived, bytes_freed
+            moved = self._archive_files(batch)
+            archived += len(moved)
+            bytes_freed += sum(sizes[context_id] for context_id in moved)
+            batch.clear()
+            sizes.clear()
+
+        if os.path.isdir(self.output_dir):
+            for entry in os.scandir(self.output_dir):
+                name = entry.name
+                if not (name.startswith('workflow_context_') and name.endswith('.json')):
+                    continue
+                try:
+                    stat = entry.stat()
+                    if stat.st_mtime >= cutoff:
+                        continue
+                    context_id = name[len('workflow_context_'):-len('.json')]
+                    if skip is not None and skip(context_id):
+                        continue
+                    examined += 1
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Archiver skipped {name}: {e}")
+                    continue
+                if data.get("status") in statuses:
+                    batch.append((context_id, entry.path, stat.st_mtime, data))
+                    sizes[context_id] = stat.st_size
+                    if len(batch) >= batch_size:
+                        flush()
+            if batch:
+                flush()
+        report = {"archived": archived, "examined": examined, "bytes_freed": bytes_freed,
+                  "seconds": round(time.perf_counter() - started, 3)}
+        if archived:
+            print(f"Archived {archived} workflows ({bytes_freed} bytes) in {report['seconds']}s")
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        self.load()
+        size = 0
+        segments = 0
+        if os.path.isdir(self.archive_dir):
+            for entry in os.scandir(self.archive_dir):
+                size += entry.stat().st_size
+                segments += entry.name.startswith("segment_")
+        with self._lock:
+            return {"workflows": len(self._entries), "segments": segments, "bytes": size,
+                    "after_days": ARCHIVE_AFTER_DAYS, "interval_seconds": ARCHIVE_INTERVAL}
+
+
+# One archive per output directory, shared by the API and the output/ indexes
+_archives: Dict[str, WorkflowArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def get_archive(output_dir: str) -> WorkflowArchive:
+    with _archives_lock:
+        if output_dir not in _archives:
+            _archives[output_dir] = WorkflowArchive(output_dir)
+        return _archives[output_dir]
+
+
+def iter_stored_contexts(output_dir: str, label: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Every stored workflow context: the live files in output/, then the archived ones, so
+    an index that keeps the first copy it sees prefers a restored file over its archived
+    record. Unreadable files are logged under `label` and skipped.
+    """
+    if os.path.isdir(output_dir):
+        for name in os.listdir(output_dir):
+            if not (name.startswith('workflow_context_') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(output_dir, name), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"{label} skipped {name}: {e}")
+                continue
+            yield name[len('workflow_context_'):-len('.json')], data
+    try:
+        yield from get_archive(output_dir).iter_contexts()
+    except (OSError, ValueError) as e:
+        print(f"{label} skipped the archive: {e}")
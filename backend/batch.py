@@ -0,0 +1,302 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from admission import AdmissionRejected, WorkflowRegistry
+from archive import get_archive
+from catalog_repo import CatalogRepository, CatalogSnapshot
+from workflow_store import (
+    OUTPUT_DIR, WorkflowContext, catalogs, context_from_dict, load_context, run_workflow, save_context,
+)
+
+# Default and upper bound for workflows of one batch in flight at once. Runs are also
+# subject to the submitting user's admission limits.
+DEFAULT_BATCH_CONCURRENCY = int(os.getenv("RCSA_BATCH_CONCURRENCY", "4"))
+MAX_BATCH_CONCURRENCY = int(os.getenv("RCSA_MAX_BATCH_CONCURRENCY", "16"))
+MAX_BATCH_SIZE = int(os.getenv("RCSA_MAX_BATCH_SIZE", "1000"))
+# While a batch runs its manifest is rewritten at most this often (seconds); progress
+# queries are answered from memory, the manifest only has to survive a restart
+MANIFEST_INTERVAL = float(os.getenv("RCSA_BATCH_MANIFEST_INTERVAL", "1.0"))
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+@dataclass
+class BatchItem:
+    index: int
+    name: str
+    context_id: str
+    description: str = field(repr=False, default="")
+    status: str = "queued"  # then the workflow's own status
+    decision: Optional[str] = None
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "name": self.name,
+            "context_id": self.context_id,
+            "status": self.status,
+            "decision": self.decision,
+        }
+
+
+@dataclass
+class Batch:
+    batch_id: str
+    user: str
+    max_concurrency: int
+    items: List[BatchItem]
+    catalog_versions: Dict[str, Dict[str, Any]]
+    status: str = "running"  # running, completed, cancelled
+    createdAt: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    updatedAt: Optional[str] = None
+    # Catalog snapshot shared by every workflow in the batch; not persisted
+    snapshot: Optional[Dict[str, CatalogSnapshot]] = field(default=None, repr=False)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    # Manifest writes run in a worker thread, one at a time per batch
+    manifest_lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+    manifest_saved: float = field(default=0.0, repr=False)
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for item in self.items:
+            counts[item.status] = counts.get(item.status, 0) + 1
+        return counts
+
+    def to_dict(self, include_items: bool = True) -> Dict[str, Any]:
+        finished = sum(1 for item in self.items if item.status in TERMINAL_STATUSES)
+        data = {
+            "batch_id": self.batch_id,
+            "user": self.user,
+            "status": self.status,
+            "max_concurrency": self.max_concurrency,
+            "total": len(self.items),
+            "finished": finished,
+            "counts": self.counts(),
+            "catalog_versions": self.catalog_versions,
+            "createdAt": self.createdAt,
+            "updatedAt": self.updatedAt,
+        }
+        if include_items:
+            data["items"] = [item.to_dict() for item in self.items]
+        return data
+
+
+class BatchManager:
+    """
+    Runs many workflows as one batch. All of them share one catalog snapshot, so catalog
+    serialization and derived indexes (such as the guardrail step index) are built once
+    for the whole batch. At most `max_concurrency` of the batch's workflows are handed to
+    the admission registry at a time. Running batches are kept in memory; finished ones are
+    served from their batch_<id>.json manifest. Context and manifest writes run off the
+    event loop.
+    """
+
+    def __init__(self, registry: WorkflowRegistry, output_dir: str = OUTPUT_DIR):
+        self.registry = registry
+        self.output_dir = output_dir
+        self.batches: Dict[str, Batch] = {}
+
+    def _manifest_path(self, batch_id: str) -> str:
+        return os.path.join(self.output_dir, f'batch_{batch_id}.json')
+
+    def _context_path(self, context_id: str) -> str:
+        return os.path.join(self.output_dir, f'workflow_context_{context_id}.json')
+
+    def _save_manifest(self, batch: Batch):
+        batch.updatedAt = datetime.now(timezone.utc).isoformat()
+        path = self._manifest_path(batch.batch_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(batch.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    async def _flush_manifest(self, batch: Batch, force: bool = False):
+        """
+        Save the manifest in a worker thread, at most every MANIFEST_INTERVAL seconds
+        unless `force`d.
+        """
+        if not force and time.monotonic() - batch.manifest_saved < MANIFEST_INTERVAL:
+            return
+        async with batch.manifest_lock:
+            if not force and time.monotonic() - batch.manifest_saved < MANIFEST_INTERVAL:
+                return
+            batch.manifest_saved = time.monotonic()
+            await asyncio.to_thread(self._save_manifest, batch)
+
+    # --- Submission ---
+    def _write_queued(self, batch: Batch):
+        for item in batch.items:
+            # Every workflow is pollable from the start
+            save_context(WorkflowContext(project_description=item.description, status="queued"),
+                         self._context_path(item.context_id))
+        self._save_manifest(batch)
+
+    async def submit(self, user: str, projects: List[Dict[str, str]], max_concurrency: Optional[int] = None) -> Batch:
+        """
+        Create a batch from [{"name", "project_description"}] and start scheduling it.
+        """
+        if not projects:
+            raise ValueError("a batch needs at least one project")
+        if len(projects) > MAX_BATCH_SIZE:
+            raise ValueError(f"a batch may hold at most {MAX_BATCH_SIZE} projects")
+        os.makedirs(self.output_dir, exist_ok=True)
+        snapshot = catalogs.pin()
+        batch = Batch(
+            batch_id=str(uuid.uuid4()),
+            user=user,
+            max_concurrency=max(1, min(max_concurrency or DEFAULT_BATCH_CONCURRENCY, MAX_BATCH_CONCURRENCY)),
+            items=[
+                BatchItem(index=i, name=p.get("name") or f"project-{i + 1}", context_id=str(uuid.uuid4()),
+                          description=p["project_description"])
+                for i, p in enumerate(projects)
+            ],
+            catalog_versions=CatalogRepository.versions(snapshot),
+            snapshot=snapshot,
+        )
+        # Up to MAX_BATCH_SIZE context writes, each indexed by save_context
+        await asyncio.to_thread(self._write_queued, batch)
+        self.batches[batch.batch_id] = batch
+        batch.task = asyncio.create_task(self._run(batch))
+        return batch
+
+    async def _run(self, batch: Batch):
+        semaphore = asyncio.Semaphore(batch.max_concurrency)
+        try:
+            await asyncio.gather(*(self._run_item(batch, item, semaphore) for item in batch.items))
+        except asyncio.CancelledError:
+            batch.status = "cancelled"
+            raise
+        finally:
+            if batch.status == "running":
+                batch.status = "completed"
+            for item in batch.items:
+                if item.status not in TERMINAL_STATUSES:
+                    item.status = "cancelled" if batch.status == "cancelled" else "failed"
+            try:
+                await self._flush_manifest(batch, force=True)
+                # Finished batches are served from their manifest
+                self.batches.pop(batch.batch_id, None)
+            except Exception as e:
+                print(f"Error saving manifest of batch {batch.batch_id}: {e}")
+
+    async def _run_item(self, batch: Batch, item: BatchItem, semaphore: asyncio.Semaphore):
+        # One item's failure must not stop the rest of the batch
+        try:
+            await self._schedule_item(batch, item, semaphore)
+        except Exception as e:
+            print(f"Batch item {item.context_id} failed: {e}")
+            item.status = "failed"
+            try:
+                await asyncio.to_thread(self._end_item, item, "failed")
+            except Exception as e:
+                print(f"Error saving failed batch item {item.context_id}: {e}")
+
+    async def _schedule_item(self, batch: Batch, item: BatchItem, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            if batch.status == "cancelled":
+                await asyncio.to_thread(self._end_item, item, "cancelled")
+                return
+            while True:
+                try:
+                    run = self.registry.submit(
+                        item.context_id, batch.user,
+                        lambda: run_workflow(item.description, item.context_id, catalog_snapshot=batch.snapshot),
+                    )
+                    break
+                except AdmissionRejected as e:
+                    # The admission queue is full; wait for room instead of failing the item
+                    await asyncio.sleep(min(e.retry_after, 5))
+                    if batch.status == "cancelled":
+                        await asyncio.to_thread(self._end_item, item, "cancelled")
+                        return
+            item.status = "in_progress" if run.state == "running" else "queued"
+            state = await run.done
+            try:
+                context = load_context(self._context_path(item.context_id))
+                item.status = context.status if context.status in TERMINAL_STATUSES else state
+                item.decision = (context.decision_result or {}).get("decision")
+            except Exception as e:
+                print(f"Error reading batch item {item.context_id}: {e}")
+                item.status = "failed"
+            if state == "cancelled" and item.status != "cancelled":
+                await asyncio.to_thread(self._end_item, item, "cancelled")
+            await self._flush_manifest(batch)
+
+    def _end_item(self, item: BatchItem, status: str):
+        # Also ends the workflow's own context if it never got that far
+        item.status = status
+        path = self._context_path(item.context_id)
+        if os.path.exists(path):
+            context = load_context(path)
+            if context.status not in TERMINAL_STATUSES:
+                context.status = status
+                save_context(context, path)
+
+    def cancel(self, batch_id: str) -> Optional[Batch]:
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+        if batch.status == "running":
+            batch.status = "cancelled"
+            for item in batch.items:
+                if item.status not in TERMINAL_STATUSES:
+                    self.registry.cancel(item.context_id)
+        return batch
+
+    # --- Progress and Results ---
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        batch = self.batches.get(batch_id)
+        if batch is not None:
+            return batch.to_dict()
+        path = self._manifest_path(batch_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _finished_items(self, batch_id: str, status: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        data = self.get(batch_id)
+        if data is None:
+            return None
+        wanted = (status,) if status else TERMINAL_STATUSES
+        return [item for item in data["items"] if item["status"] in wanted]
+
+    def _result(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        path = self._context_path(item["context_id"])
+        if os.path.exists(path):
+            return {**item, "context": load_context(path).to_dict()}
+        # Workflows of an older batch may have been archived since
+        data = get_archive(self.output_dir).read(item["context_id"])
+        if data is None:
+            raise FileNotFoundError(path)
+        return {**item, "context": context_from_dict(data).to_dict()}
+
+    def results(self, batch_id: str, offset: int = 0, limit: int = 20,
+                status: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        A page of finished workflows with their full contexts; partial while the batch runs.
+        """
+        items = self._finished_items(batch_id, status)
+        if items is None:
+            return None
+        page = [self._result(item) for item in items[offset:offset + limit]]
+        return {"batch_id": batch_id, "total": len(items), "offset": offset, "limit": limit, "results": page}
+
+    def export(self, batch_id: str) -> Optional[Iterator[bytes]]:
+        """
+        NDJSON of every finished workflow, one context loaded at a time.
+        """
+        items = self._finished_items(batch_id)
+        if items is None:
+            return None
+
+        def _lines():
+            for item in items:
+                yield (json.dumps(self._result(item)) + "\n").encode("utf-8")
+        return _lines()
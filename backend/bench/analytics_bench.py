@@ -0,0 +1,141 @@
+"""
+Benchmarks the portfolio analytics index at a large number of workflows.
+
+Generates N synthetic workflow contexts whose risk and control mappings are drawn from the
+real catalogs (plus some free-text risks that match no catalog entry), indexes them through
+`analytics.observe` as saves would, and times each /analytics view against the same
+coverage computed with plain Python loops over the contexts. No model calls are made.
+
+    cd backend
+    python -m bench.analytics_bench --workflows 100000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+
+from bench.load_test import configure_backend
+
+
+def make_context(rng: random.Random, risks, controls, decision_rate: float = 0.7):
+    risk_mapping, controls_mapping = [], []
+    for risk in rng.sample(risks, rng.randint(2, 6)):
+        if rng.random() < 0.9:
+            text, levels = risk["category_level_3"], [risk[f"category_level_{n}"] for n in (1, 2, 3)]
+        else:
+            text, levels = f"Bespoke project risk {rng.randint(0, 500)}", ["Other", None, "Other"]
+        risk_mapping.append({
+            "risk": text, "category_level_1": levels[0], "category_level_2": levels[1],
+            "category_level_3": levels[2], "confidence": round(rng.random(), 2),
+        })
+        # Most risks get one or two controls, some none
+        if rng.random() < 0.8:
+            linked = [c for c in controls if risk["id"] in c["subriskIds"]]
+            pool = linked if linked and rng.random() < 0.7 else controls
+            chosen = rng.sample(pool, min(len(pool), rng.randint(1, 2)))
+            controls_mapping.append({"risk": text, "controls": [
+                {"control_id": c["id"], "name": c["name"], "relevance_score": round(rng.random(), 2)} for c in chosen
+            ]})
+    return {
+        "risk_mapping": risk_mapping,
+        "controls_mapping": controls_mapping,
+        "decision_result": {"decision": "Approved" if rng.random() < decision_rate else "Rejected"},
+    }
+
+
+def python_coverage(contexts, risks):
+    """
+    Per-risk mapped and mitigated workflow counts the way a loop over output/ would compute them.
+    """
+    by_l3 = {}
+    for risk in risks:
+        by_l3.setdefault(risk["category_level_3"].casefold(), risk["id"])
+    mapped, mitigated = {}, {}
+    for data in contexts:
+        with_controls = {item["risk"] for item in data["controls_mapping"] if item["controls"]}
+        for item in data["risk_mapping"]:
+            rid = by_l3.get((item.get("category_level_3") or "").casefold())
+            if rid is None:
+                continue
+            mapped[rid] = mapped.get(rid, 0) + 1
+            if item["risk"] in with_controls:
+                mitigated[rid] = mitigated.get(rid, 0) + 1
+    return mapped, mitigated
+
+
+def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(samples), 3), "max_ms": round(max(samples), 3)}
+
+
+def run(args):
+    import workflow_store
+    analytics = workflow_store.analytics
+    analytics._loaded = True  # nothing on disk to scan
+    risks = list(workflow_store.catalogs.get("risks").items)
+    controls = list(workflow_store.catalogs.get("controls").items)
+    rng = random.Random(args.seed)
+    contexts = [make_context(rng, risks, controls) for _ in range(args.workflows)]
+
+    report = {"workflows": args.workflows}
+    started = time.perf_counter()
+    for i, data in enumerate(contexts):
+        analytics.observe(f"wf-{i}", data)
+    elapsed = time.perf_counter() - started
+    report["index_build"] = {"seconds": round(elapsed, 3), "workflows_per_second": round(args.workflows / elapsed)}
+    report["index"] = analytics.stats()
+
+    # A save that changes one workflow's mappings, and one that does not
+    changed = make_context(rng, risks, controls)
+    report["incremental_update_changed"] = timed(lambda: analytics.observe("wf-0", changed) or
+                                                 analytics.observe("wf-0", contexts[0]), args.repeat)
+    report["incremental_update_unchanged"] = timed(lambda: analytics.observe("wf-1", contexts[1]), args.repeat)
+
+    top_risk = risks[0]["id"]
+    views = {
+        "summary": lambda: analytics.summary(),
+        "coverage": lambda: analytics.coverage(),
+        "coverage_approved": lambda: analytics.coverage("Approved"),
+        "gaps": lambda: analytics.gaps(),
+        "controls": lambda: analytics.controls(),
+        "cooccurrence_risk": lambda: analytics.cooccurrence(risk_id=top_risk),
+        "cooccurrence_control": lambda: analytics.cooccurrence(control_id=controls[0]["id"]),
+    }
+    report["queries"] = {name: timed(fn, args.repeat) for name, fn in views.items()}
+    # Views are cached until the next save; this measures the first query after one
+    flip = [changed, contexts[2]]
+    report["queries"]["coverage_after_save"] = timed(
+        lambda: (analytics.observe("wf-2", flip.reverse() or flip[0]), analytics.coverage()), args.repeat)
+    report["python_loop_coverage"] = timed(lambda: python_coverage(contexts, risks), max(1, args.repeat // 5))
+    report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Portfolio analytics index benchmark")
+    parser.add_argument("--workflows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per query")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_backend("http://127.0.0.1:9", os.path.join(tmp, "output"))
+        report = run(args)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
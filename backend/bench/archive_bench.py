@@ -0,0 +1,140 @@
+"""
+Benchmarks the workflow archive: disk footprint before and after archiving, sweep
+throughput and how long reading one archived context takes compared with a live file.
+
+Writes N synthetic completed workflow contexts to a scratch output/ directory the way
+save_context does (indented JSON), backdates them past the archive threshold, sweeps them
+into segments and reads a sample back at random. No model calls are made.
+
+    cd backend
+    python -m bench.archive_bench --workflows 20000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+
+from archive import WorkflowArchive
+from bench.analytics_bench import make_context
+
+
+def make_workflow(rng: random.Random, risks, controls, words):
+    data = make_context(rng, risks, controls)
+    text = lambda n: " ".join(rng.choices(words, k=n))
+    data.update({
+        "project_description": text(rng.randint(80, 300)),
+        "draft_submission": {"project_title": text(4), "summary": text(60), "scope": text(40)},
+        "mitigation_proposals": [{"risk": m["risk"], "mitigation": text(30)} for m in data["risk_mapping"]],
+        "issues_list": [{"issue": text(15), "severity": rng.choice(["Low", "Medium", "High"])} for _ in range(3)],
+        "ui_updates": [{"step": s, "status": "completed", "message": text(10)} for s in range(12)],
+        "step_metrics": {s: {"seconds": round(rng.random() * 5, 3), "calls": 1, "tokens": rng.randint(500, 5000)}
+                         for s in ("generate_draft", "map_risks", "map_controls", "generate_mitigations")},
+        "status": "completed",
+        "createdAt": "2026-01-01T00:00:00+00:00",
+        "updatedAt": "2026-01-01T00:10:00+00:00",
+    })
+    return data
+
+
+def directory_bytes(path: str) -> int:
+    return sum(e.stat().st_size for e in os.scandir(path) if e.is_file()) if os.path.isdir(path) else 0
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 4),
+        "p99_ms": round(ordered[int(len(ordered) * 0.99) - 1] * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+    with open(os.path.join(data_dir, 'risks.json'), 'r', encoding='utf-8') as f:
+        risks = json.load(f)
+    with open(os.path.join(data_dir, 'controls.json'), 'r', encoding='utf-8') as f:
+        controls = json.load(f)
+    words = [f"term{i}" for i in range(args.vocabulary)]
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        old = time.time() - 60 * 86400
+        ids = [f"wf-{i:06d}" for i in range(args.workflows)]
+        for context_id in ids:
+            path = os.path.join(output_dir, f'workflow_context_{context_id}.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(make_workflow(rng, risks, controls, words), f, indent=2)
+            os.utime(path, (old, old))
+        live_bytes = directory_bytes(output_dir)
+
+        # Live reads, for comparison, before the files are moved away
+        sample = rng.sample(ids, min(args.reads, len(ids)))
+        live_reads = []
+        for context_id in sample:
+            started = time.perf_counter()
+            with open(os.path.join(output_dir, f'workflow_context_{context_id}.json'), 'r', encoding='utf-8') as f:
+                json.load(f)
+            live_reads.append(time.perf_counter() - started)
+
+        archive = WorkflowArchive(output_dir, segment_bytes=args.segment_mb * 1024 * 1024)
+        sweep = archive.sweep(older_than_days=30)
+        archived_bytes = directory_bytes(archive.archive_dir)
+
+        # A fresh instance, as after a restart: only the offset index is read
+        cold = WorkflowArchive(output_dir)
+        started = time.perf_counter()
+        cold.load()
+        index_load = time.perf_counter() - started
+
+        archived_reads = []
+        for context_id in sample:
+            started = time.perf_counter()
+            cold.read(context_id)
+            archived_reads.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        scanned = sum(1 for _ in cold.iter_contexts())
+        scan = time.perf_counter() - started
+
+        return {
+            "workflows": args.workflows,
+            "footprint": {
+                "live_bytes": live_bytes,
+                "archived_bytes": archived_bytes,
+                "ratio": round(live_bytes / archived_bytes, 2) if archived_bytes else None,
+                "live_files_left": sum(1 for n in os.listdir(output_dir) if n.startswith('workflow_context_')),
+                "segments": cold.stats()["segments"],
+            },
+            "sweep": {**sweep, "workflows_per_second": round(sweep["archived"] / sweep["seconds"]) if sweep["seconds"] else None},
+            "index_load_ms": round(index_load * 1000, 3),
+            "read_live": percentiles(live_reads),
+            "read_archived": percentiles(archived_reads),
+            "full_scan": {"workflows": scanned, "seconds": round(scan, 3)},
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Workflow archive footprint and read latency benchmark")
+    parser.add_argument("--workflows", type=int, default=20000)
+    parser.add_argument("--reads", type=int, default=2000, help="Random contexts read back from each tier")
+    parser.add_argument("--segment-mb", type=int, default=64)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmarks bulk catalog import/export against item-by-item CRUD.
+
+Copies the data catalogs to a temporary directory, streams a generated N-row risk catalog
+through POST /bulk/risks/import as NDJSON and as CSV, exports it back through
+GET /bulk/risks/export, and times a smaller run of single POST /risks calls for comparison.
+No model calls are made.
+
+    cd backend
+    python -m bench.bulk_import_bench --rows 50000
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from bench.load_test import configure_backend
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_risk(i: int, revision: int = 0):
+    return {
+        "id": f"BENCH{i}",
+        "category_level_1": "Technology Risk",
+        "category_level_2": "Unreliable Technology Systems, Solutions or Services",
+        "category_level_3": "Failure in Technology Operations",
+        "risk_statement": f"Benchmark risk {i} (revision {revision}): systems fail to operate as designed.",
+        "principal_risk_bucket": "Operational Risk",
+    }
+
+
+def ndjson_body(rows: int, revision: int = 0) -> bytes:
+    return "".join(json.dumps(make_risk(i, revision)) + "\n" for i in range(rows)).encode("utf-8")
+
+
+def csv_body(rows: int, revision: int = 0) -> bytes:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(make_risk(0)))
+    writer.writeheader()
+    for i in range(rows):
+        writer.writerow(make_risk(i, revision))
+    return out.getvalue().encode("utf-8")
+
+
+async def _chunked(body: bytes, chunk_size: int = 64 * 1024):
+    for start in range(0, len(body), chunk_size):
+        yield body[start:start + chunk_size]
+
+
+async def run(args):
+    import httpx
+    import api
+
+    transport = httpx.ASGITransport(app=api.app)
+    report = {"rows": args.rows}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for label, fmt, body in (
+            ("ndjson_insert", "ndjson", ndjson_body(args.rows)),
+            ("csv_upsert", "csv", csv_body(args.rows, revision=1)),
+        ):
+            started = time.perf_counter()
+            resp = await client.post(f"/bulk/risks/import?format={fmt}", content=_chunked(body))
+            resp.raise_for_status()
+            result = resp.json()
+            report[label] = {
+                "seconds": round(time.perf_counter() - started, 3),
+                "rows_per_second": round(args.rows / (time.perf_counter() - started)),
+                "inserted": result["inserted"], "updated": result["updated"], "failed": result["failed"],
+            }
+
+        bad = ndjson_body(10) + b'{"id": "BROKEN"}\nnot json\n'
+        resp = await client.post("/bulk/risks/import?on_error=reject", content=bad)
+        report["reject_on_error"] = {k: resp.json()[k] for k in ("received", "failed", "applied")}
+
+        started = time.perf_counter()
+        lines = 0
+        async with client.stream("GET", "/bulk/risks/export") as resp:
+            async for line in resp.aiter_lines():
+                if line:
+                    lines += 1
+        report["ndjson_export"] = {"seconds": round(time.perf_counter() - started, 3), "rows": lines}
+
+        started = time.perf_counter()
+        for i in range(args.single_rows):
+            resp = await client.post("/risks", json=make_risk(args.rows + i))
+            resp.raise_for_status()
+        elapsed = time.perf_counter() - started
+        report["single_post"] = {
+            "rows": args.single_rows,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(args.single_rows / elapsed),
+        }
+    report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk catalog import/export benchmark")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--single-rows", type=int, default=50,
+                        help="Rows written one POST at a time for comparison (each rewrites the whole file)")
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, "data")
+        shutil.copytree(os.path.join(BACKEND_DIR, "data"), data_dir)
+        configure_backend("http://127.0.0.1:9", os.path.join(tmp, "output"))
+        os.environ["RCSA_DATA_DIR"] = data_dir
+        report = asyncio.run(run(args))
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmarks near-duplicate detection at tens of thousands of stored workflows.
+
+Indexes N synthetic project descriptions in a NearDuplicateIndex, then looks up lightly
+edited copies of some of them (expected hits) and fresh descriptions (expected misses).
+Reports signature and LSH lookup latency separately, with recall and false positives.
+No model calls are made and nothing is written to disk.
+
+    cd backend
+    python -m bench.dedup_bench --workflows 50000
+"""
+import argparse
+import json
+import random
+import resource
+import statistics
+import time
+
+from dedup import NearDuplicateIndex, text_digest
+
+
+def make_description(rng: random.Random, vocabulary, words: int) -> str:
+    sentences = []
+    while sum(len(s.split()) for s in sentences) < words:
+        sentences.append(" ".join(rng.choices(vocabulary, k=rng.randint(8, 18))).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def edit(rng: random.Random, text: str, vocabulary, fraction: float) -> str:
+    """
+    Replace about `fraction` of the words, as a resubmission with small edits would.
+    """
+    words = text.split()
+    for i in rng.sample(range(len(words)), max(1, int(len(words) * fraction))):
+        words[i] = rng.choice(vocabulary)
+    return " ".join(words)
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 4),
+        "p99_ms": round(ordered[int(len(ordered) * 0.99) - 1] * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    vocabulary = [f"{rng.choice('bcdfghjklmnprstvz')}{rng.choice('aeiou')}{rng.choice('bcdfghjklmnprstvz')}"
+                  f"{rng.choice('aeiou')}{i}" for i in range(args.vocabulary)]
+    index = NearDuplicateIndex(output_dir="")
+    index._loaded = True  # nothing on disk to scan
+
+    descriptions = [make_description(rng, vocabulary, rng.randint(80, 300)) for _ in range(args.workflows)]
+    started = time.perf_counter()
+    for i, text in enumerate(descriptions):
+        index.observe(f"wf-{i}", {"project_description": text, "status": "completed"})
+    elapsed = time.perf_counter() - started
+    report = {
+        "workflows": args.workflows,
+        "index_build": {"seconds": round(elapsed, 3), "workflows_per_second": round(args.workflows / elapsed)},
+        "index": index.stats(),
+    }
+
+    originals = rng.sample(range(args.workflows), args.queries)
+    edited = [edit(rng, descriptions[i], vocabulary, args.edit_fraction) for i in originals]
+    fresh = [make_description(rng, vocabulary, rng.randint(80, 300)) for _ in range(args.queries)]
+
+    signature_times, lookup_times, hits, false_positives, similarities = [], [], 0, 0, []
+    for expected, text in [(f"wf-{i}", t) for i, t in zip(originals, edited)] + [(None, t) for t in fresh]:
+        started = time.perf_counter()
+        signature = index.signature(text)
+        signature_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        matches = index.lookup(signature, text_digest(text))
+        lookup_times.append(time.perf_counter() - started)
+        if expected is None:
+            false_positives += bool(matches)
+        elif matches and matches[0]["context_id"] == expected:
+            hits += 1
+            similarities.append(matches[0]["similarity"])
+    report["edit_fraction"] = args.edit_fraction
+    report["recall"] = round(hits / args.queries, 4)
+    report["mean_similarity_of_hits"] = round(statistics.mean(similarities), 3) if similarities else None
+    report["false_positive_rate"] = round(false_positives / args.queries, 4)
+    report["signature"] = percentiles(signature_times)
+    report["lookup"] = percentiles(lookup_times)
+    report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate detection benchmark")
+    parser.add_argument("--workflows", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=1000, help="Edited copies and fresh descriptions each")
+    parser.add_argument("--edit-fraction", type=float, default=0.03, help="Share of words changed in the edited copies")
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
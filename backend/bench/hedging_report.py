@@ -0,0 +1,91 @@
+"""
+Measures what request hedging buys against the mock server's heavy-tailed latency profile.
+
+Runs the same load twice, hedging off then on, and reports step and workflow tail latency
+alongside the extra model requests hedging cost.
+
+    cd backend
+    python -m bench.hedging_report --workflows 30 --time-scale 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+from types import SimpleNamespace
+
+from bench.load_test import configure_backend, run_load
+from bench.mock_openai_server import MockConfig, MockOpenAI, MockServerThread
+
+
+def _hedge_counts():
+    from hedging import HEDGES
+    totals = {}
+    for (route, outcome), value in HEDGES._values.items():
+        totals[outcome] = totals.get(outcome, 0) + value
+    return totals
+
+
+async def _measure(args, mock: MockOpenAI, hedging_on: bool):
+    from hedging import HEDGING, budget
+    HEDGING.enabled = hedging_on
+    budget.tokens = HEDGING.budget_burst
+    mock.rng = random.Random(mock.config.seed)
+    requests_before = mock.stats["requests"]
+    hedges_before = _hedge_counts()
+    load_args = SimpleNamespace(
+        workflows=args.workflows, concurrency=args.concurrency, profile="heavy_tail",
+        time_scale=args.time_scale, error_rate=0.0, small_malformed_rate=0.0, poll_interval=0.02,
+        timeout=args.timeout,
+    )
+    report = await run_load(load_args)
+    hedges_after = _hedge_counts()
+    return {
+        "hedging": hedging_on,
+        "completed": report["completed"],
+        "step_latency": report["step_latency"],
+        "workflow_latency": report["workflow_latency"],
+        "model_requests": mock.stats["requests"] - requests_before,
+        "hedges": {k: v - hedges_before.get(k, 0) for k, v in hedges_after.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hedging effectiveness against heavy-tailed latency")
+    parser.add_argument("--workflows", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    mock = MockOpenAI(MockConfig(profile="heavy_tail", time_scale=args.time_scale))
+    with tempfile.TemporaryDirectory() as output_dir, MockServerThread(mock) as server:
+        configure_backend(server.endpoint, output_dir)
+        from hedging import HEDGING
+        # Scale the hedge floor with the simulated latency
+        HEDGING.min_delay = 0.5 * args.time_scale
+        baseline = asyncio.run(_measure(args, mock, hedging_on=False))
+        hedged = asyncio.run(_measure(args, mock, hedging_on=True))
+
+    def _ratio(key, pct):
+        before, after = baseline[key][pct], hedged[key][pct]
+        return (after / before) if before and after else None
+
+    report = {
+        "without_hedging": baseline,
+        "with_hedging": hedged,
+        "step_p95_ratio": _ratio("step_latency", "p95"),
+        "step_p99_ratio": _ratio("step_latency", "p99"),
+        "workflow_p95_ratio": _ratio("workflow_latency", "p95"),
+        "request_amplification": (hedged["model_requests"] / baseline["model_requests"])
+        if baseline["model_requests"] else None,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Offline load test for the workflow API.
+
+Starts the mock Azure OpenAI server on localhost, points the backend at it, drives N
+concurrent workflows through POST /workflow/start in-process and reports step latency
+percentiles (from the step_metrics each workflow records), workflows per minute, event
+loop lag and memory. No network access needed.
+
+With --small-malformed-rate the mock answers that share of small-tier calls with broken
+JSON. The run then also reports escalations per route and fails unless both cascade paths
+(agents through RoutedChatCompletionsModel, helper tools through chat_completion) escalated
+and every workflow still completed.
+
+    cd backend
+    python -m bench.load_test --workflows 50 --profile realistic --time-scale 0.05
+    python -m bench.load_test --baseline bench/baseline.json            # fail on regression
+    python -m bench.load_test --write-baseline bench/baseline.json
+    python -m bench.load_test --small-malformed-rate 0.3 --repeat 1    # exercise the cascade
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from bench.mock_openai_server import MockConfig, MockOpenAI, MockServerThread, PROFILES
+
+# Small-tier routes with a cascade: agents, and the helper tools that call chat_completion
+AGENT_CASCADE_ROUTES = {"qa_agent", "guardrail_agent"}
+CASCADE_ROUTES = AGENT_CASCADE_ROUTES | {"json_repair", "evaluate_guardrails", "intake_summary"}
+
+STEPS = ["generate_draft", "map_risks", "map_controls", "generate_mitigations", "flag_issues", "evaluate_decision"]
+
+# Metrics compared against the baseline and whether lower is better
+BASELINE_METRICS = {
+    "step_latency_p95": True,
+    "workflow_latency_p95": True,
+    "workflows_per_minute": False,
+    "loop_lag_p99": True,
+}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {"p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99),
+            "max": max(values) if values else None, "count": len(values)}
+
+
+def routing_delta(before: Dict[str, tuple]) -> Dict[str, Dict[str, Any]]:
+    """
+    Calls and escalations per route since `before` (route -> (calls, escalations)).
+    """
+    from model_routing import ROUTE_STATS
+    routes = {}
+    for name, stats in ROUTE_STATS.items():
+        calls = stats.calls - before.get(name, (0, 0))[0]
+        escalations = stats.escalations - before.get(name, (0, 0))[1]
+        if calls:
+            routes[name] = {"calls": calls, "escalations": escalations, "escalation_rate": escalations / calls}
+    return routes
+
+
+async def probe_helper_cascade(count: int):
+    """
+    Helper tools call the model through chat_completion rather than an agent; send `count`
+    JSON repairs through it so its escalation path is exercised too.
+    """
+    from model_routing import chat_completion
+    messages = [
+        {"role": "system", "content": "You fix JSON so it matches the expected schema."},
+        {"role": "user", "content": '[{"issue": "No SLA defined for vendor", "severity": "High"'},
+    ]
+    await asyncio.gather(*[chat_completion("json_repair", messages) for _ in range(count)])
+
+
+def configure_backend(endpoint: str, output_dir: str):
+    """
+    Point the backend at the mock before it is imported; deployments and output/ are read at import time.
+    """
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": endpoint,
+        "AZURE_OPENAI_API_KEY": "mock-key",
+        "AZURE_OPENAI_API_VERSION": "2024-08-01-preview",
+        "AZURE_OPENAI_DEPLOYMENT": "large",
+        "AZURE_OPENAI_SMALL_DEPLOYMENT": "small",
+        "RCSA_OUTPUT_DIR": output_dir,
+    })
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def drive_workflow(client, description: str, poll_interval: float, timeout: float,
+                         user: str = "bench") -> Dict[str, Any]:
+    """
+    Start one workflow and poll it like the frontend does; step timings come from the
+    per-step metrics the workflow records in its context.
+    """
+    started = time.perf_counter()
+    resp = await client.post("/workflow/start", json={"project_description": description},
+                             headers={"X-User-Id": user})
+    resp.raise_for_status()
+    context_id = resp.json()["context_id"]
+    ctx: Dict[str, Any] = {}
+    while time.perf_counter() - started < timeout:
+        await asyncio.sleep(poll_interval)
+        r = await client.get(f"/workflow/{context_id}")
+        if r.status_code != 200:
+            continue
+        ctx = r.json()
+        if ctx.get("status") in ("completed", "failed", "cancelled"):
+            break
+    step_metrics = ctx.get("step_metrics", {})
+    return {
+        "context_id": context_id,
+        "status": ctx.get("status", "unknown"),
+        "total": time.perf_counter() - started,
+        "steps": {step: m["wall_seconds"] for step, m in step_metrics.items() if step in STEPS},
+        "model_calls": sum(m["model_calls"] for m in step_metrics.values()),
+        "tokens": sum(m["prompt_tokens"] + m["completion_tokens"] for m in step_metrics.values()),
+    }
+
+
+async def run_load(args) -> Dict[str, Any]:
+    import httpx
+    import api
+    from model_routing import ROUTE_STATS
+
+    routes_before = {name: (stats.calls, stats.escalations) for name, stats in ROUTE_STATS.items()}
+    transport = httpx.ASGITransport(app=api.app, raise_app_exceptions=False)
+    monitor = LoopLagMonitor()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        monitor.start()
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def _one(i: int):
+            async with semaphore:
+                return await drive_workflow(
+                    client, f"Benchmark project {i}: vendor-hosted analytics platform for customer data.",
+                    args.poll_interval, args.timeout, user=f"bench-user-{i}",
+                )
+
+        results = await asyncio.gather(*[_one(i) for i in range(args.workflows)])
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+    if args.small_malformed_rate:
+        await probe_helper_cascade(args.workflows)
+    routing = routing_delta(routes_before)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    completed = [r for r in results if r["status"] == "completed"]
+    per_step = {step: summarize([r["steps"][step] for r in results if step in r["steps"]]) for step in STEPS}
+    all_steps = [v for r in results for v in r["steps"].values()]
+    return {
+        "config": {
+            "workflows": args.workflows, "concurrency": args.concurrency, "profile": args.profile,
+            "time_scale": args.time_scale, "error_rate": args.error_rate,
+            "small_malformed_rate": args.small_malformed_rate,
+        },
+        "completed": len(completed),
+        "failed": len(results) - len(completed),
+        "elapsed_seconds": elapsed,
+        "workflows_per_minute": len(completed) / elapsed * 60 if elapsed else 0.0,
+        "workflow_latency": summarize([r["total"] for r in completed]),
+        "step_latency": summarize(all_steps),
+        "step_latency_by_step": per_step,
+        "model_calls_per_workflow": summarize([r["model_calls"] for r in completed]),
+        "tokens_per_workflow": summarize([r["tokens"] for r in completed]),
+        "loop_lag": summarize(monitor.samples),
+        "routing": routing,
+        "escalations": sum(r["escalations"] for r in routing.values()),
+        # Share of calls on cascaded routes that were retried on the large tier
+        "escalation_rate": sum(r["escalations"] for r in routing.values())
+        / max(1, sum(r["calls"] for name, r in routing.items() if name in CASCADE_ROUTES)),
+        "max_rss_kb": rss_after,
+        "rss_growth_kb": rss_after - rss_before,
+    }
+
+
+def check_cascade(reports: List[Dict[str, Any]]) -> List[str]:
+    """
+    With malformed small-tier answers, both cascade paths must escalate and every
+    workflow must still complete.
+    """
+    problems = []
+    for i, report in enumerate(reports):
+        routing = report["routing"]
+        agent_escalations = sum(r["escalations"] for name, r in routing.items() if name in AGENT_CASCADE_ROUTES)
+        helper_escalations = routing.get("json_repair", {}).get("escalations", 0)
+        if not agent_escalations:
+            problems.append(f"run {i}: no agent escalations (RoutedChatCompletionsModel)")
+        if not helper_escalations:
+            problems.append(f"run {i}: no helper escalations (chat_completion)")
+        if report["failed"]:
+            problems.append(f"run {i}: {report['failed']} workflows did not complete")
+    return problems
+
+
+def flatten_for_baseline(report: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    return {
+        "step_latency_p95": report["step_latency"]["p95"],
+        "workflow_latency_p95": report["workflow_latency"]["p95"],
+        "workflows_per_minute": report["workflows_per_minute"],
+        "loop_lag_p99": report["loop_lag"]["p99"],
+    }
+
+
+def compare_to_baseline(current: Dict[str, Optional[float]], baseline: Dict[str, Optional[float]], tolerance: float):
+    regressions = []
+    for name, lower_is_better in BASELINE_METRICS.items():
+        old, new = baseline.get(name), current.get(name)
+        if old is None or new is None or old == 0:
+            continue
+        change = (new - old) / old
+        if (lower_is_better and change > tolerance) or (not lower_is_better and -change > tolerance):
+            regressions.append(f"{name}: {old:.4f} -> {new:.4f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test against a mock Azure OpenAI server")
+    parser.add_argument("--workflows", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=20, help="Workflows in flight at once")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="Scale factor for simulated model latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 429 from the mock")
+    parser.add_argument("--small-malformed-rate", type=float, default=0.0,
+                        help="Probability of a malformed small-tier answer; checks that the cascade escalates")
+    parser.add_argument("--poll-interval", type=float, default=0.02)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-workflow timeout in seconds")
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    parser.add_argument("--baseline", help="Compare against this baseline and exit 1 on regression")
+    parser.add_argument("--write-baseline", help="Write the baseline metrics to this path")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; baseline metrics use the median")
+    parser.add_argument("--max-active", type=int,
+                        help="Workflow admission limit (default: --concurrency); lower it to exercise queueing")
+    args = parser.parse_args()
+    os.environ["RCSA_MAX_ACTIVE_WORKFLOWS"] = str(args.max_active or args.concurrency)
+
+    mock = MockOpenAI(MockConfig(profile=args.profile, time_scale=args.time_scale, error_rate_429=args.error_rate,
+                                 small_malformed_rate=args.small_malformed_rate))
+    reports = []
+    with tempfile.TemporaryDirectory() as output_dir, MockServerThread(mock) as server:
+        configure_backend(server.endpoint, output_dir)
+        for _ in range(args.repeat):
+            reports.append(asyncio.run(run_load(args)))
+    report = {"runs": reports, "mock": mock.stats}
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.small_malformed_rate:
+        problems = check_cascade(reports)
+        if problems:
+            print("Cascade check failed:\n  " + "\n  ".join(problems))
+            sys.exit(1)
+        print("Cascade check passed: escalation rate "
+              + ", ".join(f"{r['escalation_rate']:.1%}" for r in reports) + ".")
+    runs = [flatten_for_baseline(r) for r in reports]
+    current = {name: percentile([r[name] for r in runs if r[name] is not None], 50) for name in BASELINE_METRICS}
+    print("Median metrics:", json.dumps(current))
+    if args.write_baseline:
+        with open(args.write_baseline, 'w', encoding='utf-8') as f:
+            json.dump({"config": reports[0]["config"], "metrics": current}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(current, baseline["metrics"], args.tolerance)
+        if regressions:
+            print("Regressions against baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Local mock of the Azure OpenAI chat completions endpoint for offline benchmarks.
+
+Serves POST /openai/deployments/{deployment}/chat/completions with canned agent outputs,
+sampled latency, a simulated token rate and optional 429 injection. Agents are recognised
+by their instructions, so the real orchestrator -> sub-agent tool flow is exercised.
+
+Run standalone:
+    python -m bench.mock_openai_server --port 8001 --profile realistic
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import ClientDisconnect, Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+
+@dataclass
+class LatencyProfile:
+    # fixed | uniform | lognormal | pareto
+    distribution: str = "lognormal"
+    # Median time to first token, seconds
+    median: float = 0.6
+    # lognormal sigma, uniform spread (+/-) or pareto shape (alpha)
+    spread: float = 0.5
+    # Completion tokens generated per second
+    tokens_per_second: float = 80.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.distribution == "fixed":
+            return self.median
+        if self.distribution == "uniform":
+            return max(0.0, rng.uniform(self.median - self.spread, self.median + self.spread))
+        if self.distribution == "pareto":
+            # Scale so the median of the pareto draw equals `median`
+            scale = self.median / (2 ** (1 / self.spread))
+            return scale * rng.paretovariate(self.spread)
+        return rng.lognormvariate(0.0, self.spread) * self.median
+
+
+PROFILES: Dict[str, Dict[str, LatencyProfile]] = {
+    "fast": {
+        "large": LatencyProfile("fixed", 0.05, 0.0, 2000.0),
+        "small": LatencyProfile("fixed", 0.02, 0.0, 4000.0),
+    },
+    "realistic": {
+        "large": LatencyProfile("lognormal", 0.8, 0.4, 60.0),
+        "small": LatencyProfile("lognormal", 0.3, 0.3, 150.0),
+    },
+    "heavy_tail": {
+        "large": LatencyProfile("pareto", 0.8, 1.6, 60.0),
+        "small": LatencyProfile("pareto", 0.3, 1.8, 150.0),
+    },
+}
+
+
+@dataclass
+class MockConfig:
+    profile: str = "fast"
+    # Multiplies every simulated delay, so long profiles can run quickly in CI
+    time_scale: float = 1.0
+    # Probability of answering 429 instead of completing
+    error_rate_429: float = 0.0
+    retry_after: float = 0.05
+    # Deployment names treated as the small tier; everything else uses the large profile
+    small_deployments: List[str] = field(default_factory=lambda: ["small"])
+    # Probability that a small-tier answer (steps, guardrails, JSON repair, intake summary) is
+    # malformed, forcing a cascade escalation
+    small_malformed_rate: float = 0.0
+    seed: int = 7
+    # Optional per-step overrides of the canned outputs below
+    canned: Dict[str, Any] = field(default_factory=dict)
+
+
+# --- Canned Agent Outputs ---
+CANNED_OUTPUTS: Dict[str, Any] = {
+    "generate_draft": {
+        "project_title": "Benchmark Project",
+        "project_description": "Vendor-hosted analytics platform processing customer data.",
+        "objectives": ["Reduce manual review effort"],
+        "benefits": ["Faster decisions"],
+        "deliverables": ["Production deployment"],
+    },
+    "map_risks": [
+        {"risk": "System outage", "category_level_1": "Technology Risk",
+         "category_level_2": "Unreliable Technology Systems, Solutions or Services",
+         "category_level_3": "Failure in Technology Operations", "confidence": 0.92},
+        {"risk": "Third-party/vendor risk", "category_level_1": "Third Party Risk",
+         "category_level_2": "Vendor Failure", "category_level_3": "Vendor Failure", "confidence": 0.85},
+    ],
+    "map_controls": [
+        {"risk": "System outage", "controls": [
+            {"control_id": "C002", "name": "Application DR Testing", "relevance_score": 0.9}]},
+        {"risk": "Third-party/vendor risk", "controls": [
+            {"control_id": "C001", "name": "Application Contingency Guideline", "relevance_score": 0.8}]},
+    ],
+    "generate_mitigations": [
+        {"risk": "System outage", "control_id": "C002", "mitigation_steps": ["Quarterly failover tests"]},
+        {"risk": "Third-party/vendor risk", "control_id": "C001", "mitigation_steps": ["Negotiate SLA"]},
+    ],
+    "flag_issues": [
+        {"issue": "No SLA defined for vendor", "severity": "High", "recommendation": "Draft and sign SLA"},
+    ],
+    "evaluate_decision": {"decision": "Approved", "rationale": "All risks have mapped controls."},
+}
+
+INTAKE_SUMMARY = {
+    "project_title": "Benchmark Project",
+    "objectives": ["Reduce manual review effort"],
+    "scope": "Vendor-hosted analytics platform processing customer data.",
+    "data_sensitivity": "Customer personal data",
+    "open_questions": [],
+}
+
+# Instruction prefixes identifying each agent or helper prompt
+AGENT_SIGNATURES = [
+    ("You are orchestrating a risk workflow", "orchestrator"),
+    ("You are a feedback processor", "feedback"),
+    ("Generate a draft submission", "generate_draft"),
+    ("Given the project draft submission", "map_risks"),
+    ("Map each identified risk", "map_controls"),
+    ("For each risk-control pair", "generate_mitigations"),
+    ("Flag issues in the draft submission", "flag_issues"),
+    ("Decide approval or rejection", "evaluate_decision"),
+    ("Enforce guardrail rules", "guardrail"),
+    ("You evaluate guardrails compliance", "guardrail"),
+    ("You assist in approval decisions", "evaluate_decision"),
+    ("You fix JSON", "json_repair"),
+    ("You are a project analysis expert", "analysis"),
+    ("You maintain a running project summary", "intake_summary"),
+]
+
+
+def identify_agent(messages: List[Dict[str, Any]]) -> str:
+    system = next((m.get("content") or "" for m in messages if m.get("role") in ("system", "developer")), "")
+    if isinstance(system, list):
+        system = " ".join(part.get("text", "") for part in system if isinstance(part, dict))
+    for prefix, name in AGENT_SIGNATURES:
+        if system.startswith(prefix):
+            return name
+    return "unknown"
+
+
+def estimate_tokens(payload: Any) -> int:
+    text = payload if isinstance(payload, str) else json.dumps(payload)
+    return max(1, len(text) // 4)
+
+
+class MockOpenAI:
+    def __init__(self, config: Optional[MockConfig] = None):
+        self.config = config or MockConfig()
+        self.rng = random.Random(self.config.seed)
+        self.stats: Dict[str, Any] = {"requests": 0, "throttled": 0, "by_agent": {}, "by_deployment": {}}
+
+    def _profile(self, deployment: str) -> LatencyProfile:
+        tier = "small" if deployment in self.config.small_deployments else "large"
+        return PROFILES[self.config.profile][tier]
+
+    def _canned(self, step: str) -> Any:
+        return self.config.canned.get(step, CANNED_OUTPUTS.get(step, {}))
+
+    def _respond(self, agent: str, body: Dict[str, Any], deployment: str):
+        """
+        Returns (content, tool_calls) for the given agent.
+        """
+        messages = body.get("messages", [])
+        if agent == "orchestrator":
+            tool_results = [m for m in messages if m.get("role") == "tool"]
+            if tool_results:
+                # Pass the sub-agent output through, as the orchestrator is instructed to
+                return tool_results[-1].get("content", ""), None
+            user = next((m.get("content") for m in messages if m.get("role") == "user"), "{}")
+            try:
+                step = json.loads(user).get("next_step", "generate_draft")
+            except Exception:
+                step = "generate_draft"
+            tool_names = {t["function"]["name"] for t in body.get("tools", []) if t.get("type") == "function"}
+            if step in tool_names:
+                call = {
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": step, "arguments": json.dumps({"input": "Run this step for the context."})},
+                }
+                return None, [call]
+            return json.dumps(self._canned(step)), None
+        if (self.config.small_malformed_rate and deployment in self.config.small_deployments
+                and agent != "unknown" and self.rng.random() < self.config.small_malformed_rate):
+            # Cascaded routes reject this and retry on the large tier
+            return "Sorry, here is a partial answer: [", None
+        if agent == "guardrail":
+            return "[]", None
+        if agent == "json_repair":
+            return json.dumps(self._canned("flag_issues")), None
+        if agent == "analysis":
+            return "Benchmark Project: vendor-hosted analytics platform processing customer data.", None
+        if agent == "intake_summary":
+            return json.dumps(INTAKE_SUMMARY), None
+        if agent == "feedback":
+            return "{}", None
+        if agent in CANNED_OUTPUTS:
+            output = self._canned(agent)
+            schema = (body.get("response_format") or {}).get("json_schema", {}).get("schema", {})
+            if "response" in schema.get("properties", {}) and isinstance(output, list):
+                # The Agents SDK wraps non-object structured outputs in {"response": ...}
+                output = {"response": output}
+            return json.dumps(output), None
+        return "{}", None
+
+    async def chat_completions(self, request: Request):
+        deployment = request.path_params["deployment"]
+        try:
+            body = await request.json()
+        except ClientDisconnect:
+            # Cancelled hedges and deadlines drop the connection mid-request
+            return Response(status_code=499)
+        agent = identify_agent(body.get("messages", []))
+        self.stats["requests"] += 1
+        self.stats["by_agent"][agent] = self.stats["by_agent"].get(agent, 0) + 1
+        self.stats["by_deployment"][deployment] = self.stats["by_deployment"].get(deployment, 0) + 1
+        if self.rng.random() < self.config.error_rate_429:
+            self.stats["throttled"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"Retry-After": str(self.config.retry_after)},
+                content={"error": {"code": "429", "message": "Rate limit is exceeded."}},
+            )
+        content, tool_calls = self._respond(agent, body, deployment)
+        prompt_tokens = estimate_tokens(body.get("messages", []))
+        completion_tokens = estimate_tokens(content or tool_calls or "")
+        profile = self._profile(deployment)
+        delay = profile.sample(self.rng) + completion_tokens / profile.tokens_per_second
+        await asyncio.sleep(delay * self.config.time_scale)
+        message: Dict[str, Any] = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": deployment,
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    async def get_stats(self, request: Request):
+        return JSONResponse(self.stats)
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/openai/deployments/{deployment}/chat/completions", self.chat_completions, methods=["POST"]),
+            Route("/mock/stats", self.get_stats, methods=["GET"]),
+        ])
+
+
+class MockServerThread:
+    """
+    Runs the mock on 127.0.0.1 in a background thread so it has its own event loop
+    and does not distort lag measurements of the app under test.
+    """
+
+    def __init__(self, mock: MockOpenAI, port: int = 0):
+        self.mock = mock
+        config = uvicorn.Config(mock.app(), host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        sock = self.server.servers[0].sockets[0]
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Azure OpenAI chat completions server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    mock = MockOpenAI(MockConfig(profile=args.profile, time_scale=args.time_scale, error_rate_429=args.error_rate))
+    uvicorn.run(mock.app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmarks worker startup: how long importing the API takes, how soon it serves CRUD and
+how soon it is LLM-ready, with the resident memory at each point.
+
+Each sample runs in a fresh interpreter, as a new uvicorn worker would. The worker imports
+`api`, serves GET /risks, then loads the workflow engine (agents, routed models and client)
+the way the startup warm-up does. No model calls are made.
+
+    cd backend
+    python -m bench.startup_bench --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from bench.load_test import configure_backend
+
+# Runs in the child interpreter; prints one JSON line
+WORKER = r"""
+import asyncio, json, resource, sys, time
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+started = time.perf_counter()
+import api
+imported = time.perf_counter()
+heavy_loaded = sorted(m for m in ("openai", "agents", "pypdf", "requests") if m in sys.modules)
+rss_imported = rss_mb()
+
+import httpx
+import workflow_store
+
+async def main():
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+        response = await client.get("/risks")
+        assert response.status_code == 200, response.status_code
+        served = time.perf_counter()
+        await workflow_store.workflow_engine()
+        return served, time.perf_counter()
+
+served, ready = asyncio.run(main())
+print(json.dumps({
+    "import_seconds": imported - started,
+    "first_crud_seconds": served - started,
+    "llm_ready_seconds": ready - started,
+    "rss_after_import_mb": rss_imported,
+    "rss_llm_ready_mb": rss_mb(),
+    "heavy_modules_at_import": heavy_loaded,
+}))
+"""
+
+
+def run_worker(env) -> dict:
+    out = subprocess.run([sys.executable, "-c", WORKER], env=env, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        # The client is built but never called, so any endpoint will do
+        configure_backend("http://127.0.0.1:9", os.path.join(tmp, "output"))
+        env = dict(os.environ)
+        samples = [run_worker(env) for _ in range(args.repeat)]
+    report = {"repeat": args.repeat, "heavy_modules_at_import": samples[0]["heavy_modules_at_import"]}
+    for key in ("import_seconds", "first_crud_seconds", "llm_ready_seconds", "rss_after_import_mb", "rss_llm_ready_mb"):
+        values = [s[key] for s in samples]
+        report[key] = {"median": round(statistics.median(values), 3), "max": round(max(values), 3)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker startup latency and memory benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh worker processes to sample")
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+import contextvars
+import heapq
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from archive import iter_stored_contexts
+from instrumentation import Counter
+
+BUDGET_EVENTS = Counter(
+    "rcsa_budget_events_total", "Workflow runs degraded or stopped by their usage budget", ("event", "limit"))
+MODEL_COST = Counter("rcsa_model_cost_total", "Estimated model spend, in the units of RCSA_MODEL_PRICES", ("route",))
+
+
+# --- Budgets ---
+@dataclass
+class BudgetLimits:
+    # Per run: a workflow run, or one round of feedback processing. 0 disables a limit.
+    max_tokens: int = int(os.getenv("RCSA_BUDGET_MAX_TOKENS", "0"))
+    max_calls: int = int(os.getenv("RCSA_BUDGET_MAX_CALLS", "0"))
+    max_seconds: float = float(os.getenv("RCSA_BUDGET_MAX_SECONDS", "0"))
+    # Past this share of any limit the run degrades: no cascade escalation, hedging,
+    # JSON re-asks or advisory guardrail check
+    degrade_at: float = float(os.getenv("RCSA_BUDGET_DEGRADE_AT", "0.8"))
+
+
+BUDGET = BudgetLimits()
+
+# Price per million tokens by deployment, e.g. {"gpt-4.1": {"prompt": 2.0, "completion": 8.0}}.
+# Calls to deployments without a price count tokens but no cost.
+MODEL_PRICES: Dict[str, Dict[str, float]] = {}
+_prices_file = os.getenv("RCSA_MODEL_PRICES")
+if _prices_file and os.path.exists(_prices_file):
+    with open(_prices_file, 'r', encoding='utf-8') as f:
+        MODEL_PRICES.update(json.load(f))
+
+
+def call_cost(deployment: str, prompt_tokens: int, completion_tokens: int) -> float:
+    price = MODEL_PRICES.get(deployment) or {}
+    return (prompt_tokens * price.get("prompt", 0.0) + completion_tokens * price.get("completion", 0.0)) / 1_000_000
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+# --- Per-run Usage ---
+@dataclass
+class RunUsage:
+    """
+    Model usage of one run, across every model call beneath it (nested agent-as-tool runs
+    and helper tools included), checked against the run's budget before each call.
+    """
+    kind: str = "workflow"
+    limits: BudgetLimits = field(default_factory=lambda: BUDGET)
+    run_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    started_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    started: float = field(default_factory=time.monotonic)
+    wall_seconds: float = 0.0
+    model_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    routes: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # Tokens counted from an estimate, not reported by the provider (cancelled hedge requests)
+    estimated_tokens: int = 0
+    # Name of the limit that degraded or stopped the run
+    degraded: Optional[str] = None
+    exceeded: Optional[str] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def _measures(self) -> List[Tuple[str, float, float]]:
+        return [
+            ("tokens", self.total_tokens, self.limits.max_tokens),
+            ("calls", self.model_calls, self.limits.max_calls),
+            ("seconds", time.monotonic() - self.started, self.limits.max_seconds),
+        ]
+
+    def _degrade(self):
+        if self.degraded:
+            return
+        for limit, used, cap in self._measures():
+            if cap and used >= cap * self.limits.degrade_at:
+                self.degraded = limit
+                BUDGET_EVENTS.inc(event="degraded", limit=limit)
+                print(f"{self.kind} run {self.run_id} degraded: {limit} at {used:.0f} of {cap:.0f}")
+                return
+
+    def check(self):
+        """
+        Raise BudgetExceeded instead of making another call once any limit is used up.
+        """
+        if self.exceeded:
+            raise BudgetExceeded(self.exceeded)
+        for limit, used, cap in self._measures():
+            if cap and used >= cap:
+                self.exceeded = f"{self.kind} budget exceeded: {limit} {used:.0f} of {cap:.0f}"
+                BUDGET_EVENTS.inc(event="exceeded", limit=limit)
+                raise BudgetExceeded(self.exceeded)
+        self._degrade()
+
+    def record(self, route: str, prompt_tokens: int, completion_tokens: int, cost: float, estimated: bool = False):
+        self.model_calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost += cost
+        if estimated:
+            self.estimated_tokens += prompt_tokens + completion_tokens
+        entry = self.routes.setdefault(route, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+        entry["calls"] += 1
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
+        entry["cost"] += cost
+        self._degrade()
+
+    def to_dict(self):
+        return {
+            "run_id": self.run_id,
+            "kind": self.kind,
+            "started_at": self.started_at,
+            "wall_seconds": round(self.wall_seconds or time.monotonic() - self.started, 4),
+            "model_calls": self.model_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "estimated_tokens": self.estimated_tokens,
+            "cost": round(self.cost, 6),
+            "routes": {name: {**entry, "cost": round(entry["cost"], 6)} for name, entry in self.routes.items()},
+            "limits": asdict(self.limits),
+            "degraded": self.degraded,
+            "exceeded": self.exceeded,
+        }
+
+
+# Set while a workflow or feedback run executes; model calls anywhere below it count against it
+_current_run: contextvars.ContextVar[Optional[RunUsage]] = contextvars.ContextVar("rcsa_current_run", default=None)
+
+
+@contextmanager
+def track_usage(kind: str = "workflow", limits: Optional[BudgetLimits] = None) -> Iterator[RunUsage]:
+    usage = RunUsage(kind=kind, limits=limits or BUDGET)
+    token = _current_run.set(usage)
+    try:
+        yield usage
+    finally:
+        usage.wall_seconds = time.monotonic() - usage.started
+        _current_run.reset(token)
+
+
+def check_budget():
+    usage = _current_run.get()
+    if usage is not None:
+        usage.check()
+
+
+def budget_degraded() -> bool:
+    usage = _current_run.get()
+    return usage is not None and usage.degraded is not None
+
+
+def record_usage(route: str, deployment: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+    cost = call_cost(deployment, prompt_tokens, completion_tokens)
+    if cost:
+        MODEL_COST.inc(cost, route=route)
+    usage = _current_run.get()
+    if usage is not None:
+        usage.record(route, prompt_tokens, completion_tokens, cost, estimated)
+
+
+def record_hedge_loser(route: str, deployment: str, loser_tokens: Optional[Tuple[int, int]], winner_prompt_tokens: int):
+    """
+    Usage of the request that lost a hedge race. One that finished reports its own
+    usage. One cancelled mid-request reports nothing, but its prompt was still read, so
+    the winner's prompt tokens (the same messages) are recorded as an estimate.
+    """
+    if loser_tokens is not None:
+        record_usage(route, deployment, *loser_tokens)
+    else:
+        record_usage(route, deployment, winner_prompt_tokens, 0, estimated=True)
+
+
+_TOTAL_FIELDS = ("model_calls", "prompt_tokens", "completion_tokens", "total_tokens", "estimated_tokens", "cost",
+                 "wall_seconds")
+
+
+def summarize_runs(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    A context's `usage`: every run it has had (the workflow run, reruns, feedback rounds) and their totals.
+    """
+    totals = {name: sum(run.get(name) or 0 for run in runs) for name in _TOTAL_FIELDS}
+    totals["cost"] = round(totals["cost"], 6)
+    totals["wall_seconds"] = round(totals["wall_seconds"], 4)
+    return {**totals, "runs": runs}
+
+
+# --- Cost Report ---
+def _empty_totals() -> Dict[str, Any]:
+    return {"workflows": 0, "exceeded": 0, "degraded": 0, **{name: 0 for name in _TOTAL_FIELDS},
+            "routes": {}, "steps": {}}
+
+
+def _add_breakdowns(target: Dict[str, Any], source: Dict[str, Any], sign: int = 1):
+    for group in ("routes", "steps"):
+        for key, values in source[group].items():
+            entry = target[group].setdefault(key, {})
+            for name, value in values.items():
+                entry[name] = entry.get(name, 0) + sign * value
+            if not any(entry.values()):
+                del target[group][key]
+
+
+def _accumulate(target: Dict[str, Any], record: Dict[str, Any], sign: int):
+    target["workflows"] += sign
+    target["exceeded"] += sign * bool(record["exceeded"])
+    target["degraded"] += sign * bool(record["degraded"])
+    for name in _TOTAL_FIELDS:
+        target[name] += sign * record[name]
+    _add_breakdowns(target, record, sign)
+
+
+def _merge(target: Dict[str, Any], group: Dict[str, Any]):
+    for name in ("workflows", "exceeded", "degraded") + _TOTAL_FIELDS:
+        target[name] += group[name]
+    _add_breakdowns(target, group)
+
+
+class CostLedger:
+    """
+    Usage of every stored workflow, with running totals per (status, decision) so the
+    report is a sum over a handful of groups rather than a pass over output/. Saves
+    update it like the other output/ indexes. Workflows saved before usage accounting
+    are counted from their step_metrics.
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._groups: Dict[Tuple[Any, Any], Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+
+    @staticmethod
+    def _record_of(data: Dict[str, Any]) -> Dict[str, Any]:
+        usage = data.get("usage") or {}
+        runs = usage.get("runs") or []
+        steps = {}
+        for step, metrics in (data.get("step_metrics") or {}).items():
+            steps[step] = {
+                "model_calls": metrics.get("model_calls", 0),
+                "prompt_tokens": metrics.get("prompt_tokens", 0),
+                "completion_tokens": metrics.get("completion_tokens", 0),
+                "wall_seconds": metrics.get("wall_seconds", 0.0),
+            }
+        if runs:
+            totals = {name: usage.get(name, 0) for name in _TOTAL_FIELDS}
+        else:
+            totals = {name: sum(s.get(name, 0) for s in steps.values()) for name in _TOTAL_FIELDS}
+            totals["total_tokens"] = totals["prompt_tokens"] + totals["completion_tokens"]
+        routes = {}
+        for run in runs:
+            for route, entry in (run.get("routes") or {}).items():
+                target = routes.setdefault(route, {})
+                for name, value in entry.items():
+                    target[name] = target.get(name, 0) + value
+        decision = data.get("decision_result")
+        return {
+            **totals,
+            "status": data.get("status"),
+            "decision": decision.get("decision") if isinstance(decision, dict) else None,
+            "title": (data.get("draft_submission") or {}).get("project_title"),
+            "runs": len(runs),
+            "exceeded": next((run["exceeded"] for run in reversed(runs) if run.get("exceeded")), None),
+            "degraded": next((run["degraded"] for run in reversed(runs) if run.get("degraded")), None),
+            "routes": routes,
+            "steps": steps,
+        }
+
+    def observe(self, context_id: str, data: Dict[str, Any], only_new: bool = False):
+        record = self._record_of(data)
+        with self._lock:
+            if only_new and context_id in self._records:
+                return
+            self._remove(context_id)
+            self._records[context_id] = record
+            group = self._groups.setdefault((record["status"], record["decision"]), _empty_totals())
+            _accumulate(group, record, 1)
+
+    def _remove(self, context_id: str):
+        record = self._records.pop(context_id, None)
+        if record is not None:
+            key = (record["status"], record["decision"])
+            _accumulate(self._groups[key], record, -1)
+            if not self._groups[key]["workflows"]:
+                del self._groups[key]
+
+    def forget(self, context_id: str):
+        with self._lock:
+            self._remove(context_id)
+
+    def load(self):
+        """
+        Read every saved workflow context once; afterwards saves keep the ledger current.
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            count = 0
+            for context_id, data in iter_stored_contexts(self.output_dir, "Cost ledger"):
+                self.observe(context_id, data, only_new=True)
+                count += 1
+            self._loaded = True
+            print(f"Cost ledger loaded {count} workflows in {time.perf_counter() - started:.2f}s")
+
+    def report(self, status: Optional[str] = None, decision: Optional[str] = None, top: int = 10) -> Dict[str, Any]:
+        """
+        Totals, per-workflow averages, per-route and per-step breakdowns and the most
+        expensive workflows, optionally for one status and/or decision.
+        """
+        self.load()
+
+        def matches(key) -> bool:
+            return (status is None or key[0] == status) and (decision is None or key[1] == decision)
+
+        with self._lock:
+            totals = _empty_totals()
+            by_status: Dict[str, Dict[str, Any]] = {}
+            for key, group in self._groups.items():
+                if not matches(key):
+                    continue
+                _merge(totals, group)
+                entry = by_status.setdefault(key[0] or "unknown", {"workflows": 0, "total_tokens": 0, "cost": 0})
+                entry["workflows"] += group["workflows"]
+                entry["total_tokens"] += group["total_tokens"]
+                entry["cost"] += group["cost"]
+            ranked = heapq.nlargest(
+                top, ((cid, r) for cid, r in self._records.items() if matches((r["status"], r["decision"]))),
+                key=lambda item: (item[1]["cost"], item[1]["total_tokens"]))
+        count = totals["workflows"]
+        return {
+            "workflows": count,
+            "totals": {name: round(totals[name], 6) for name in _TOTAL_FIELDS},
+            "per_workflow": {name: round(totals[name] / count, 4) if count else 0 for name in _TOTAL_FIELDS},
+            "budget": {"limits": asdict(BUDGET), "exceeded": totals["exceeded"], "degraded": totals["degraded"]},
+            "by_status": by_status,
+            "by_route": totals["routes"],
+            "by_step": totals["steps"],
+            "top": [{"context_id": cid, **{k: v for k, v in r.items() if k not in ("routes", "steps")}}
+                    for cid, r in ranked],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"loaded": self._loaded, "workflows": len(self._records), "groups": len(self._groups)}
@@ -0,0 +1,191 @@
+import asyncio
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Type
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+VALIDATION_BATCH_SIZE = 1000
+# Per-row errors returned in an import report; the total count is always reported
+MAX_REPORTED_ERRORS = 1000
+
+
+@dataclass
+class BulkCatalog:
+    name: str
+    model: Type[BaseModel]
+    key: str
+
+
+@dataclass
+class ImportReport:
+    received: int = 0
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    applied: bool = False
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    def error(self, row: int, message: Any):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def to_dict(self):
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "applied": self.applied,
+            "errors": self.errors,
+        }
+
+
+# --- Streaming Parsers ---
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            yield line.decode("utf-8")
+    if buffer:
+        yield buffer.decode("utf-8")
+
+
+def _csv_cell(value: str) -> Any:
+    # Nested fields (lists, objects) are written as JSON inside the cell; empty cells are null
+    if value == "":
+        return None
+    if value[:1] in "[{":
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+async def parse_rows(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Any]:
+    """
+    Yield (row number, row dict or parse error) from an NDJSON or CSV byte stream without
+    buffering the whole upload.
+    """
+    if fmt == "csv":
+        header: Optional[List[str]] = None
+        row_number = 0
+        pending = ""
+        async for line in _lines(chunks):
+            # A quoted cell may span lines; wait until its quotes balance
+            pending = f"{pending}\n{line}" if pending else line
+            if pending.count('"') % 2:
+                continue
+            line, pending = pending, ""
+            if not line.strip():
+                continue
+            values = next(csv.reader(io.StringIO(line)))
+            if header is None:
+                header = [h.strip().lstrip("\ufeff") for h in values]
+                continue
+            row_number += 1
+            if len(values) != len(header):
+                yield row_number, ValueError(f"expected {len(header)} columns, got {len(values)}")
+                continue
+            yield row_number, {h: _csv_cell(v) for h, v in zip(header, values) if _csv_cell(v) is not None}
+    else:
+        row_number = 0
+        async for line in _lines(chunks):
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                yield row_number, json.loads(line)
+            except ValueError as e:
+                yield row_number, e
+
+
+# --- Import ---
+def _validate_batch(adapter: TypeAdapter, model: Type[BaseModel], batch: List[Any], report: ImportReport):
+    """
+    Validate a batch in one call; on failure fall back to per-row validation so every
+    bad row gets its own error.
+    """
+    rows = [row for _, row in batch]
+    try:
+        return list(zip((n for n, _ in batch), adapter.validate_python(rows)))
+    except ValidationError:
+        pass
+    valid = []
+    for row_number, row in batch:
+        try:
+            valid.append((row_number, model.model_validate(row)))
+        except ValidationError as e:
+            report.error(row_number, [{"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()])
+    return valid
+
+
+async def import_rows(repo, catalog: BulkCatalog, chunks: AsyncIterator[bytes], fmt: str,
+                      on_error: str = "skip", dry_run: bool = False) -> ImportReport:
+    """
+    Validate a streamed upload in batches and upsert it into the catalog by key as one
+    snapshot swap (a single atomic file replace). With on_error="reject", nothing is
+    written if any row fails. Validation and the catalog write run in worker threads so a
+    large import does not hold up other requests.
+    """
+    adapter = TypeAdapter(List[catalog.model])
+    report = ImportReport()
+    upserts: Dict[str, Dict[str, Any]] = {}
+    batch: List[Any] = []
+
+    def _apply(valid):
+        for _, item in valid:
+            data = item.dict()
+            upserts[str(data[catalog.key])] = data
+
+    async for row_number, row in parse_rows(chunks, fmt):
+        report.received += 1
+        if isinstance(row, Exception):
+            report.error(row_number, str(row))
+            continue
+        batch.append((row_number, row))
+        if len(batch) >= VALIDATION_BATCH_SIZE:
+            _apply(await asyncio.to_thread(_validate_batch, adapter, catalog.model, batch, report))
+            batch = []
+    if batch:
+        _apply(await asyncio.to_thread(_validate_batch, adapter, catalog.model, batch, report))
+
+    if (report.failed and on_error == "reject") or not upserts:
+        return report
+
+    def _upsert(items: List[Dict[str, Any]]):
+        positions = {str(item.get(catalog.key)): idx for idx, item in enumerate(items)}
+        for key, data in upserts.items():
+            if key in positions:
+                items[positions[key]] = data
+                report.updated += 1
+            else:
+                positions[key] = len(items)
+                items.append(data)
+                report.inserted += 1
+
+    if dry_run:
+        await asyncio.to_thread(_upsert, list(repo.get(catalog.name).items))
+    else:
+        # Serializes the whole catalog and swaps the file in
+        await asyncio.to_thread(repo.update, catalog.name, _upsert)
+        report.applied = True
+    return report
+
+
+# --- Export ---
+def export_ndjson(items: Iterable[Any], batch_size: int = 500) -> Iterator[bytes]:
+    lines = []
+    for item in items:
+        lines.append(json.dumps(item))
+        if len(lines) >= batch_size:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
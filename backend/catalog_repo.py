@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from instrumentation import Counter
+
+# How often (seconds) a read checks the catalog file's mtime for out-of-band edits
+RELOAD_INTERVAL = float(os.getenv("RCSA_CATALOG_RELOAD_INTERVAL", "2.0"))
+
+CATALOG_RELOADS = Counter("rcsa_catalog_reloads_total", "Catalog snapshots swapped in", ("catalog", "source"))
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """
+    One parsed version of a catalog file. Snapshots are never modified after they are
+    published; writers build a new item list and swap in a new snapshot. Treat `items`
+    and the dicts inside it as read-only.
+    """
+    name: str
+    version: int
+    digest: str
+    items: Tuple[Any, ...]
+    mtime: float
+    text: str  # compact JSON of `items`, reused by the agent tools
+    # Values derived from this snapshot (indexes, serialized views), built once on first use
+    _derived: Dict[str, Any] = field(default_factory=dict, repr=False, compare=False)
+
+    def derived(self, key: str, build: Callable[["CatalogSnapshot"], Any]) -> Any:
+        """
+        Memoize `build(self)` for the lifetime of this snapshot. Every workflow pinned to the
+        snapshot shares the result; a new snapshot starts with an empty cache.
+        """
+        if key not in self._derived:
+            self._derived[key] = build(self)
+        return self._derived[key]
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.name}-{self.digest[:16]}"'
+
+    def describe(self) -> Dict[str, Any]:
+        return {"version": self.version, "digest": self.digest[:16]}
+
+
+class CatalogRepository:
+    """
+    In-memory, versioned catalogs shared by the API and the agents.
+
+    Reads return the current immutable snapshot. Writes go through `update`, which
+    applies a change to a copy, writes the file atomically and swaps the snapshot under
+    a lock. Edits made to the files outside the process are picked up by an mtime check
+    at most every `reload_interval` seconds. Subscribers are called with each new snapshot
+    so derived indexes can rebuild.
+    """
+
+    def __init__(self, reload_interval: float = RELOAD_INTERVAL):
+        self.reload_interval = reload_interval
+        self._paths: Dict[str, str] = {}
+        self._snapshots: Dict[str, CatalogSnapshot] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._subscribers: List[Callable[[CatalogSnapshot], None]] = []
+        self._lock = threading.RLock()
+
+    def register(self, name: str, path: str):
+        with self._lock:
+            self._paths[name] = path
+            self._publish(self._read(name), source="load")
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._paths)
+
+    # --- Loading ---
+    def _read(self, name: str) -> CatalogSnapshot:
+        path = self._paths[name]
+        mtime = os.stat(path).st_mtime
+        with open(path, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        return self._snapshot(name, items, mtime)
+
+    def _snapshot(self, name: str, items: List[Any], mtime: float) -> CatalogSnapshot:
+        text = json.dumps(items)
+        previous = self._snapshots.get(name)
+        return CatalogSnapshot(
+            name=name,
+            version=previous.version + 1 if previous else 1,
+            digest=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            items=tuple(items),
+            mtime=mtime,
+            text=text,
+        )
+
+    def _publish(self, snapshot: CatalogSnapshot, source: str):
+        self._snapshots[snapshot.name] = snapshot
+        self._checked_at[snapshot.name] = time.monotonic()
+        CATALOG_RELOADS.inc(catalog=snapshot.name, source=source)
+        for callback in list(self._subscribers):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"Catalog subscriber failed for {snapshot.name}: {e}")
+
+    def _maybe_reload(self, name: str, force: bool = False):
+        if not force and time.monotonic() - self._checked_at.get(name, 0.0) < self.reload_interval:
+            return
+        with self._lock:
+            self._checked_at[name] = time.monotonic()
+            current = self._snapshots[name]
+            try:
+                mtime = os.stat(self._paths[name]).st_mtime
+                if mtime == current.mtime:
+                    return
+                snapshot = self._read(name)
+            except (OSError, ValueError) as e:
+                # Keep serving the last good snapshot while the file is missing or mid-edit
+                print(f"Catalog reload failed for {name}: {e}")
+                return
+            if snapshot.digest == current.digest:
+                self._snapshots[name] = replace(current, mtime=mtime, _derived=current._derived)
+                return
+            self._publish(snapshot, source="file")
+
+    # --- Reads ---
+    def get(self, name: str) -> CatalogSnapshot:
+        self._maybe_reload(name)
+        return self._snapshots[name]
+
+    def pin(self) -> Dict[str, CatalogSnapshot]:
+        """
+        A consistent set of snapshots for one workflow run.
+        """
+        return {name: self.get(name) for name in self._paths}
+
+    @staticmethod
+    def versions(pinned: Dict[str, CatalogSnapshot]) -> Dict[str, Dict[str, Any]]:
+        return {name: snapshot.describe() for name, snapshot in pinned.items()}
+
+    # --- Writes ---
+    def update(self, name: str, change: Callable[[List[Any]], Optional[List[Any]]]) -> CatalogSnapshot:
+        """
+        Apply `change` to a copy of the current items (in place or by returning a new list),
+        write the file atomically and publish the result as a new snapshot.
+        """
+        with self._lock:
+            # Never overwrite an edit made to the file since the last check
+            self._maybe_reload(name, force=True)
+            items = list(self._snapshots[name].items)
+            result = change(items)
+            if result is not None:
+                items = result
+            path = self._paths[name]
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(items, f, indent=2)
+            os.replace(tmp_path, path)
+            snapshot = self._snapshot(name, items, os.stat(path).st_mtime)
+            self._publish(snapshot, source="write")
+            return snapshot
+
+    def subscribe(self, callback: Callable[[CatalogSnapshot], None]):
+        """
+        Call `callback(snapshot)` whenever a catalog gets a new snapshot.
+        """
+        self._subscribers.append(callback)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {**snapshot.describe(), "items": len(snapshot.items), "etag": snapshot.etag}
+            for name, snapshot in self._snapshots.items()
+        }
@@ -0,0 +1,262 @@
+import json
+import os
+import threading
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+INDEX_FILE = "index.json"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class ConversationStore:
+    """
+    File-backed store for conversational intake sessions.
+
+    - index.json holds per-conversation metadata (status, counts, timestamps), so
+      listing never opens a transcript.
+    - conversation_<id>.messages.jsonl holds the transcript, one message per line,
+      and is only ever appended to.
+    - conversation_<id>.offsets holds the byte offset of every line (uint64), so a
+      page of messages is read with one seek.
+
+    Legacy conversation_<id>.json files are migrated the first time they are touched.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        # Message ids already stored, loaded lazily per conversation
+        self._ids: Dict[str, set] = {}
+
+    # --- Paths ---
+    def _messages_path(self, conversation_id: str) -> str:
+        return os.path.join(self.directory, f'conversation_{conversation_id}.messages.jsonl')
+
+    def _offsets_path(self, conversation_id: str) -> str:
+        return os.path.join(self.directory, f'conversation_{conversation_id}.offsets')
+
+    def _summary_path(self, conversation_id: str) -> str:
+        return os.path.join(self.directory, f'conversation_{conversation_id}.summary.json')
+
+    def _legacy_path(self, conversation_id: str) -> str:
+        return os.path.join(self.directory, f'conversation_{conversation_id}.json')
+
+    # --- Index ---
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is not None:
+            return self._index
+        os.makedirs(self.directory, exist_ok=True)
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                self._index = json.load(f)
+        else:
+            self._index = {}
+        # Pick up legacy transcripts written before the index existed
+        for name in os.listdir(self.directory):
+            if name.startswith('conversation_') and name.endswith('.json') and not name.endswith('.summary.json'):
+                conversation_id = name[len('conversation_'):-len('.json')]
+                if conversation_id not in self._index:
+                    self._migrate_legacy(conversation_id, persist=False)
+        self._write_index()
+        return self._index
+
+    def _write_index(self):
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, index_path)
+
+    def _migrate_legacy(self, conversation_id: str, persist: bool = True):
+        legacy_path = self._legacy_path(conversation_id)
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error reading conversation {legacy_path}: {e}")
+            return
+        messages = data.pop("messages", []) or []
+        self._index[conversation_id] = self._meta_from(conversation_id, data, 0)
+        self._append_lines(conversation_id, messages)
+        os.remove(legacy_path)
+        if persist:
+            self._write_index()
+
+    @staticmethod
+    def _meta_from(conversation_id: str, data: Dict[str, Any], message_count: int) -> Dict[str, Any]:
+        return {
+            "conversationId": conversation_id,
+            "sessionId": data.get("sessionId"),
+            "status": data.get("status", "active"),
+            "createdAt": data.get("createdAt") or _now(),
+            "updatedAt": data.get("updatedAt") or _now(),
+            "metadata": data.get("metadata") or {},
+            "messageCount": message_count,
+        }
+
+    # --- Messages ---
+    def _known_ids(self, conversation_id: str) -> set:
+        if conversation_id not in self._ids:
+            ids = set()
+            path = self._messages_path(conversation_id)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            ids.add(json.loads(line).get("id"))
+            self._ids[conversation_id] = ids
+        return self._ids[conversation_id]
+
+    def _append_lines(self, conversation_id: str, messages: List[Dict[str, Any]]) -> int:
+        known = self._known_ids(conversation_id)
+        new = []
+        for message in messages:
+            message_id = message.get("id")
+            if message_id is not None and message_id in known:
+                continue
+            new.append(message)
+            known.add(message_id)
+        if not new:
+            return 0
+        offsets = array('Q')
+        with open(self._messages_path(conversation_id), 'ab') as f:
+            for message in new:
+                offsets.append(f.tell())
+                f.write(json.dumps(message).encode('utf-8') + b"\n")
+        with open(self._offsets_path(conversation_id), 'ab') as f:
+            offsets.tofile(f)
+        meta = self._index[conversation_id]
+        meta["messageCount"] = meta.get("messageCount", 0) + len(new)
+        return len(new)
+
+    # --- Public API ---
+    def exists(self, conversation_id: str) -> bool:
+        with self._lock:
+            index = self._load_index()
+            if conversation_id not in index and os.path.exists(self._legacy_path(conversation_id)):
+                self._migrate_legacy(conversation_id)
+            return conversation_id in index
+
+    def save(self, conversation: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Upsert a full conversation as sent by the intake UI. Only messages that are not
+        stored yet are written; metadata is updated in the index.
+        """
+        conversation_id = conversation["conversationId"]
+        with self._lock:
+            index = self._load_index()
+            self.exists(conversation_id)
+            previous = index.get(conversation_id)
+            meta = self._meta_from(conversation_id, conversation, previous["messageCount"] if previous else 0)
+            if previous:
+                meta["createdAt"] = previous.get("createdAt", meta["createdAt"])
+            index[conversation_id] = meta
+            appended = self._append_lines(conversation_id, conversation.get("messages", []))
+            self._write_index()
+            return {"appended": appended, "messageCount": meta["messageCount"]}
+
+    def append(self, conversation_id: str, messages: List[Dict[str, Any]], status: Optional[str] = None,
+               metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Append new messages to an existing conversation. Messages whose id is already
+        stored are skipped, so client retries are harmless.
+        """
+        with self._lock:
+            if not self.exists(conversation_id):
+                raise KeyError(conversation_id)
+            meta = self._index[conversation_id]
+            appended = self._append_lines(conversation_id, messages)
+            if status is not None:
+                meta["status"] = status
+            if metadata:
+                meta["metadata"] = {**meta.get("metadata", {}), **metadata}
+            meta["updatedAt"] = _now()
+            self._write_index()
+            return {"appended": appended, "messageCount": meta["messageCount"]}
+
+    def list(self, offset: int = 0, limit: int = 50, status: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int]:
+        with self._lock:
+            entries = list(self._load_index().values())
+        if status:
+            entries = [e for e in entries if e.get("status") == status]
+        entries.sort(key=lambda e: e.get("updatedAt") or "", reverse=True)
+        page = [
+            {k: e.get(k) for k in ("conversationId", "status", "messageCount", "createdAt", "updatedAt")}
+            for e in entries[offset:offset + limit]
+        ]
+        return page, len(entries)
+
+    def get_meta(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if not self.exists(conversation_id):
+                return None
+            return dict(self._index[conversation_id])
+
+    def messages(self, conversation_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Read a page of messages using the offsets file; only the requested lines are parsed.
+        """
+        with self._lock:
+            if not self.exists(conversation_id):
+                raise KeyError(conversation_id)
+            total = self._index[conversation_id].get("messageCount", 0)
+        if offset >= total:
+            return []
+        end = total if limit is None else min(total, offset + limit)
+        start_pos = array('Q')
+        with open(self._offsets_path(conversation_id), 'rb') as f:
+            f.seek(offset * start_pos.itemsize)
+            start_pos.fromfile(f, 1)
+        result = []
+        with open(self._messages_path(conversation_id), 'rb') as f:
+            f.seek(start_pos[0])
+            for _ in range(end - offset):
+                line = f.readline()
+                if not line:
+                    break
+                result.append(json.loads(line))
+        return result
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        meta = self.get_meta(conversation_id)
+        if meta is None:
+            return None
+        meta["messages"] = self.messages(conversation_id)
+        meta.pop("messageCount", None)
+        meta.setdefault("metadata", {})
+        return meta
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            if not self.exists(conversation_id):
+                return False
+            del self._index[conversation_id]
+            self._ids.pop(conversation_id, None)
+            for path in (self._messages_path(conversation_id), self._offsets_path(conversation_id),
+                         self._summary_path(conversation_id)):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._write_index()
+            return True
+
+    # --- Intake Summary Cache ---
+    def read_summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        path = self._summary_path(conversation_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write_summary(self, conversation_id: str, data: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._summary_path(conversation_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+from archive import iter_stored_contexts
+from instrumentation import Histogram
+
+# Minimum estimated Jaccard similarity (over word 3-shingles) reported as a near-duplicate
+DUPLICATE_THRESHOLD = float(os.getenv("RCSA_DUPLICATE_THRESHOLD", "0.8"))
+# A step is reused only if the regenerated draft is at least this similar to the prior draft
+DRAFT_REUSE_THRESHOLD = float(os.getenv("RCSA_DRAFT_REUSE_THRESHOLD", "0.9"))
+
+DUPLICATE_LOOKUP_SECONDS = Histogram(
+    "rcsa_duplicate_lookup_seconds", "Near-duplicate LSH lookup time",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01, 0.05),
+)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+
+def _words(text: Any) -> List[str]:
+    return _WORD_RE.findall(str(text or "").lower())
+
+
+def text_digest(text: Any) -> str:
+    return hashlib.sha1(" ".join(_words(text)).encode("utf-8")).hexdigest()
+
+
+def jaccard(a: Any, b: Any) -> float:
+    """
+    Exact word-set Jaccard similarity of two texts (or JSON-serializable values).
+    """
+    if not isinstance(a, str):
+        a = json.dumps(a, sort_keys=True, default=str)
+    if not isinstance(b, str):
+        b = json.dumps(b, sort_keys=True, default=str)
+    wa, wb = set(_words(a)), set(_words(b))
+    if not wa and not wb:
+        return 1.0
+    return len(wa & wb) / len(wa | wb)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures of every stored workflow's combined project description, bucketed
+    by LSH bands. A lookup hashes the query's bands, probes one dict per band and compares
+    signatures only for the few candidates that share a bucket, so its cost does not grow
+    with the number of stored workflows. With 16 bands of 8 rows, pairs above ~0.7
+    similarity are very likely to collide and pairs below ~0.4 almost never do.
+    """
+
+    def __init__(self, output_dir: str, num_perm: int = 128, bands: int = 16, shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.output_dir = output_dir
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        # 32-bit coefficients keep a * hash + b within uint64 before the modulo
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._digests: Dict[str, str] = {}
+        self._raw_digests: Dict[str, str] = {}
+        self._by_digest: Dict[str, Set[str]] = {}
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(bands)]
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+
+    # --- Signatures ---
+    def signature(self, text: Any) -> Optional[np.ndarray]:
+        words = _words(text)
+        if not words:
+            return None
+        k = min(self.shingle_size, len(words))
+        shingles = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+        return (permuted.min(axis=1) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    # --- Updates ---
+    def observe(self, context_id: str, data: Dict[str, Any], only_new: bool = False):
+        """
+        Index a workflow's combined description; the signature is only recomputed when the
+        description changes.
+        """
+        description = data.get("project_description") or ""
+        # Hashing the raw text is far cheaper than normalizing it, and most saves do not touch it
+        raw_digest = hashlib.sha1(description.encode("utf-8")).hexdigest()
+        meta = {
+            "status": data.get("status"),
+            "title": (data.get("draft_submission") or {}).get("project_title"),
+            "decision": (data.get("decision_result") or {}).get("decision")
+            if isinstance(data.get("decision_result"), dict) else None,
+        }
+        with self._lock:
+            if only_new and context_id in self._digests:
+                return
+            if self._raw_digests.get(context_id) == raw_digest:
+                self._meta[context_id] = meta
+                return
+        digest = text_digest(description)
+        signature = self.signature(description)
+        with self._lock:
+            self._remove(context_id)
+            if signature is None:
+                return
+            self._raw_digests[context_id] = raw_digest
+            self._meta[context_id] = meta
+            self._signatures[context_id] = signature
+            self._digests[context_id] = digest
+            self._by_digest.setdefault(digest, set()).add(context_id)
+            for band, key in zip(self._buckets, self._band_keys(signature)):
+                band.setdefault(key, set()).add(context_id)
+
+    def _remove(self, context_id: str):
+        signature = self._signatures.pop(context_id, None)
+        digest = self._digests.pop(context_id, None)
+        self._raw_digests.pop(context_id, None)
+        self._meta.pop(context_id, None)
+        if digest is not None:
+            ids = self._by_digest.get(digest)
+            if ids is not None:
+                ids.discard(context_id)
+                if not ids:
+                    del self._by_digest[digest]
+        if signature is not None:
+            for band, key in zip(self._buckets, self._band_keys(signature)):
+                ids = band.get(key)
+                if ids is not None:
+                    ids.discard(context_id)
+                    if not ids:
+                        del band[key]
+
+    def forget(self, context_id: str):
+        with self._lock:
+            self._remove(context_id)
+
+    def load(self):
+        """
+        Index every saved workflow context once; afterwards saves keep the index current.
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            count = 0
+            for context_id, data in iter_stored_contexts(self.output_dir, "Duplicate index"):
+                self.observe(context_id, data, only_new=True)
+                count += 1
+            self._loaded = True
+            print(f"Duplicate index loaded {count} workflows in {time.perf_counter() - started:.2f}s")
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    # --- Lookups ---
+    def lookup(self, signature: Optional[np.ndarray], digest: Optional[str] = None,
+               threshold: float = DUPLICATE_THRESHOLD, limit: int = 5,
+               exclude: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Stored workflows whose estimated similarity to `signature` is at least `threshold`,
+        best first. Workflows with the same normalized text (`digest`) are exact duplicates.
+        """
+        if signature is None:
+            return []
+        started = time.perf_counter()
+        with self._lock:
+            candidates: Set[str] = set()
+            for band, key in zip(self._buckets, self._band_keys(signature)):
+                ids = band.get(key)
+                if ids:
+                    candidates |= ids
+            candidates.discard(exclude)
+            identical = self._by_digest.get(digest, set()) if digest else set()
+            matches = []
+            for context_id in candidates:
+                similarity = 1.0 if context_id in identical else \
+                    float(np.count_nonzero(self._signatures[context_id] == signature)) / self.num_perm
+                if similarity >= threshold:
+                    matches.append({"context_id": context_id, "similarity": round(similarity, 3),
+                                    "identical": context_id in identical, **self._meta[context_id]})
+        matches.sort(key=lambda m: (-m["similarity"], m["context_id"]))
+        DUPLICATE_LOOKUP_SECONDS.observe(time.perf_counter() - started)
+        return matches[:limit]
+
+    def find(self, text: str, threshold: float = DUPLICATE_THRESHOLD, limit: int = 5,
+             exclude: Optional[str] = None) -> List[Dict[str, Any]]:
+        self.load()
+        return self.lookup(self.signature(text), text_digest(text), threshold, limit, exclude)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "loaded": self._loaded,
+                "workflows": len(self._signatures),
+                "num_perm": self.num_perm,
+                "bands": self.bands,
+                "largest_bucket": max((len(ids) for band in self._buckets for ids in band.values()), default=0),
+            }
+
+
+def reusable_step(step: str, context: Any, prior: Any, rerun: Set[str]) -> bool:
+    """
+    Whether a workflow seeded from `prior` can keep prior's output for `step` instead of
+    rerunning it. The mapping steps are rerun whenever the catalog they read has changed
+    since prior ran. For an identical description everything else is kept until a step
+    has to rerun, after which every later step reruns too. Otherwise the draft is
+    regenerated, and the mapping steps are kept only while the new draft stays close to
+    the prior one and no earlier mapping step was rerun. QA and the decision always rerun
+    so they reflect the new description.
+    """
+    mapping_step = step not in ("generate_draft", "flag_issues", "evaluate_decision")
+    if mapping_step:
+        catalog = "risks" if step == "map_risks" else "controls"
+        if (context.catalog_versions.get(catalog) or {}).get("digest") != \
+                (prior.catalog_versions.get(catalog) or {}).get("digest"):
+            return False
+    if text_digest(context.project_description) == text_digest(prior.project_description):
+        return not rerun
+    if not mapping_step or rerun - {"generate_draft"}:
+        return False
+    return jaccard(context.draft_submission, prior.draft_submission) >= DRAFT_REUSE_THRESHOLD
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+from instrumentation import Counter
+
+HEDGES = Counter("rcsa_hedges_total", "Hedged model requests by outcome", ("route", "outcome"))
+DEADLINES_EXCEEDED = Counter("rcsa_deadline_exceeded_total", "Model calls or steps that hit their deadline", ("scope",))
+
+
+@dataclass
+class HedgingConfig:
+    # Fire a duplicate request when the first is slower than the route's recent p95
+    enabled: bool = os.getenv("RCSA_HEDGING", "0") == "1"
+    percentile: float = float(os.getenv("RCSA_HEDGE_PERCENTILE", "95"))
+    # Never hedge sooner than this, and only once a route has enough latency samples
+    min_delay: float = float(os.getenv("RCSA_HEDGE_MIN_DELAY", "0.5"))
+    min_samples: int = int(os.getenv("RCSA_HEDGE_MIN_SAMPLES", "20"))
+    # Hedges may add at most this fraction of extra requests on top of primary traffic
+    budget_ratio: float = float(os.getenv("RCSA_HEDGE_BUDGET", "0.1"))
+    budget_burst: float = 10.0
+    # No hedging for this long after the service throttled us (429)
+    throttle_cooldown: float = float(os.getenv("RCSA_HEDGE_THROTTLE_COOLDOWN", "30"))
+    # Per model call deadline (seconds), covering the primary and any hedge
+    call_deadline: float = float(os.getenv("RCSA_MODEL_CALL_DEADLINE", "120"))
+    # Per workflow step deadline (seconds), covering every model and tool call in the step
+    step_deadline: float = float(os.getenv("RCSA_STEP_DEADLINE", "600"))
+
+
+HEDGING = HedgingConfig()
+
+
+class HedgeBudget:
+    """
+    Token bucket tying hedges to primary traffic: each primary call earns `budget_ratio`
+    tokens and each hedge spends one, so hedging cannot multiply load during an incident.
+    """
+
+    def __init__(self, config: HedgingConfig):
+        self.config = config
+        self.tokens = config.budget_burst
+        self.last_throttled = 0.0
+
+    def earn(self):
+        self.tokens = min(self.config.budget_burst, self.tokens + self.config.budget_ratio)
+
+    def throttled_recently(self) -> bool:
+        return time.monotonic() - self.last_throttled < self.config.throttle_cooldown
+
+    def try_spend(self) -> bool:
+        if self.throttled_recently() or self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+budget = HedgeBudget(HEDGING)
+
+
+async def observe_throttling(response):
+    """
+    httpx response hook: a 429 pauses hedging so duplicates don't deepen rate limiting.
+    """
+    if response.status_code == 429:
+        budget.last_throttled = time.monotonic()
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+async def _cancel(*tasks: asyncio.Future):
+    """
+    Cancel unfinished tasks and wait for them to unwind, so losing requests release their
+    connections. A cancellation of the caller while waiting still propagates.
+    """
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+    if tasks:
+        await asyncio.wait(tasks)
+    for task in tasks:
+        if not task.cancelled():
+            task.exception()  # mark retrieved
+
+
+async def hedged_call(route: str, make_call: Callable[[], Awaitable[Any]], hedge_after: Optional[float],
+                      on_loser: Optional[Callable[[Optional[Any], Any], None]] = None) -> Any:
+    """
+    Run `make_call` under the per-call deadline. If hedging is on and the call is still
+    running after `hedge_after` seconds, start a duplicate and return whichever succeeds
+    first; the loser is cancelled. Both are cancelled if the caller is cancelled.
+    `on_loser(loser_result, winner_result)` is called for a loser that was still billed:
+    with its result if it finished too, or None if it was cancelled mid-request.
+    """
+    deadline = HEDGING.call_deadline
+    started = time.monotonic()
+    budget.earn()
+    primary = asyncio.ensure_future(make_call())
+    tasks = [primary]
+    winner: Optional[asyncio.Future] = None
+    try:
+        if HEDGING.enabled and hedge_after is not None and hedge_after < deadline:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                if budget.try_spend():
+                    tasks.append(asyncio.ensure_future(make_call()))
+                    HEDGES.inc(route=route, outcome="fired")
+                else:
+                    HEDGES.inc(route=route, outcome="suppressed")
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            timeout = deadline - (time.monotonic() - started)
+            if timeout <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception() is None:
+                    if len(tasks) > 1:
+                        HEDGES.inc(route=route, outcome="hedge_won" if task is not primary else "primary_won")
+                    winner = task
+                    return task.result()
+                error = error or task.exception()
+        if error is not None and not pending:
+            raise error
+        DEADLINES_EXCEEDED.inc(scope="model_call")
+        raise DeadlineExceeded(f"model call on route '{route}' exceeded {deadline}s")
+    finally:
+        await _cancel(*tasks)
+        if winner is not None and on_loser is not None:
+            for task in tasks:
+                # A loser that failed outright was not billed; one cancelled mid-request was
+                if task is winner or (not task.cancelled() and task.exception() is not None):
+                    continue
+                on_loser(None if task.cancelled() else task.result(), winner.result())
+
+
+async def with_step_deadline(step: str, coro: Awaitable[Any]) -> Any:
+    try:
+        return await asyncio.wait_for(coro, timeout=HEDGING.step_deadline)
+    except asyncio.TimeoutError:
+        DEADLINES_EXCEEDED.inc(scope="step")
+        raise DeadlineExceeded(f"step '{step}' exceeded {HEDGING.step_deadline}s")
@@ -0,0 +1,315 @@
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter as TallyCounter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# --- Prometheus-style Metrics ---
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry_lock = threading.Lock()
+_REGISTRY: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        with _registry_lock:
+            _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with _registry_lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self):
+        lines = super().render()
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with _registry_lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # key -> (bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _registry_lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = super().render()
+        for key, (counts, total, count) in sorted(self._values.items()):
+            for bound, c in zip(self.buckets, counts):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {c}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render_prometheus() -> str:
+    with _registry_lock:
+        metrics = list(_REGISTRY)
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STEP_DURATION = Histogram("rcsa_step_duration_seconds", "Wall time per workflow step", ("step",))
+STEPS_TOTAL = Counter("rcsa_steps_total", "Workflow steps executed", ("step", "outcome"))
+MODEL_CALL_DURATION = Histogram(
+    "rcsa_model_call_duration_seconds", "Latency of individual model calls", ("route", "deployment"))
+MODEL_TOKENS = Counter("rcsa_model_tokens_total", "Model tokens used", ("route", "kind"))
+TOOL_CALLS = Counter("rcsa_tool_calls_total", "Function tool invocations", ("tool", "outcome"))
+TOOL_DURATION = Histogram("rcsa_tool_duration_seconds", "Wall time per function tool call", ("tool",))
+CONTEXT_IO_DURATION = Histogram(
+    "rcsa_context_io_seconds", "Time spent saving and loading workflow contexts", ("op",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+HTTP_REQUEST_DURATION = Histogram(
+    "rcsa_http_request_duration_seconds", "FastAPI request latency", ("method", "route", "status"))
+MODEL_RETRIES = Counter(
+    "rcsa_model_retries_total", "Model calls repeated because of throttling, errors, escalation or re-asks",
+    ("reason",))
+
+
+# --- Per-step Attribution ---
+@dataclass
+class StepMetrics:
+    wall_seconds: float = 0.0
+    model_seconds: float = 0.0
+    model_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    tool_calls: Dict[str, int] = field(default_factory=dict)
+    retries: int = 0
+
+    def to_dict(self):
+        return {
+            "wall_seconds": round(self.wall_seconds, 4),
+            "model_seconds": round(self.model_seconds, 4),
+            "model_calls": self.model_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "tool_calls": dict(self.tool_calls),
+            "retries": self.retries,
+        }
+
+
+# Set while a workflow step runs; model calls and tools made anywhere below it
+# (including nested agent-as-tool runs) are attributed to this step.
+_current_step: contextvars.ContextVar[Optional[StepMetrics]] = contextvars.ContextVar(
+    "rcsa_current_step", default=None)
+
+
+@contextmanager
+def measure_step(step: str):
+    """
+    Time a workflow step and collect the model and tool activity beneath it.
+    Yields the StepMetrics, which is complete once the block exits.
+    """
+    metrics = StepMetrics()
+    token = _current_step.set(metrics)
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield metrics
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        metrics.wall_seconds = time.perf_counter() - start
+        _current_step.reset(token)
+        STEP_DURATION.observe(metrics.wall_seconds, step=step)
+        STEPS_TOTAL.inc(step=step, outcome=outcome)
+
+
+def record_model_call(route: str, deployment: str, seconds: float, prompt_tokens: int, completion_tokens: int):
+    MODEL_CALL_DURATION.observe(seconds, route=route, deployment=deployment)
+    MODEL_TOKENS.inc(prompt_tokens, route=route, kind="prompt")
+    MODEL_TOKENS.inc(completion_tokens, route=route, kind="completion")
+    step = _current_step.get()
+    if step is not None:
+        step.model_seconds += seconds
+        step.model_calls += 1
+        step.prompt_tokens += prompt_tokens
+        step.completion_tokens += completion_tokens
+
+
+def record_retry(reason: str):
+    MODEL_RETRIES.inc(reason=reason)
+    step = _current_step.get()
+    if step is not None:
+        step.retries += 1
+
+
+def instrumented_tool(func):
+    """
+    Wrap a function tool coroutine to count and time its calls. Apply beneath @function_tool.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        outcome = "ok"
+        step = _current_step.get()
+        if step is not None:
+            step.tool_calls[name] = step.tool_calls.get(name, 0) + 1
+        try:
+            return await func(*args, **kwargs)
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            TOOL_DURATION.observe(time.perf_counter() - start, tool=name)
+            TOOL_CALLS.inc(tool=name, outcome=outcome)
+
+    return wrapper
+
+
+@contextmanager
+def timed_context_io(op: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        CONTEXT_IO_DURATION.observe(time.perf_counter() - start, op=op)
+
+
+async def count_retryable_response(response):
+    """
+    httpx response hook: 429 and 5xx responses are retried by the OpenAI client.
+    """
+    if response.status_code == 429 or response.status_code >= 500:
+        record_retry(f"http_{response.status_code}")
+
+
+# --- Sampling Profiler ---
+class SamplingProfiler:
+    """
+    Low-overhead stack sampler for production use. A daemon thread snapshots the stacks
+    of all other threads every `interval` seconds and tallies them in folded form
+    (root;caller;callee), suitable for flame graphs.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: TallyCounter = TallyCounter()
+        self.sample_count = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _fold(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                self.samples[self._fold(frame)] += 1
+            self.sample_count += 1
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rcsa-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        self._thread = None
+
+    def reset(self):
+        self.samples.clear()
+        self.sample_count = 0
+
+    def report(self, limit: int = 20) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": self.sample_count,
+            "top_stacks": [{"stack": stack, "count": count} for stack, count in self.samples.most_common(limit)],
+        }
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+profiler = SamplingProfiler(interval=float(os.getenv("RCSA_PROFILER_INTERVAL", "0.005")))
+if os.getenv("RCSA_PROFILER") == "1":
+    profiler.start()
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from model_routing import chat_completion
+from structured_output import repair_json
+
+# Seconds to wait after the first unsummarized message so a burst is folded into one update
+SUMMARY_DEBOUNCE = float(os.getenv("RCSA_INTAKE_SUMMARY_DEBOUNCE", "2.0"))
+
+SUMMARY_FIELDS = {
+    "project_title": "A clear, descriptive title",
+    "objectives": "What the project aims to achieve (list)",
+    "scope": "What is included and excluded",
+    "key_activities": "Main tasks and deliverables (list)",
+    "timeline": "Mentioned timeframes or milestones",
+    "stakeholders": "Who will be affected (list)",
+    "technology": "Technical components and systems (list)",
+    "data_sensitivity": "Kinds of data handled and how sensitive they are",
+    "third_parties": "Vendors or external parties involved (list)",
+    "business_value": "Expected benefits or outcomes",
+    "dependencies": "Prerequisites or dependencies (list)",
+    "open_questions": "Details that still need to be clarified (list)",
+}
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running project summary for a risk assessment intake interview. "
+    "You receive the current summary and only the newest messages of the conversation. "
+    "Return the complete updated summary as a JSON object with exactly these keys: "
+    + json.dumps(SUMMARY_FIELDS)
+    + ". Keep existing details unless the new messages correct them, add new details, "
+    "remove answered items from open_questions, and use empty strings or lists for unknowns."
+)
+
+
+@dataclass
+class _SummaryState:
+    summary: Dict[str, Any] = field(default_factory=dict)
+    seen_ids: set = field(default_factory=set)
+    pending: List[Dict[str, Any]] = field(default_factory=list)
+    processed_messages: int = 0
+    updates: int = 0
+    updated_at: Optional[float] = None
+    task: Optional[asyncio.Task] = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class IntakeSummarizer:
+    """
+    Keeps a structured project summary per conversation up to date as messages arrive.
+    Each update folds only the new messages into the existing summary, and updates are
+    debounced so a burst of messages costs one model call. Finalizing flushes whatever
+    is still pending and renders the summary as a project description.
+    """
+
+    def __init__(self, store=None, debounce: float = SUMMARY_DEBOUNCE):
+        self.store = store
+        self.debounce = debounce
+        self._states: Dict[str, _SummaryState] = {}
+
+    def _state(self, conversation_id: str) -> _SummaryState:
+        state = self._states.get(conversation_id)
+        if state is None:
+            state = _SummaryState()
+            cached = self.store.read_summary(conversation_id) if self.store else None
+            if cached:
+                state.summary = cached.get("summary", {})
+                state.seen_ids = set(cached.get("message_ids", []))
+                state.processed_messages = len(state.seen_ids)
+                state.updates = cached.get("updates", 0)
+            self._states[conversation_id] = state
+        return state
+
+    def submit(self, conversation_id: str, messages: List[Dict[str, Any]]) -> int:
+        """
+        Queue messages not summarized yet and schedule a debounced update. Returns the
+        number of newly queued messages. Must be called from the event loop.
+        """
+        state = self._state(conversation_id)
+        queued = 0
+        for message in messages:
+            if message.get("id") in state.seen_ids or not message.get("content"):
+                continue
+            state.seen_ids.add(message.get("id"))
+            state.pending.append(message)
+            queued += 1
+        if state.pending and (state.task is None or state.task.done()):
+            state.task = asyncio.create_task(self._debounced(conversation_id, state))
+        return queued
+
+    async def _debounced(self, conversation_id: str, state: _SummaryState):
+        try:
+            await asyncio.sleep(self.debounce)
+        except asyncio.CancelledError:
+            return
+        await self._flush(conversation_id, state)
+
+    async def _flush(self, conversation_id: str, state: _SummaryState):
+        async with state.lock:
+            # Messages arriving during an update are picked up by the next loop iteration
+            while state.pending:
+                batch, state.pending = state.pending, []
+                try:
+                    state.summary = await self._update(state.summary, batch)
+                except asyncio.CancelledError:
+                    state.pending = batch + state.pending
+                    raise
+                except Exception as e:
+                    print(f"Error updating intake summary for {conversation_id}: {e}")
+                    state.pending = batch + state.pending
+                    return
+                state.processed_messages += len(batch)
+                state.updates += 1
+                state.updated_at = time.time()
+                if self.store:
+                    pending_ids = {m.get("id") for m in state.pending}
+                    self.store.write_summary(conversation_id, {
+                        "summary": state.summary,
+                        "message_ids": [i for i in state.seen_ids if i not in pending_ids],
+                        "updates": state.updates,
+                    })
+
+    async def _update(self, summary: Dict[str, Any], batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        new_messages = "\n\n".join(
+            f"{'User' if m.get('role') == 'user' else 'AI Assistant'}: {m.get('content')}" for m in batch)
+        content = await chat_completion(
+            "intake_summary",
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": f"Current summary:\n{json.dumps(summary)}\n\nNew messages:\n{new_messages}"},
+            ],
+            temperature=0.2,
+            response_format={"type": "json_object"},
+        )
+        updated = repair_json(content)
+        if not isinstance(updated, dict):
+            raise ValueError("intake summary is not a JSON object")
+        return {**summary, **{k: v for k, v in updated.items() if k in SUMMARY_FIELDS}}
+
+    async def finalize(self, conversation_id: str, messages: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Summarize any messages not folded in yet and render the project description.
+        Returns None when no summary could be produced.
+        """
+        state = self._state(conversation_id)
+        self.submit(conversation_id, messages)
+        # Skip the debounce wait, but let an update already talking to the model finish
+        if state.task is not None and not state.task.done() and not state.lock.locked():
+            state.task.cancel()
+        await self._flush(conversation_id, state)
+        if not state.summary or state.pending:
+            return None
+        return render_summary(state.summary)
+
+    def status(self, conversation_id: str) -> Dict[str, Any]:
+        state = self._state(conversation_id)
+        return {
+            "summary": state.summary,
+            "processed_messages": state.processed_messages,
+            "pending_messages": len(state.pending),
+            "updates": state.updates,
+            "updated_at": state.updated_at,
+        }
+
+    def forget(self, conversation_id: str):
+        state = self._states.pop(conversation_id, None)
+        if state and state.task is not None and not state.task.done():
+            state.task.cancel()
+
+
+def render_summary(summary: Dict[str, Any]) -> str:
+    lines = [f"# {summary.get('project_title') or 'Untitled Project'}", ""]
+    for key in SUMMARY_FIELDS:
+        if key == "project_title":
+            continue
+        value = summary.get(key)
+        if not value:
+            continue
+        lines.append(f"**{key.replace('_', ' ').title()}:**")
+        if isinstance(value, list):
+            lines.extend(f"- {item}" for item in value)
+        else:
+            lines.append(str(value))
+        lines.append("")
+    return "\n".join(lines).strip()
@@ -0,0 +1,291 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from instrumentation import count_retryable_response, record_model_call, record_retry
+from hedging import HEDGING, hedged_call, observe_throttling
+from budgets import budget_degraded, check_budget, record_hedge_loser, record_usage
+
+load_dotenv()
+
+# --- Deployment Tiers ---
+# The large tier is the flagship deployment every agent used before routing existed.
+# The small tier falls back to the large one, so an unset variable keeps today's behaviour.
+LARGE_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+SMALL_DEPLOYMENT = os.getenv("AZURE_OPENAI_SMALL_DEPLOYMENT") or LARGE_DEPLOYMENT
+
+TIERS = {
+    "large": LARGE_DEPLOYMENT,
+    "small": SMALL_DEPLOYMENT,
+}
+
+# Number of recent latencies kept per route for percentile stats
+LATENCY_WINDOW = 1000
+
+
+@dataclass
+class ModelRoute:
+    # Tier name ("small"/"large") or a literal deployment name
+    tier: str = "large"
+    # Try `tier` first and escalate to `escalate_to` when the output is rejected
+    cascade: bool = False
+    escalate_to: str = "large"
+    # Escalate when any self-reported "confidence" in the output is below this value
+    min_confidence: float = 0.0
+
+
+# --- Routing Table ---
+# One entry per agent (by agent name) and per helper tool that calls the model directly.
+# Override any entry with a JSON file pointed to by RCSA_MODEL_ROUTES, e.g.
+# {"qa_agent": {"tier": "large"}, "evaluate_guardrails": {"tier": "small", "cascade": true}}
+MODEL_ROUTES: Dict[str, ModelRoute] = {
+    "orchestrator_agent": ModelRoute(tier="large"),
+    "feedback_agent": ModelRoute(tier="large"),
+    "draft_agent": ModelRoute(tier="large"),
+    "mapping_agent": ModelRoute(tier="large"),
+    "controls_agent": ModelRoute(tier="large"),
+    "mitigation_agent": ModelRoute(tier="large"),
+    "qa_agent": ModelRoute(tier="small", cascade=True),
+    "decision_agent": ModelRoute(tier="large"),
+    "guardrail_agent": ModelRoute(tier="small", cascade=True),
+    "evaluate_guardrails": ModelRoute(tier="small", cascade=True),
+    "evaluate_approval": ModelRoute(tier="large"),
+    "analyze_conversation": ModelRoute(tier="large"),
+    "intake_summary": ModelRoute(tier="small", cascade=True),
+    "json_repair": ModelRoute(tier="small", cascade=True),
+}
+
+_routes_file = os.getenv("RCSA_MODEL_ROUTES")
+if _routes_file and os.path.exists(_routes_file):
+    with open(_routes_file, 'r', encoding='utf-8') as f:
+        for _name, _cfg in json.load(f).items():
+            MODEL_ROUTES[_name] = ModelRoute(**_cfg)
+
+
+def get_route(name: str) -> ModelRoute:
+    return MODEL_ROUTES.get(name) or ModelRoute()
+
+
+def resolve_deployment(tier: str) -> str:
+    return TIERS.get(tier, tier)
+
+
+# --- Route Statistics ---
+def _percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+@dataclass
+class RouteStats:
+    calls: int = 0
+    escalations: int = 0
+    errors: int = 0
+    latencies: deque = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    # Calls and recent latencies per deployment actually used by this route
+    deployment_calls: Dict[str, int] = field(default_factory=dict)
+    deployment_latencies: Dict[str, deque] = field(default_factory=dict)
+
+    def record(self, deployment: str, seconds: float):
+        self.latencies.append(seconds)
+        self.deployment_calls[deployment] = self.deployment_calls.get(deployment, 0) + 1
+        if deployment not in self.deployment_latencies:
+            self.deployment_latencies[deployment] = deque(maxlen=LATENCY_WINDOW)
+        self.deployment_latencies[deployment].append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        return _percentile(self.latencies, pct)
+
+    def hedge_after(self, deployment: str) -> Optional[float]:
+        """
+        Delay before hedging a call to `deployment`: its recent tail latency, once known.
+        """
+        samples = self.deployment_latencies.get(deployment)
+        if not samples or len(samples) < HEDGING.min_samples:
+            return None
+        return max(HEDGING.min_delay, _percentile(samples, HEDGING.percentile))
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "escalations": self.escalations,
+            "escalation_rate": (self.escalations / self.calls) if self.calls else 0.0,
+            "errors": self.errors,
+            "latency_p50": self.percentile(50),
+            "latency_p95": self.percentile(95),
+            "deployment_calls": dict(self.deployment_calls),
+        }
+
+
+ROUTE_STATS: Dict[str, RouteStats] = {}
+
+
+def route_stats(name: str) -> RouteStats:
+    if name not in ROUTE_STATS:
+        ROUTE_STATS[name] = RouteStats()
+    return ROUTE_STATS[name]
+
+
+def get_route_stats() -> Dict[str, Any]:
+    return {name: stats.to_dict() for name, stats in ROUTE_STATS.items()}
+
+
+# --- Output Validation ---
+# Validators decide whether a small-tier answer is good enough or must be escalated.
+# They take the raw text and the route and return True to accept.
+OutputValidator = Callable[[str, ModelRoute], bool]
+_VALIDATORS: Dict[str, OutputValidator] = {}
+
+
+def register_validator(route_name: str, validator: OutputValidator):
+    _VALIDATORS[route_name] = validator
+
+
+def _strip_fences(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+def _confidences(data: Any) -> List[float]:
+    found = []
+    if isinstance(data, dict):
+        for k, v in data.items():
+            if k == "confidence" and isinstance(v, (int, float)):
+                found.append(float(v))
+            else:
+                found.extend(_confidences(v))
+    elif isinstance(data, list):
+        for item in data:
+            found.extend(_confidences(item))
+    return found
+
+
+def default_validator(text: str, route: ModelRoute) -> bool:
+    """
+    Accept output that parses as JSON and whose self-reported confidences meet the route threshold.
+    """
+    if not text:
+        return False
+    try:
+        data = json.loads(_strip_fences(text))
+    except Exception:
+        return False
+    confidences = _confidences(data)
+    if confidences and min(confidences) < route.min_confidence:
+        return False
+    return True
+
+
+def validate_output(route_name: str, text: str) -> bool:
+    validator = _VALIDATORS.get(route_name, default_validator)
+    try:
+        return validator(text, get_route(route_name))
+    except Exception:
+        return False
+
+
+# --- Shared Client ---
+# Built on first use so importing this module (and serving CRUD) does not load the openai SDK
+_client = None
+_client_lock = threading.Lock()
+
+
+def missing_settings() -> List[str]:
+    """
+    Environment variables the client and the large tier still need.
+    """
+    missing = [name for name in ("AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_VERSION", "AZURE_OPENAI_DEPLOYMENT")
+               if not os.getenv(name)]
+    if not (os.getenv("AZURE_OPENAI_API_KEY") or os.getenv("AZURE_OPENAI_AD_TOKEN")):
+        missing.append("AZURE_OPENAI_API_KEY")
+    return missing
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+                _client = AsyncAzureOpenAI(
+                    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+                    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                    timeout=HEDGING.call_deadline,
+                    # Count throttled/failed responses the client retries internally; 429s also pause hedging
+                    http_client=DefaultAsyncHttpxClient(
+                        event_hooks={"response": [count_retryable_response, observe_throttling]}),
+                )
+    return _client
+
+
+def client_ready() -> bool:
+    return _client is not None
+
+
+def configure_routing(openai_client):
+    """
+    Use `openai_client` instead of the one built from the environment.
+    """
+    global _client
+    _client = openai_client
+
+
+async def chat_completion(route_name: str, messages: List[Dict[str, Any]], **kwargs) -> str:
+    """
+    Routed replacement for `openai_client.chat.completions.create` used by helper tools.
+    Returns the message content of the accepted completion.
+    """
+    # Raises BudgetExceeded once the calling workflow run has used up its budget
+    check_budget()
+    route = get_route(route_name)
+    stats = route_stats(route_name)
+    stats.calls += 1
+
+    def _tokens(resp) -> Tuple[int, int]:
+        usage = resp.usage
+        return (usage.prompt_tokens, usage.completion_tokens) if usage else (0, 0)
+
+    async def _call(deployment: str) -> str:
+        start = time.perf_counter()
+        try:
+            resp = await hedged_call(
+                route_name,
+                lambda: get_client().chat.completions.create(model=deployment, messages=messages, **kwargs),
+                None if budget_degraded() else stats.hedge_after(deployment),
+                lambda loser, winner: record_hedge_loser(
+                    route_name, deployment, _tokens(loser) if loser is not None else None, _tokens(winner)[0]),
+            )
+        except Exception:
+            stats.errors += 1
+            stats.record(deployment, time.perf_counter() - start)
+            raise
+        elapsed = time.perf_counter() - start
+        stats.record(deployment, elapsed)
+        prompt_tokens, completion_tokens = _tokens(resp)
+        record_model_call(route_name, deployment, elapsed, prompt_tokens, completion_tokens)
+        record_usage(route_name, deployment, prompt_tokens, completion_tokens)
+        return resp.choices[0].message.content
+
+    first = resolve_deployment(route.tier)
+    content = await _call(first)
+    escalate_deployment = resolve_deployment(route.escalate_to)
+    # A run close to its budget keeps the first answer rather than paying for the large tier
+    if not route.cascade or escalate_deployment == first or budget_degraded() or validate_output(route_name, content):
+        return content
+    stats.escalations += 1
+    record_retry("escalation")
+    return await _call(escalate_deployment)
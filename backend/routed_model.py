@@ -0,0 +1,103 @@
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from agents import Model, ModelResponse, OpenAIChatCompletionsModel, ItemHelpers
+
+from instrumentation import record_model_call, record_retry
+from hedging import hedged_call
+from budgets import budget_degraded, check_budget, record_hedge_loser, record_usage
+from model_routing import RouteStats, get_client, get_route, resolve_deployment, route_stats, validate_output
+
+# Agents SDK side of model routing. Kept apart from model_routing so the routing table,
+# stats and chat_completion can be imported without loading the Agents SDK.
+
+# --- Shared Models ---
+# Client each model was built against, so a client swapped in by configure_routing is picked up
+_models: Dict[str, Tuple[Any, OpenAIChatCompletionsModel]] = {}
+
+
+def _shared_model(deployment: str) -> OpenAIChatCompletionsModel:
+    # One model instance per deployment, shared by every agent routed to it
+    client = get_client()
+    cached = _models.get(deployment)
+    if cached is None or cached[0] is not client:
+        cached = _models[deployment] = (client, OpenAIChatCompletionsModel(model=deployment, openai_client=client))
+    return cached[1]
+
+
+def _final_text(response: ModelResponse) -> Optional[str]:
+    """
+    Return the text of a model response that ends the turn, or None if it requests tool calls.
+    """
+    text = None
+    for item in response.output:
+        if getattr(item, "type", None) == "function_call":
+            return None
+        item_text = ItemHelpers.extract_last_text(item)
+        if item_text is not None:
+            text = item_text
+    return text
+
+
+class RoutedChatCompletionsModel(Model):
+    """
+    Agents SDK model that resolves its deployment from MODEL_ROUTES and, for cascading routes,
+    escalates final answers that fail validation to the larger deployment.
+    """
+
+    def __init__(self, route_name: str):
+        self.route_name = route_name
+
+    async def get_response(self, *args, **kwargs) -> ModelResponse:
+        # Raises BudgetExceeded once the calling workflow run has used up its budget
+        check_budget()
+        route = get_route(self.route_name)
+        stats = route_stats(self.route_name)
+        stats.calls += 1
+        first = resolve_deployment(route.tier)
+        response = await self._timed(first, stats, *args, **kwargs)
+        escalate_deployment = resolve_deployment(route.escalate_to)
+        if not route.cascade or escalate_deployment == first or budget_degraded():
+            return response
+        text = _final_text(response)
+        if text is None or validate_output(self.route_name, text):
+            return response
+        stats.escalations += 1
+        record_retry("escalation")
+        return await self._timed(escalate_deployment, stats, *args, **kwargs)
+
+    async def _timed(self, deployment: str, stats: RouteStats, *args, **kwargs) -> ModelResponse:
+        start = time.perf_counter()
+        model = _shared_model(deployment)
+        try:
+            response = await hedged_call(
+                self.route_name, lambda: model.get_response(*args, **kwargs),
+                None if budget_degraded() else stats.hedge_after(deployment),
+                lambda loser, winner: record_hedge_loser(
+                    self.route_name, deployment,
+                    (loser.usage.input_tokens, loser.usage.output_tokens) if loser is not None else None,
+                    winner.usage.input_tokens),
+            )
+        except Exception:
+            stats.errors += 1
+            stats.record(deployment, time.perf_counter() - start)
+            raise
+        elapsed = time.perf_counter() - start
+        stats.record(deployment, elapsed)
+        record_model_call(self.route_name, deployment, elapsed,
+                          response.usage.input_tokens, response.usage.output_tokens)
+        record_usage(self.route_name, deployment, response.usage.input_tokens, response.usage.output_tokens)
+        return response
+
+    def stream_response(self, *args, **kwargs):
+        route = get_route(self.route_name)
+        return _shared_model(resolve_deployment(route.tier)).stream_response(*args, **kwargs)
+
+
+_routed_models: Dict[str, RoutedChatCompletionsModel] = {}
+
+
+def get_model(route_name: str) -> RoutedChatCompletionsModel:
+    if route_name not in _routed_models:
+        _routed_models[route_name] = RoutedChatCompletionsModel(route_name)
+    return _routed_models[route_name]
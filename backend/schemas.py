@@ -0,0 +1,70 @@
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, TypeAdapter
+
+# --- Step Output Schemas ---
+# Fields are kept free of defaults and numeric bounds so the same models can be sent
+# to Azure OpenAI as strict structured-output schemas.
+
+class DraftSubmission(BaseModel):
+    project_title: str
+    project_description: str
+    objectives: List[str]
+    benefits: List[str]
+    deliverables: List[str]
+
+class RiskMappingItem(BaseModel):
+    risk: str
+    category_level_1: str
+    category_level_2: Optional[str]
+    category_level_3: Optional[str]
+    confidence: float
+
+class MappedControl(BaseModel):
+    control_id: str
+    name: str
+    relevance_score: float
+
+class ControlsMappingItem(BaseModel):
+    risk: str
+    controls: List[MappedControl]
+
+class MitigationProposal(BaseModel):
+    risk: str
+    control_id: str
+    mitigation_steps: List[str]
+
+class QAIssue(BaseModel):
+    issue: str
+    severity: str
+    recommendation: str
+
+class DecisionResult(BaseModel):
+    decision: Literal["Approved", "Rejected"]
+    rationale: str
+
+# Output type per workflow step; list steps are validated item by item
+STEP_OUTPUT_TYPES: Dict[str, Any] = {
+    "generate_draft": DraftSubmission,
+    "map_risks": List[RiskMappingItem],
+    "map_controls": List[ControlsMappingItem],
+    "generate_mitigations": List[MitigationProposal],
+    "flag_issues": List[QAIssue],
+    "evaluate_decision": DecisionResult,
+}
+
+# Pydantic model of a single item for list steps, or of the whole output for object steps
+STEP_ITEM_MODELS: Dict[str, type] = {
+    "generate_draft": DraftSubmission,
+    "map_risks": RiskMappingItem,
+    "map_controls": ControlsMappingItem,
+    "generate_mitigations": MitigationProposal,
+    "flag_issues": QAIssue,
+    "evaluate_decision": DecisionResult,
+}
+
+LIST_STEPS = {"map_risks", "map_controls", "generate_mitigations", "flag_issues"}
+
+STEP_JSON_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    step: TypeAdapter(output_type).json_schema() for step, output_type in STEP_OUTPUT_TYPES.items()
+}
@@ -0,0 +1,460 @@
+import bisect
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from archive import iter_stored_contexts
+from catalog_repo import CatalogSnapshot
+from instrumentation import Histogram
+
+SEARCH_QUERY_SECONDS = Histogram(
+    "rcsa_search_query_seconds", "Full-text search query time", ("index",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5),
+)
+
+# Precedents returned to the agents per tool call
+PRECEDENT_LIMIT = int(os.getenv("RCSA_PRECEDENT_LIMIT", "5"))
+# Indexed terms a partly typed last word of a workflow search expands to
+PREFIX_TERMS = int(os.getenv("RCSA_SEARCH_PREFIX_TERMS", "20"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be been but by for from has have in into is it its no not of on or "
+    "such that the their then there these they this to was were will with".split()
+)
+
+
+def tokenize(text: Any) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(str(text or "").lower()) if t not in _STOPWORDS]
+
+
+def _text(value: Any) -> str:
+    """
+    Flatten strings, lists and dicts into one space-separated string of their values.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, dict):
+        return " ".join(_text(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return " ".join(_text(v) for v in value)
+    return str(value)
+
+
+class InvertedIndex:
+    """
+    BM25-ranked inverted index over documents keyed by string ids. A document is a list
+    of (text, weight) fields; a term's frequency is the sum of the weights of the fields
+    it occurs in, so titles can count more than body text. Adding a key again replaces
+    the document, so the index can be maintained incrementally.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, float]] = {}
+        # Sorted terms for prefix lookups; rebuilt on the next lookup after the vocabulary changes
+        self._sorted_terms: Optional[List[str]] = None
+        self._ids: Dict[str, int] = {}
+        self._keys: List[Optional[str]] = []
+        self._lengths: List[float] = []
+        self._terms: List[Tuple[str, ...]] = []
+        self._free: List[int] = []
+        self._total_length = 0.0
+        self.payloads: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._ids
+
+    @property
+    def term_count(self) -> int:
+        return len(self._postings)
+
+    def add(self, key: str, fields: Iterable[Tuple[Any, float]], payload: Any = None):
+        self.remove(key)
+        frequencies: Dict[str, float] = {}
+        for text, weight in fields:
+            for term in tokenize(text):
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+        doc = self._free.pop() if self._free else len(self._keys)
+        if doc == len(self._keys):
+            self._keys.append(None)
+            self._lengths.append(0.0)
+            self._terms.append(())
+        length = sum(frequencies.values())
+        self._keys[doc] = key
+        self._lengths[doc] = length
+        self._terms[doc] = tuple(frequencies)
+        self._ids[key] = doc
+        self._total_length += length
+        for term, tf in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                self._sorted_terms = None
+            postings[doc] = tf
+        self.payloads[key] = payload
+
+    def remove(self, key: str):
+        doc = self._ids.pop(key, None)
+        if doc is None:
+            return
+        for term in self._terms[doc]:
+            postings = self._postings[term]
+            del postings[doc]
+            if not postings:
+                del self._postings[term]
+                self._sorted_terms = None
+        self._total_length -= self._lengths[doc]
+        self._keys[doc] = None
+        self._terms[doc] = ()
+        self._free.append(doc)
+        self.payloads.pop(key, None)
+
+    def collection_stats(self, terms: Iterable[str]) -> Tuple[int, float, Dict[str, int]]:
+        """
+        Document count, total length and per-term document frequencies, so several indexes
+        can be searched as one collection.
+        """
+        return len(self._ids), self._total_length, {t: len(self._postings.get(t, ())) for t in terms}
+
+    def completions(self, prefix: str, limit: int = PREFIX_TERMS) -> List[str]:
+        """
+        `prefix` itself if indexed, then the other indexed terms it begins, those in the
+        most documents first.
+        """
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        end = bisect.bisect_left(self._sorted_terms, prefix + "\uffff", start)
+        exact = [prefix] if prefix in self._postings else []
+        return exact + heapq.nlargest(
+            limit - len(exact), (t for t in self._sorted_terms[start:end] if t != prefix),
+            key=lambda t: len(self._postings[t]))
+
+    def search(self, query: str, offset: int = 0, limit: int = 10,
+               accept: Optional[Callable[[str], bool]] = None,
+               collection: Optional[Tuple[int, float, Dict[str, int]]] = None,
+               prefix: bool = False) -> Tuple[int, List[Tuple[str, float, List[str]]]]:
+        """
+        Rank documents matching any query term. Returns the number of matches and one page
+        of (key, score, matched terms), best first. `collection` replaces this index's own
+        statistics with those of a larger collection it is part of. With `prefix` the last
+        word, which may still be being typed (and may be a stopword), also matches the
+        terms it begins; a document scores its best such match.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        completions: List[str] = []
+        if prefix:
+            words = _TOKEN_RE.findall(str(query or "").lower())
+            if words:
+                completions = self.completions(words[-1])
+                terms = [t for t in terms if t != words[-1]]
+        if not (terms or completions) or not self._ids:
+            return 0, []
+        n_docs, total_length, frequencies = collection or self.collection_stats(terms + completions)
+        avg_length = total_length / n_docs or 1.0
+
+        def term_scores(term: str) -> Dict[int, float]:
+            postings = self._postings.get(term)
+            if not postings:
+                return {}
+            idf = math.log(1 + (n_docs - frequencies[term] + 0.5) / (frequencies[term] + 0.5))
+            return {doc: idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * self._lengths[doc] / avg_length))
+                    for doc, tf in postings.items()}
+
+        scores: Dict[int, float] = {}
+        for term in terms:
+            for doc, score in term_scores(term).items():
+                scores[doc] = scores.get(doc, 0.0) + score
+        best: Dict[int, float] = {}
+        for term in completions:
+            for doc, score in term_scores(term).items():
+                best[doc] = max(best.get(doc, 0.0), score)
+        for doc, score in best.items():
+            scores[doc] = scores.get(doc, 0.0) + score
+        terms += completions
+        if accept is not None:
+            scores = {doc: score for doc, score in scores.items() if accept(self._keys[doc])}
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: item[1])[offset:]
+        return len(scores), [
+            (self._keys[doc], round(score, 4), [t for t in terms if doc in self._postings.get(t, ())])
+            for doc, score in top
+        ]
+
+
+class PrecedentCorpus:
+    """
+    Past submissions indexed for the fetch_past_* tools. Submissions, their mitigations
+    and their issues each get their own index so every tool ranks the right unit. One
+    corpus is built per samples snapshot (see from_samples) and shared by the workflows
+    pinned to it; another holds the approved workflows, promoted as they complete.
+    """
+
+    def __init__(self):
+        self.submissions = InvertedIndex()
+        self.mitigations = InvertedIndex()
+        self.issues = InvertedIndex()
+        self._children: Dict[str, List[str]] = {}
+        self._lock = threading.RLock()
+
+    def add(self, submission: Dict[str, Any]):
+        sid = str(submission["submissionId"])
+        draft = submission.get("draft") or {}
+        summary = draft.get("project_summary", "")
+        with self._lock:
+            self.remove(sid)
+            self.submissions.add(sid, [
+                (summary, 2.0), (draft.get("identified_risks"), 2.0),
+                (_text([m.get("risk") for m in submission.get("mapping") or []]), 1.0),
+                (_text([c.get("name") for c in submission.get("controls") or []]), 1.0),
+                (_text(submission.get("mitigation")), 0.5), (_text(submission.get("issues")), 0.5),
+            ], submission)
+            children = []
+            for i, m in enumerate(submission.get("mitigation") or []):
+                key = f"{sid}/m{i}"
+                self.mitigations.add(key, [(m.get("risk"), 3.0), (_text(m.get("mitigation_steps")), 1.0)], {
+                    "submissionId": sid, "project_summary": summary, "risk": m.get("risk"),
+                    "control_id": m.get("control_id"), "mitigation_steps": m.get("mitigation_steps", []),
+                })
+                children.append(key)
+            for i, issue in enumerate(submission.get("issues") or []):
+                key = f"{sid}/i{i}"
+                self.issues.add(key, [(issue.get("issue"), 2.0), (issue.get("recommendation"), 1.0)],
+                                {"submissionId": sid, "project_summary": summary, **issue})
+                children.append(key)
+            self._children[sid] = children
+
+    def remove(self, submission_id: str):
+        with self._lock:
+            self.submissions.remove(submission_id)
+            for key in self._children.pop(submission_id, []):
+                self.mitigations.remove(key)
+                self.issues.remove(key)
+
+    @classmethod
+    def from_samples(cls, snapshot: CatalogSnapshot) -> "PrecedentCorpus":
+        """
+        The sample submissions of one samples snapshot; never changed afterwards.
+        """
+        corpus = cls()
+        for submission in snapshot.items:
+            corpus.add(submission)
+        return corpus
+
+    @staticmethod
+    def from_workflow(context_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        A workflow context in the sample submission shape.
+        """
+        draft = data.get("draft_submission") or {}
+        title = draft.get("project_title") or ""
+        description = draft.get("project_description") or (data.get("project_description") or "")[:1000]
+        risks = [r for r in data.get("risk_mapping") or [] if isinstance(r, dict)]
+        return {
+            "submissionId": context_id,
+            "source": "workflow",
+            "draft": {
+                "project_summary": f"{title}: {description}" if title else description,
+                "identified_risks": [r.get("risk") for r in risks],
+            },
+            "mapping": [{"risk": r.get("risk"), "category": r.get("category_level_1"),
+                         "subrisk": r.get("category_level_3"), "confidence": r.get("confidence")} for r in risks],
+            "controls": [c for item in data.get("controls_mapping") or [] if isinstance(item, dict)
+                         for c in item.get("controls") or []],
+            "mitigation": [m for m in data.get("mitigation_proposals") or [] if isinstance(m, dict)],
+            "issues": [i for i in data.get("issues_list") or [] if isinstance(i, dict)],
+        }
+
+    def collection_stats(self, kind: str, terms: List[str]) -> Tuple[int, float, Dict[str, int]]:
+        with self._lock:
+            return getattr(self, kind).collection_stats(terms)
+
+    def scored(self, kind: str, query: str, limit: int,
+               collection: Optional[Tuple[int, float, Dict[str, int]]] = None) -> List[Tuple[float, Any]]:
+        """
+        Up to `limit` (score, payload) matches from the submissions, mitigations or issues index.
+        """
+        index = getattr(self, kind)
+        with self._lock:
+            _, hits = index.search(query, limit=limit, collection=collection)
+            return [(score, index.payloads[key]) for key, score, _ in hits]
+
+    def first(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self.submissions.payloads.values())[:limit]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"submissions": len(self.submissions), "mitigations": len(self.mitigations),
+                    "issues": len(self.issues)}
+
+
+class PrecedentView:
+    """
+    What one workflow's fetch_past_* tools search: the corpus of the samples snapshot the
+    workflow pinned, so a samples edit mid-run does not change its precedents, plus the
+    approved workflows promoted so far. Matches from both are merged by score.
+    """
+
+    def __init__(self, samples: PrecedentCorpus, workflows: PrecedentCorpus):
+        self.samples = samples
+        self.workflows = workflows
+
+    # --- Lookups used by the fetch_past_* tools ---
+    def _lookup(self, kind: str, query: str, limit: int) -> List[Any]:
+        started = time.perf_counter()
+        # Score both corpora with their combined statistics, as if they were one index
+        terms = list(dict.fromkeys(tokenize(query)))
+        (n_a, length_a, df_a), (n_b, length_b, df_b) = (
+            self.samples.collection_stats(kind, terms), self.workflows.collection_stats(kind, terms))
+        collection = (n_a + n_b, length_a + length_b, {t: df_a[t] + df_b[t] for t in terms})
+        hits = self.samples.scored(kind, query, limit, collection) + self.workflows.scored(kind, query, limit, collection)
+        hits.sort(key=lambda hit: -hit[0])
+        SEARCH_QUERY_SECONDS.observe(time.perf_counter() - started, index="precedents")
+        return [payload for _, payload in hits[:limit]]
+
+    def find_submissions(self, query: str, limit: int = PRECEDENT_LIMIT) -> List[Dict[str, Any]]:
+        results = self._lookup("submissions", query, limit)
+        if not results:
+            # Always give the agents a few examples to pattern-match on
+            results = (self.samples.first(limit) + self.workflows.first(limit))[:limit]
+        return results
+
+    def find_mitigations(self, risk: str, limit: int = PRECEDENT_LIMIT) -> List[Dict[str, Any]]:
+        return self._lookup("mitigations", risk, limit)
+
+    def find_issues(self, text: str, limit: int = PRECEDENT_LIMIT) -> List[Dict[str, Any]]:
+        return self._lookup("issues", text, limit)
+
+    def stats(self) -> Dict[str, int]:
+        samples, workflows = self.samples.stats(), self.workflows.stats()
+        return {"submissions": samples["submissions"] + workflows["submissions"],
+                "samples": samples["submissions"], "promoted_workflows": workflows["submissions"],
+                "mitigations": samples["mitigations"] + workflows["mitigations"],
+                "issues": samples["issues"] + workflows["issues"]}
+
+
+class WorkflowSearchIndex:
+    """
+    Full-text index over stored workflows: title, description, draft, risks, controls,
+    mitigations and issues. `save_context` keeps it current; existing contexts are indexed
+    on first use. Workflows that complete with an Approved decision are promoted into the
+    precedent corpus as they are indexed, and withdrawn if that changes.
+    """
+
+    def __init__(self, output_dir: str, precedents: PrecedentCorpus):
+        self.output_dir = output_dir
+        self.precedents = precedents
+        self.index = InvertedIndex()
+        self._fingerprints: Dict[str, str] = {}
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @staticmethod
+    def _fields(data: Dict[str, Any]) -> List[Tuple[Any, float]]:
+        draft = data.get("draft_submission") or {}
+        return [
+            (draft.get("project_title"), 3.0),
+            (data.get("project_description"), 1.0),
+            (_text({k: v for k, v in draft.items() if k != "project_title"}), 1.0),
+            (_text([[r.get("risk"), r.get("category_level_2"), r.get("category_level_3")]
+                    for r in data.get("risk_mapping") or [] if isinstance(r, dict)]), 2.0),
+            (_text([[c.get("control_id"), c.get("name")] for item in data.get("controls_mapping") or []
+                    if isinstance(item, dict) for c in item.get("controls") or [] if isinstance(c, dict)]), 1.0),
+            (_text(data.get("mitigation_proposals")), 1.0),
+            (_text(data.get("issues_list")), 1.0),
+        ]
+
+    def observe(self, context_id: str, data: Dict[str, Any], only_new: bool = False):
+        decision = data.get("decision_result") if isinstance(data.get("decision_result"), dict) else {}
+        meta = {
+            "title": (data.get("draft_submission") or {}).get("project_title"),
+            "status": data.get("status"),
+            "decision": decision.get("decision"),
+            "createdAt": data.get("createdAt"),
+            "updatedAt": data.get("updatedAt"),
+        }
+        fields = self._fields(data)
+        fingerprint = hashlib.sha1(json.dumps(fields, default=str).encode("utf-8")).hexdigest()
+        approved = meta["status"] == "completed" and meta["decision"] == "Approved"
+        with self._lock:
+            if only_new and context_id in self.index:
+                return
+            if self._fingerprints.get(context_id) != fingerprint:
+                self.index.add(context_id, fields, meta)
+                self._fingerprints[context_id] = fingerprint
+                if approved:
+                    self.precedents.add(PrecedentCorpus.from_workflow(context_id, data))
+            else:
+                # Only status or timestamps moved; keep the postings
+                self.index.payloads[context_id] = meta
+                if approved and context_id not in self.precedents.submissions:
+                    self.precedents.add(PrecedentCorpus.from_workflow(context_id, data))
+            if not approved and context_id in self.precedents.submissions:
+                self.precedents.remove(context_id)
+
+    def forget(self, context_id: str):
+        with self._lock:
+            self.index.remove(context_id)
+            self._fingerprints.pop(context_id, None)
+            self.precedents.remove(context_id)
+
+    def load(self):
+        """
+        Index every saved workflow context once. Files are read outside the index lock and
+        workflows a save has already indexed are left alone.
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            count = 0
+            for context_id, data in iter_stored_contexts(self.output_dir, "Search index"):
+                self.observe(context_id, data, only_new=True)
+                count += 1
+            self._loaded = True
+            print(f"Search index loaded {count} workflows in {time.perf_counter() - started:.2f}s")
+
+    def search(self, query: str, offset: int = 0, limit: int = 20, status: Optional[str] = None,
+               decision: Optional[str] = None) -> Dict[str, Any]:
+        self.load()
+        started = time.perf_counter()
+        with self._lock:
+            payloads = self.index.payloads
+
+            def accept(key: str) -> bool:
+                meta = payloads[key]
+                return (status is None or meta["status"] == status) and \
+                    (decision is None or meta["decision"] == decision)
+            # Queries come from the workflow list's search box, so the last word matches as a prefix
+            total, hits = self.index.search(query, offset, limit,
+                                            accept if status is not None or decision is not None else None,
+                                            prefix=True)
+            results = [{"context_id": key, "score": score, "matched_terms": terms, **payloads[key]}
+                       for key, score, terms in hits]
+        elapsed = time.perf_counter() - started
+        SEARCH_QUERY_SECONDS.observe(elapsed, index="workflows")
+        return {"query": query, "total": total, "offset": offset, "limit": limit, "results": results,
+                "query_ms": round(elapsed * 1000, 3)}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"loaded": self._loaded, "workflows": len(self.index), "terms": self.index.term_count,
+                    "precedents": self.precedents.stats()}
@@ -0,0 +1,290 @@
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from schemas import LIST_STEPS, STEP_ITEM_MODELS, STEP_JSON_SCHEMAS
+from model_routing import chat_completion, register_validator
+from instrumentation import record_retry
+from budgets import BudgetExceeded, budget_degraded
+from hedging import DeadlineExceeded
+
+# Candidate cut points tried when closing a truncated document
+MAX_TRUNCATION_ATTEMPTS = 50
+
+_FENCE_RE = re.compile(r"```[a-zA-Z0-9_-]*\s*\n?(.*?)(?:```|$)", re.DOTALL)
+
+
+# --- Local JSON Repair ---
+def _strip_code_fences(text: str) -> str:
+    match = _FENCE_RE.search(text)
+    if match:
+        return match.group(1)
+    return text
+
+
+def _scan(text: str):
+    """
+    Single pass over `text` that drops trailing commas and records where a truncated
+    document could be cut and closed. Returns (cleaned_text, cut_points, open_stack, in_string).
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    cuts: List[Tuple[int, List[str]]] = []
+    in_string = False
+    escaped = False
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            # Trailing comma before a closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+            cuts.append((len(out), list(stack)))
+            continue
+        elif ch == ",":
+            cuts.append((len(out), list(stack)))
+        out.append(ch)
+    return "".join(out), cuts, stack, in_string
+
+
+def repair_json(text: str) -> Any:
+    """
+    Parse model output as JSON, fixing common defects locally: surrounding prose,
+    code fences, trailing commas and documents truncated mid-array or mid-object.
+    Raises ValueError if nothing parseable can be recovered.
+    """
+    if text is None:
+        raise ValueError("empty output")
+    if not isinstance(text, str):
+        return text
+    candidate = _strip_code_fences(text).strip()
+    starts = [i for i in (candidate.find("{"), candidate.find("[")) if i != -1]
+    if not starts:
+        raise ValueError("no JSON object or array found")
+    candidate = candidate[min(starts):]
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+    cleaned, cuts, stack, in_string = _scan(candidate)
+    # Drop anything after the top-level value closes
+    for pos, open_stack in cuts:
+        if not open_stack:
+            try:
+                return json.loads(cleaned[:pos])
+            except json.JSONDecodeError:
+                break
+    if not stack and not in_string:
+        try:
+            return json.loads(cleaned)
+        except json.JSONDecodeError:
+            pass
+    # Truncated: cut after the last complete element and close the open brackets
+    for pos, open_stack in list(reversed(cuts))[:MAX_TRUNCATION_ATTEMPTS]:
+        head = cleaned[:pos].rstrip()
+        if head.endswith(","):
+            head = head[:-1]
+        try:
+            return json.loads(head + "".join(reversed(open_stack)))
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("unrecoverable JSON")
+
+
+def _unwrap(step: str, data: Any) -> Any:
+    """
+    Remove envelopes models like to add, e.g. {"response": [...]} or {"decision_result": {...}}.
+    """
+    expects_list = step in LIST_STEPS
+    for _ in range(2):
+        if not isinstance(data, dict) or len(data) != 1:
+            break
+        (value,) = data.values()
+        if expects_list and isinstance(value, list):
+            return value
+        if not expects_list and isinstance(value, dict):
+            data = value
+            continue
+        break
+    if expects_list and isinstance(data, dict):
+        return [data]
+    return data
+
+
+# --- Schema Validation ---
+@dataclass
+class StepParseResult:
+    step: str
+    # Validated output (list for list steps, dict otherwise); None if nothing usable
+    data: Any = None
+    # (index, raw_item, error) for list items that failed validation; index -1 for object steps
+    invalid: List[Tuple[int, Any, str]] = field(default_factory=list)
+    # Set when the output could not be parsed as JSON at all
+    parse_error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.parse_error is None and not self.invalid
+
+    def errors(self) -> List[str]:
+        if self.parse_error:
+            return [self.parse_error]
+        return [f"item {idx}: {err}" if idx >= 0 else err for idx, _, err in self.invalid]
+
+
+def _error_text(exc: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in exc.errors())
+
+
+def parse_step_output(step: str, raw: Any) -> StepParseResult:
+    """
+    Repair and validate the output of a workflow step against its schema.
+    """
+    result = StepParseResult(step=step)
+    try:
+        data = _unwrap(step, repair_json(raw))
+    except ValueError as e:
+        result.parse_error = f"unparseable JSON: {e}"
+        return result
+    model = STEP_ITEM_MODELS.get(step)
+    if model is None:
+        result.data = data
+        return result
+    if step in LIST_STEPS:
+        if not isinstance(data, list):
+            result.parse_error = f"expected a JSON array, got {type(data).__name__}"
+            return result
+        valid = []
+        for idx, item in enumerate(data):
+            try:
+                valid.append(model.model_validate(item).model_dump())
+            except ValidationError as e:
+                result.invalid.append((idx, item, _error_text(e)))
+        result.data = valid
+    else:
+        try:
+            result.data = model.model_validate(data).model_dump()
+        except ValidationError as e:
+            result.invalid.append((-1, data, _error_text(e)))
+    return result
+
+
+def is_valid_step_output(step: str, raw: Any) -> bool:
+    return parse_step_output(step, raw).ok
+
+
+# --- Targeted Re-ask ---
+def _reask_messages(step: str, payload: Any, errors: List[str], item_schema: Dict[str, Any]):
+    return [
+        {"role": "system", "content": "You fix JSON so it conforms to a JSON schema. Respond with JSON only."},
+        {"role": "user", "content": (
+            f"Workflow step: {step}\n"
+            f"JSON schema: {json.dumps(item_schema)}\n"
+            f"Validation errors: {json.dumps(errors)}\n"
+            f"Invalid input: {payload if isinstance(payload, str) else json.dumps(payload)}\n"
+            "Return the corrected JSON. Keep the original content; only fix structure, field names and types."
+        )},
+    ]
+
+
+def _merge_repaired(step: str, result: StepParseResult, retried: StepParseResult) -> StepParseResult:
+    """
+    Put the re-asked list items back at the indexes of the items they replace, so the
+    output keeps its order and invalid items are reported by their original index. Items
+    beyond those sent go at the end; items the re-ask left out stay invalid.
+    """
+    count = len(result.data) + len(result.invalid)
+    bad = [idx for idx, _, _ in result.invalid]
+    origin = lambda j: bad[j] if j < len(bad) else count + j - len(bad)
+    failed = {j for j, _, _ in retried.invalid}
+    answered = len(retried.data) + len(failed)
+    kept = [idx for idx in range(count) if idx not in set(bad)]
+    placed = list(zip(kept, result.data))
+    placed += zip([origin(j) for j in range(answered) if j not in failed], retried.data)
+    invalid = [(origin(j), item, err) for j, item, err in retried.invalid] + result.invalid[answered:]
+    return StepParseResult(
+        step=step,
+        data=[item for _, item in sorted(placed, key=lambda p: p[0])],
+        invalid=sorted(invalid, key=lambda entry: entry[0]),
+    )
+
+
+async def parse_and_repair_step_output(step: str, raw: Any) -> StepParseResult:
+    """
+    Validate a step output and, if needed, re-ask the json_repair route for the invalid
+    part only: the failing list items, the failing object, or the unparseable text.
+    Repaired list items go back at their original index; items that are still invalid
+    after the re-ask are dropped and reported by that index.
+    """
+    result = parse_step_output(step, raw)
+    # A run close to its budget keeps what parsed locally instead of paying for a re-ask
+    if result.ok or budget_degraded():
+        return result
+    model = STEP_ITEM_MODELS.get(step)
+    item_schema = model.model_json_schema() if model is not None else {}
+    record_retry("reask")
+    try:
+        if result.parse_error:
+            fixed = await chat_completion(
+                "json_repair", _reask_messages(step, raw, result.errors(), STEP_JSON_SCHEMAS.get(step, {}))
+            )
+            retried = parse_step_output(step, fixed)
+            if retried.parse_error is None:
+                return retried
+            return result
+        if step in LIST_STEPS:
+            bad_items = [item for _, item, _ in result.invalid]
+            fixed = await chat_completion(
+                "json_repair", _reask_messages(step, bad_items, result.errors(), {"type": "array", "items": item_schema})
+            )
+            retried = parse_step_output(step, fixed)
+            if retried.parse_error:
+                return result
+            return _merge_repaired(step, result, retried)
+        fixed = await chat_completion(
+            "json_repair", _reask_messages(step, result.invalid[0][1], result.errors(), item_schema)
+        )
+        retried = parse_step_output(step, fixed)
+        return retried if retried.data is not None else result
+    except (BudgetExceeded, DeadlineExceeded):
+        # The run is out of budget or time; the step handler records that, not a bad parse
+        raise
+    except Exception as e:
+        print(f"JSON re-ask for {step} failed: {e}")
+        return result
+
+
+def _is_parseable(text: str) -> bool:
+    try:
+        repair_json(text)
+        return True
+    except ValueError:
+        return False
+
+
+# Cascading routes escalate when the small tier returns something the schema rejects
+def _schema_validator(step: str):
+    return lambda text, route: is_valid_step_output(step, text)
+
+
+register_validator("qa_agent", _schema_validator("flag_issues"))
+register_validator("json_repair", lambda text, route: _is_parseable(text))
@@ -0,0 +1,329 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from dataclasses import fields as dataclass_fields
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from instrumentation import timed_context_io
+from model_routing import client_ready, missing_settings
+from catalog_repo import CatalogRepository, CatalogSnapshot
+from analytics import CoverageAnalytics
+from search_index import PrecedentCorpus, PrecedentView, WorkflowSearchIndex
+from dedup import NearDuplicateIndex
+from budgets import CostLedger, RunUsage, summarize_runs
+from archive import get_archive
+
+# Workflow contexts, their persistence, the shared catalogs and the indexes over output/.
+# Nothing here needs the model client or the Agents SDK, so the API can serve CRUD and
+# search without importing them; agentic_rcsa builds the agents on top of this module.
+load_dotenv()
+
+# --- Context Management Setup ---
+# WorkflowContext field holding each step's output
+STEP_FIELDS = {
+    "generate_draft": "draft_submission",
+    "map_risks": "risk_mapping",
+    "map_controls": "controls_mapping",
+    "generate_mitigations": "mitigation_proposals",
+    "flag_issues": "issues_list",
+    "evaluate_decision": "decision_result",
+}
+
+@dataclass
+class WorkflowContext:
+    project_description: str
+    # Submission draft data
+    draft_submission: Dict[str, Any] = field(default_factory=dict)
+    # Mapping of risks to categories/subrisks
+    risk_mapping: List[Dict[str, Any]] = field(default_factory=list)
+    # Controls mapped to each risk
+    controls_mapping: List[Dict[str, Any]] = field(default_factory=list)
+    # Proposed mitigation steps
+    mitigation_proposals: List[Dict[str, Any]] = field(default_factory=list)
+    # Flagged issues and deficiencies
+    issues_list: List[Dict[str, Any]] = field(default_factory=list)
+    # Final approval decision
+    decision_result: Dict[str, Any] = field(default_factory=dict)
+    # Guardrail violations per step
+    guardrail_violations: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+    # Ordered UI updates (step, output)
+    ui_updates: List[Dict[str, Any]] = field(default_factory=list)
+    # New: Store feedback per step/label
+    feedbacks: Dict[str, Any] = field(default_factory=dict)
+    # Wall time, model latency, tokens, tool calls and retries per step
+    step_metrics: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # Schema validation errors left after local repair and re-ask, per step
+    validation_errors: Dict[str, List[str]] = field(default_factory=dict)
+    # Catalog versions this workflow ran against
+    catalog_versions: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # Near-duplicate workflow this one was seeded from, and the steps copied from it
+    reused_from: Optional[str] = None
+    reused_steps: List[str] = field(default_factory=list)
+    # Model calls, tokens, cost and wall time of every run (workflow, feedback) and their totals
+    usage: Dict[str, Any] = field(default_factory=dict)
+    # New: Track workflow status and current step
+    status: str = "in_progress"  # queued, in_progress, awaiting_feedback, completed, failed, cancelled
+    current_step: str = ""
+    # Add timestamps
+    createdAt: str = None
+    updatedAt: str = None
+    # Pinned catalog snapshots for the current run; not persisted
+    catalog_snapshot: Optional[Dict[str, Any]] = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        now = datetime.now(timezone.utc).isoformat()
+        if self.createdAt is None:
+            self.createdAt = now
+        if self.updatedAt is None:
+            self.updatedAt = now
+
+    def record_step(self, step: str, output: Any, feedback: Any = None):
+        if step == "generate_draft":
+            self.draft_submission = output
+        elif step == "map_risks":
+            self.risk_mapping = output
+        elif step == "map_controls":
+            self.controls_mapping = output
+        elif step == "generate_mitigations":
+            self.mitigation_proposals = output
+        elif step == "flag_issues":
+            self.issues_list = output
+        elif step == "evaluate_decision":
+            self.decision_result = output
+        self.ui_updates.append({"step": step, "output": output})
+        self.current_step = step
+        if feedback is not None:
+            self.feedbacks[step] = feedback
+        # If feedback is required, set status to awaiting_feedback
+        if feedback == "__AWAIT_FEEDBACK__":
+            self.status = "awaiting_feedback"
+        else:
+            self.status = "in_progress"
+        # Update updatedAt timestamp
+        self.updatedAt = datetime.now(timezone.utc).isoformat()
+
+    def step_output(self, step: str) -> Any:
+        return getattr(self, STEP_FIELDS[step])
+
+    def record_usage(self, run: RunUsage):
+        """
+        Add or update `run` in `usage` and recompute the totals.
+        """
+        runs = [r for r in self.usage.get("runs", []) if r.get("run_id") != run.run_id]
+        self.usage = summarize_runs(runs + [run.to_dict()])
+
+    def record_guardrail(self, step: str, violations: List[Dict[str, Any]]):
+        self.guardrail_violations[step] = violations
+        self.ui_updates.append({"step": f"guard_{step}", "output": violations})
+        self.updatedAt = datetime.now(timezone.utc).isoformat()
+
+    def to_dict(self):
+        return {
+            "project_description": self.project_description,
+            "draft_submission": self.draft_submission,
+            "risk_mapping": self.risk_mapping,
+            "controls_mapping": self.controls_mapping,
+            "mitigation_proposals": self.mitigation_proposals,
+            "issues_list": self.issues_list,
+            "decision_result": self.decision_result,
+            "guardrail_violations": self.guardrail_violations,
+            "ui_updates": self.ui_updates,
+            "feedbacks": self.feedbacks,
+            "validation_errors": self.validation_errors,
+            "step_metrics": self.step_metrics,
+            "catalog_versions": self.catalog_versions,
+            "reused_from": self.reused_from,
+            "reused_steps": self.reused_steps,
+            "usage": self.usage,
+            "status": self.status,
+            "current_step": self.current_step,
+            "createdAt": self.createdAt,
+            "updatedAt": self.updatedAt,
+        }
+
+# Update save_context to always update updatedAt
+def save_context(context, path):
+    context.updatedAt = datetime.now(timezone.utc).isoformat()
+    write_context_file(path, context.to_dict())
+
+def write_context_file(path: str, data: Dict[str, Any]):
+    """
+    Write a context's JSON to `path` and update the output/ indexes. save_context and
+    direct edits of the stored JSON both go through here.
+    """
+    # Write to a temp file and swap it in so concurrent readers never see a partial file
+    tmp_path = f"{path}.tmp"
+    with timed_context_io("save"):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    # Keep the analytics and search indexes current without re-reading output/
+    name = os.path.basename(path)
+    if name.startswith('workflow_context_') and name.endswith('.json'):
+        for index in (analytics, workflow_search, duplicates, costs):
+            try:
+                index.observe(name[len('workflow_context_'):-len('.json')], data)
+            except Exception as e:
+                print(f"Index update failed for {name}: {e}")
+
+def context_from_dict(data: Dict[str, Any]) -> WorkflowContext:
+    # Only keep keys that are fields in WorkflowContext
+    allowed = {f.name for f in dataclass_fields(WorkflowContext)}
+    filtered = {k: v for k, v in data.items() if k in allowed}
+    return WorkflowContext(**filtered)
+
+# Update load_context to ignore unknown fields
+def load_context(path):
+    with timed_context_io("load"):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    return context_from_dict(data)
+
+# --- Load Data from JSON Files ---
+DATA_DIR = os.getenv("RCSA_DATA_DIR") or os.path.join(os.path.dirname(__file__), 'data')
+# Workflow contexts; overridable so benchmarks can run against a scratch directory
+OUTPUT_DIR = os.getenv("RCSA_OUTPUT_DIR") or os.path.join(os.path.dirname(__file__), 'output')
+
+# Parsed, versioned catalogs shared with the API; workflows pin one snapshot per run
+catalogs = CatalogRepository()
+catalogs.register("risks", os.path.join(DATA_DIR, 'risks.json'))
+catalogs.register("controls", os.path.join(DATA_DIR, 'controls.json'))
+catalogs.register("guardrails", os.path.join(DATA_DIR, 'guardrails.json'))
+catalogs.register("samples", os.path.join(DATA_DIR, 'sample_submissions.json'))
+
+# Risk x control x workflow index over output/, updated by save_context
+analytics = CoverageAnalytics(catalogs, OUTPUT_DIR)
+
+# Precedents for the fetch_past_* tools: approved workflows, which the workflow search
+# index promotes as they are saved, plus the sample submissions of a pinned snapshot
+precedents = PrecedentCorpus()
+workflow_search = WorkflowSearchIndex(OUTPUT_DIR, precedents)
+
+def precedents_for(samples: CatalogSnapshot) -> PrecedentView:
+    """
+    The precedents a workflow pinned to `samples` searches; the samples corpus is built
+    once per snapshot.
+    """
+    return PrecedentView(samples.derived("precedents", PrecedentCorpus.from_samples), precedents)
+
+# MinHash/LSH fingerprints of each workflow's combined description, for near-duplicate detection
+duplicates = NearDuplicateIndex(OUTPUT_DIR)
+
+# Model usage per stored workflow, for the cost report
+costs = CostLedger(OUTPUT_DIR)
+
+# Completed workflows moved out of output/ into compressed segments by the API's archiver
+archive = get_archive(OUTPUT_DIR)
+
+def context_path(context_id: str) -> str:
+    return os.path.join(OUTPUT_DIR, f'workflow_context_{context_id}.json')
+
+def find_context(context_id: str) -> Optional[WorkflowContext]:
+    """
+    A workflow from output/ or, failing that, a read-only copy from the archive.
+    """
+    path = context_path(context_id)
+    if os.path.exists(path):
+        try:
+            return load_context(path)
+        except FileNotFoundError:
+            # Archived between the check and the read
+            pass
+    data = archive.read(context_id)
+    return context_from_dict(data) if data is not None else None
+
+def restore_context(context_id: str) -> Optional[str]:
+    """
+    Path of the workflow's file in output/, writing an archived workflow back there first
+    so it can be updated. None if the workflow does not exist.
+    """
+    return context_path(context_id) if archive.restore(context_id) else None
+
+# --- Workflow Engine ---
+# agentic_rcsa (the agents, the model client and the openai and Agents SDKs behind them) is
+# imported on the first workflow run, or by the API's warm-up, in a worker thread so the
+# event loop keeps serving meanwhile
+_engine = None
+_engine_loading = False
+_engine_error: Optional[str] = None
+_engine_load_seconds: Optional[float] = None
+
+def _load_engine():
+    started = time.perf_counter()
+    import agentic_rcsa
+    # Builds every agent, their shared routed models and the client
+    agentic_rcsa.get_agent("orchestrator_agent")
+    return agentic_rcsa, time.perf_counter() - started
+
+async def workflow_engine():
+    """
+    The agentic_rcsa module with its agents built.
+    """
+    global _engine, _engine_loading, _engine_error, _engine_load_seconds
+    if _engine is None:
+        _engine_loading = True
+        try:
+            _engine, _engine_load_seconds = await asyncio.to_thread(_load_engine)
+        except Exception as e:
+            _engine_error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _engine_loading = False
+        _engine_error = None
+        print(f"Workflow engine loaded in {_engine_load_seconds:.2f}s")
+    return _engine
+
+def _end_unstarted_run(context_id: Optional[str], status: str, error: str):
+    """
+    Record the end of a run that stopped before the engine could start it, so pollers do
+    not see the placeholder context "in_progress" forever.
+    """
+    path = context_path(context_id) if context_id else None
+    if path is None or not os.path.exists(path):
+        return
+    context = load_context(path)
+    if context.status in ("queued", "in_progress"):
+        context.status = status
+        if error:
+            context.validation_errors["engine"] = [error]
+        save_context(context, path)
+
+async def run_workflow(project_description: str, context_id: Optional[str] = None, **kwargs):
+    try:
+        engine = await workflow_engine()
+    except asyncio.CancelledError:
+        _end_unstarted_run(context_id, "cancelled", "")
+        raise
+    except Exception as e:
+        _end_unstarted_run(context_id, "failed", f"Workflow engine failed to load: {type(e).__name__}: {e}")
+        raise
+    return await engine.run_risk_workflow(project_description, context_id, **kwargs)
+
+async def process_feedback(*args, **kwargs):
+    return await (await workflow_engine()).process_feedback(*args, **kwargs)
+
+def engine_status() -> Dict[str, Any]:
+    missing = missing_settings()
+    if _engine is not None:
+        status = "ready"
+    elif missing:
+        status = "unconfigured"
+    elif _engine_loading:
+        status = "loading"
+    elif _engine_error:
+        status = "failed"
+    else:
+        status = "not_loaded"
+    return {
+        "status": status,
+        "agents_built": _engine is not None,
+        "client_built": client_ready(),
+        "load_seconds": round(_engine_load_seconds, 3) if _engine_load_seconds is not None else None,
+        "missing_settings": missing,
+        "error": _engine_error,
+    }
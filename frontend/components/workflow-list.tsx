@@ -38,12 +38,8 @@ export default function WorkflowList({ status, search }: WorkflowListProps = {})
     fetchWorkflows()
   }, [filterStatus, searchTerm])
 
-  const filteredWorkflows = workflows.filter((workflow) => {
-    return (
-      workflow.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
-      workflow.description?.toLowerCase().includes(searchTerm.toLowerCase())
-    )
-  })
+  // Search is done server-side, over drafts, risks, mitigations and issues
+  const filteredWorkflows = workflows
 
   if (error) {
     return (
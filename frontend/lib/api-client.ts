@@ -75,6 +75,10 @@ export async function listWorkflows() {
   return fetchAPI("/workflows")
 }
 
+export async function searchWorkflows(query: string, limit = 100) {
+  return fetchAPI(`/workflows/search?q=${encodeURIComponent(query)}&limit=${limit}`)
+}
+
 // Updated to use the new feedback agent endpoint
 export async function submitWorkflowFeedback(contextId: string, step: string, feedback: string) {
   return fetchAPI(`/workflow/${contextId}/feedback/agent`, {
@@ -1,5 +1,5 @@
 import type { WorkflowContext, Workflow } from "./types"
-import { getWorkflow, listWorkflows } from "./api-client"
+import { getWorkflow, listWorkflows, searchWorkflows } from "./api-client"
 
 export async function getWorkflows({
   limit,
@@ -11,9 +11,18 @@ export async function getWorkflows({
   search?: string
 }): Promise<Workflow[]> {
   try {
-    // Get the list of workflow IDs
-    const data = await listWorkflows()
-    const workflowIds = data.workflows || []
+    // Get the list of workflow IDs; with a search term the server ranks the matches
+    const query = search?.trim()
+    let workflowIds: string[] = query
+      ? ((await searchWorkflows(query, limit || 100)).results || []).map((r: { context_id: string }) => r.context_id)
+      : []
+    // The server matches whole words (and a prefix of the last one); when that finds nothing,
+    // e.g. for a query of only stopwords, filter every workflow by substring instead
+    const substringSearch = !!query && workflowIds.length === 0
+    const searchLower = (query || "").toLowerCase()
+    if (!query || substringSearch) {
+      workflowIds = (await listWorkflows()).workflows || []
+    }
 
     // Fetch details for each workflow
     const workflowPromises = workflowIds.map(async (id: string) => {
@@ -47,9 +56,8 @@ export async function getWorkflows({
           return null
         }
 
-        // Apply search filter
-        if (search) {
-          const searchLower = search.toLowerCase()
+        // Apply substring search filter
+        if (substringSearch) {
           if (!title.toLowerCase().includes(searchLower) && !description.toLowerCase().includes(searchLower)) {
             return null
           }
@@ -77,8 +85,10 @@ export async function getWorkflows({
     // Filter out null values and apply limit
     const filteredWorkflows = workflows.filter(Boolean) as Workflow[]
 
-    // Sort by updatedAt (newest first)
-    filteredWorkflows.sort((a, b) => new Date(b.updatedAt).getTime() - new Date(a.updatedAt).getTime())
+    // Sort by updatedAt (newest first); search results keep their relevance order
+    if (!query || substringSearch) {
+      filteredWorkflows.sort((a, b) => new Date(b.updatedAt).getTime() - new Date(a.updatedAt).getTime())
+    }
 
     // Apply limit
     if (limit && limit > 0) {